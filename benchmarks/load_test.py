@@ -0,0 +1,343 @@
+"""
+Benchmark de carga del flujo clínico completo.
+
+1. Siembra volúmenes realistas (profesionales, estudiantes y pacientes con
+   expedientes en todos los estados) con inserciones masivas.
+2. Reproduce en paralelo el flujo de tmp/smoke_test.py (registro → validación
+   → solicitud → aprobación → antecedentes → snapshot → revisión →
+   confirmación) mezclado con tráfico de lectura de los dashboards.
+3. Reporta p50/p95/p99, media, máximo, errores y throughput por endpoint y
+   guarda el resultado en JSON para comparar corridas.
+
+Por defecto usa el test client de Flask sobre una base SQLite temporal. Con
+--base-url apunta a un servidor ya levantado (p. ej. gunicorn local); en ese
+caso el servidor y este script deben compartir DATABASE_URL/SQLITE_PATH y
+JWT_SECRET_KEY, porque la siembra escribe directo en la base y los tokens de
+los usuarios sembrados se firman localmente.
+
+Uso:
+    python benchmarks/load_test.py --patients 5000 --workflows 200 --concurrency 8 \\
+        --out bench.json --compare bench_anterior.json
+"""
+
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+PASSWORD = "BenchPass123!"
+PNG_DATA_URL = ("data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAQAAAC1HAwCAAAAC0lEQVR4nGNg"
+                "YAAAAAMAASsJTYQAAAAASUVORK5CYII=")
+
+
+# -------------------- CLIENTES --------------------
+class FlaskClient:
+    """Ejecuta requests con el test client de Flask (un cliente por hilo)."""
+
+    def __init__(self, app):
+        self._app = app
+        self._local = threading.local()
+
+    def request(self, method, path, token=None, body=None):
+        client = getattr(self._local, "client", None)
+        if client is None:
+            client = self._local.client = self._app.test_client()
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        rv = client.open("/api" + path, method=method, json=body, headers=headers)
+        return rv.status_code, rv.get_json(silent=True)
+
+
+class HttpClient:
+    """Ejecuta requests HTTP reales contra --base-url."""
+
+    def __init__(self, base_url):
+        self._base = base_url.rstrip("/")
+
+    def request(self, method, path, token=None, body=None):
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        data = json.dumps(body).encode() if body is not None else None
+        req = urllib.request.Request(self._base + path, data=data, headers=headers, method=method)
+        try:
+            with urllib.request.urlopen(req, timeout=60) as r:
+                raw = r.read()
+                return r.getcode(), json.loads(raw) if raw else None
+        except urllib.error.HTTPError as e:
+            raw = e.read()
+            try:
+                return e.code, json.loads(raw) if raw else None
+            except ValueError:
+                return e.code, None
+
+
+# -------------------- REGISTRO DE LATENCIAS --------------------
+class Recorder:
+    def __init__(self, client):
+        self._client = client
+        self._lock = threading.Lock()
+        self.samples = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def call(self, name, method, path, token=None, body=None, expect=(200, 201)):
+        start = time.perf_counter()
+        code, payload = self._client.request(method, path, token=token, body=body)
+        elapsed = time.perf_counter() - start
+        with self._lock:
+            self.samples[name].append(elapsed)
+            if code not in expect:
+                self.errors[name] += 1
+        return code, payload
+
+
+def percentile(sorted_values, pct):
+    """Percentil por rango más cercano sobre una lista ya ordenada."""
+    if not sorted_values:
+        return None
+    k = max(0, min(len(sorted_values) - 1, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[k]
+
+
+# -------------------- SIEMBRA --------------------
+def seed(app, professionals, students, patients, seed_value):
+    """Inserta el dataset base (api.seed) y devuelve ids para el tráfico de lectura."""
+    from api.seed import seed_dataset
+
+    with app.app_context():
+        # Prefijo aleatorio: permite repetir la siembra sobre una base ya existente
+        seeded = seed_dataset(professionals=professionals, students=students, patients=patients,
+                              seed=seed_value, prefix=f"b{uuid.uuid4().hex[:4]}", password=PASSWORD)
+    seeded["admin"] = seeded["admins"][0]
+    return seeded
+
+
+def tokens_for(app, ids):
+    from flask_jwt_extended import create_access_token
+    with app.app_context():
+        return {uid: create_access_token(identity=str(uid), expires_delta=timedelta(hours=6)) for uid in ids}
+
+
+# -------------------- ESCENARIOS --------------------
+def register_and_login(rec, payload):
+    rec.call("POST /register", "POST", "/register", body=payload)
+    code, body = rec.call("POST /login", "POST", "/login",
+                          body={"email": payload["email"], "password": PASSWORD})
+    if code != 200:
+        raise RuntimeError(f"login falló para {payload['email']}: {code}")
+    return body["token"], body["user"]["id"]
+
+
+def clinical_workflow(rec, admin_token, n):
+    """Un recorrido completo de tmp/smoke_test.py sin sleeps."""
+    tag = f"{uuid.uuid4().hex[:6]}{n}"
+    base = {"first_surname": "Flow", "password": PASSWORD}
+    academic = {"institution": "Bench U", "career": "Medicina"}
+
+    prof_token, prof_id = register_and_login(rec, {
+        **base, **academic, "first_name": "Prof", "birth_day": "1975-01-01", "role": "professional",
+        "email": f"wp{tag}@b.t", "register_number": f"WP-{tag}", "academic_grade": "licenciatura"})
+    rec.call("POST /validate_professional/<id>", "POST", f"/validate_professional/{prof_id}", admin_token)
+
+    stud_token, stud_id = register_and_login(rec, {
+        **base, **academic, "first_name": "Stud", "birth_day": "1998-01-01", "role": "student",
+        "email": f"ws{tag}@b.t", "register_number": f"WS-{tag}"})
+    rec.call("POST /request_student_validation/<id>", "POST", f"/request_student_validation/{prof_id}", stud_token)
+    rec.call("GET /professional/student_requests", "GET", "/professional/student_requests", prof_token)
+    rec.call("PUT /professional/validate_student/<id>", "PUT", f"/professional/validate_student/{stud_id}",
+             prof_token, {"action": "approve"})
+
+    pat_token, pat_id = register_and_login(rec, {
+        **base, "first_name": "Pat", "birth_day": "1990-01-01", "role": "patient", "email": f"wa{tag}@b.t"})
+    rec.call("POST /patient/request_student_validation/<id>", "POST",
+             f"/patient/request_student_validation/{stud_id}", pat_token)
+    rec.call("GET /student/patient_requests", "GET", "/student/patient_requests", stud_token)
+    rec.call("PUT /student/validate_patient/<id>", "PUT", f"/student/validate_patient/{pat_id}",
+             stud_token, {"action": "approve"})
+
+    _, body = rec.call("GET /private", "GET", "/private", pat_token)
+    file_id = body["user"]["medical_file_id"]
+    rec.call("GET /student/assigned_patients", "GET", "/student/assigned_patients", stud_token)
+    rec.call("POST /backgrounds/save", "POST", "/backgrounds/save", stud_token, {
+        "medical_file_id": file_id,
+        "non_pathological_background": {"nationality": "MX", "blood_type": "O+", "hobbies": "correr"},
+        "pathological_background": {"allergies": "penicilina"},
+    })
+    rec.call("POST /backgrounds", "POST", "/backgrounds", stud_token, {
+        "medical_file_id": file_id,
+        "personal_data": {"sex": "female", "address": "Calle 1"},
+        "pathological_background": {"allergies": "penicilina"},
+        "family_background": {"diabetes": True},
+        "gynecological_background": {"pregnancies": "1"},
+    })
+    rec.call("POST /upload_snapshot/<id>", "POST", f"/upload_snapshot/{file_id}", stud_token,
+             {"snapshot_url": PNG_DATA_URL})
+    rec.call("GET /professional/review_files", "GET", "/professional/review_files", prof_token)
+    rec.call("GET /professional/snapshots/<id>", "GET", f"/professional/snapshots/{file_id}", prof_token)
+    rec.call("PUT /professional/review_file/<id>", "PUT", f"/professional/review_file/{file_id}",
+             prof_token, {"action": "approve"})
+    rec.call("GET /medical_file/<id>", "GET", f"/medical_file/{file_id}", pat_token)
+    rec.call("GET /patient/snapshots/<id>", "GET", f"/patient/snapshots/{file_id}", pat_token)
+    rec.call("PUT /patient/confirm_file/<id>", "PUT", f"/patient/confirm_file/{file_id}",
+             pat_token, {"action": "confirm"})
+
+
+def dashboard_reads(rec, seeded, tokens, rng):
+    """Tráfico de lectura de los dashboards sobre el dataset sembrado."""
+    prof = rng.choice(seeded["professionals"])
+    stud = rng.choice(seeded["students"])
+    pat, file_id = rng.choice(seeded["patients"])
+    rec.call("GET /private", "GET", "/private", tokens[stud])
+    rec.call("GET /student/assigned_patients", "GET", "/student/assigned_patients", tokens[stud])
+    rec.call("GET /student/professional_request_status", "GET", "/student/professional_request_status", tokens[stud])
+    rec.call("GET /professional/review_files", "GET", "/professional/review_files", tokens[prof])
+    rec.call("GET /private", "GET", "/private", tokens[pat])
+    rec.call("GET /medical_file/<id>", "GET", f"/medical_file/{file_id}", tokens[pat])
+    rec.call("GET /patient/snapshots/<id>", "GET", f"/patient/snapshots/{file_id}", tokens[pat])
+
+
+# -------------------- REPORTE --------------------
+def summarize(rec, elapsed):
+    endpoints = {}
+    for name in sorted(rec.samples):
+        values = sorted(rec.samples[name])
+        endpoints[name] = {
+            "count": len(values),
+            "errors": rec.errors.get(name, 0),
+            "p50_ms": round(percentile(values, 50) * 1000, 2),
+            "p95_ms": round(percentile(values, 95) * 1000, 2),
+            "p99_ms": round(percentile(values, 99) * 1000, 2),
+            "mean_ms": round(sum(values) / len(values) * 1000, 2),
+            "max_ms": round(values[-1] * 1000, 2),
+            "throughput_rps": round(len(values) / elapsed, 2) if elapsed else None,
+        }
+    total = sum(e["count"] for e in endpoints.values())
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "requests": total,
+        "errors": sum(e["errors"] for e in endpoints.values()),
+        "throughput_rps": round(total / elapsed, 2) if elapsed else None,
+        "endpoints": endpoints,
+    }
+
+
+def print_report(summary, previous=None):
+    prev = (previous or {}).get("summary", {}).get("endpoints", {})
+    print(f"\n{'endpoint':<48}{'n':>6}{'err':>5}{'p50':>9}{'p95':>9}{'p99':>9}{'rps':>8}"
+          + ("   Δp95" if prev else ""))
+    for name, e in summary["endpoints"].items():
+        line = (f"{name:<48}{e['count']:>6}{e['errors']:>5}{e['p50_ms']:>9}"
+                f"{e['p95_ms']:>9}{e['p99_ms']:>9}{e['throughput_rps']:>8}")
+        if name in prev and prev[name]["p95_ms"]:
+            delta = (e["p95_ms"] - prev[name]["p95_ms"]) / prev[name]["p95_ms"] * 100
+            line += f"  {delta:+6.1f}%"
+        print(line)
+    print(f"\n{summary['requests']} requests en {summary['elapsed_s']} s "
+          f"({summary['throughput_rps']} req/s), errores: {summary['errors']}")
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de carga del flujo clínico")
+    parser.add_argument("--professionals", type=int, default=50)
+    parser.add_argument("--students", type=int, default=1000)
+    parser.add_argument("--patients", type=int, default=5000)
+    parser.add_argument("--workflows", type=int, default=100, help="recorridos completos a reproducir")
+    parser.add_argument("--reads", type=int, default=500, help="rondas de lectura de dashboards")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--base-url", help="servidor ya levantado, p. ej. http://localhost:3001/api")
+    parser.add_argument("--out", help="guardar resultados JSON en este archivo")
+    parser.add_argument("--compare", help="JSON de una corrida anterior para comparar p95")
+    args = parser.parse_args()
+
+    tmpdir = None
+    if not os.getenv("DATABASE_URL") and not os.getenv("SQLITE_PATH"):
+        tmpdir = tempfile.TemporaryDirectory()
+        os.environ["SQLITE_PATH"] = os.path.join(tmpdir.name, "bench.db")
+    os.environ.setdefault("JWT_SECRET_KEY", "bench-jwt-secret-0123456789abcdef0123456789")
+    os.environ.setdefault("FLASK_SECRET_KEY", "bench-flask-secret")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")  # sin el log por request en la salida
+
+    from app import app  # noqa: E402  (la configuración depende de las variables de arriba)
+
+    rng = random.Random(args.seed)
+    print(f"Sembrando {args.professionals} profesionales, {args.students} estudiantes, "
+          f"{args.patients} pacientes...")
+    start = time.perf_counter()
+    seeded = seed(app, args.professionals, args.students, args.patients, args.seed)
+    print(f"  listo en {time.perf_counter() - start:.1f} s")
+    tokens = tokens_for(app, [seeded["admin"]] + seeded["professionals"] + seeded["students"]
+                        + [pid for pid, _ in seeded["patients"]])
+
+    client = HttpClient(args.base_url) if args.base_url else FlaskClient(app)
+    rec = Recorder(client)
+    admin_token = tokens[seeded["admin"]]
+
+    tasks = [("workflow", n) for n in range(args.workflows)] + [("reads", n) for n in range(args.reads)]
+    rng.shuffle(tasks)
+
+    def run_task(task):
+        kind, n = task
+        local_rng = random.Random(args.seed * 100003 + n)
+        if kind == "workflow":
+            clinical_workflow(rec, admin_token, n)
+        else:
+            dashboard_reads(rec, seeded, tokens, local_rng)
+
+    print(f"Reproduciendo {args.workflows} flujos y {args.reads} rondas de lectura "
+          f"con concurrencia {args.concurrency}...")
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        failures = [f for f in [pool.submit(run_task, t) for t in tasks] if f.exception()]
+    elapsed = time.perf_counter() - start
+    for f in failures[:5]:
+        print(f"  flujo fallido: {f.exception()}")
+
+    summary = summarize(rec, elapsed)
+    previous = None
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as fh:
+            previous = json.load(fh)
+    print_report(summary, previous)
+
+    if args.out:
+        result = {
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "git_revision": git_revision(),
+            "target": args.base_url or "flask-test-client",
+            "database": "sqlite" if not os.getenv("DATABASE_URL") else "DATABASE_URL",
+            "params": vars(args),
+            "failed_tasks": len(failures),
+            "summary": summary,
+        }
+        with open(args.out, "w", encoding="utf-8") as fh:
+            json.dump(result, fh, indent=2)
+        print(f"Resultados guardados en {args.out}")
+
+    if tmpdir is not None:
+        tmpdir.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Benchmark de escrituras concurrentes sobre SQLite (antes/después del perfil).
+
+Simula N workers de gunicorn (procesos) ejecutando la transacción de
+upload_snapshot: leer el expediente, insertar un snapshot y actualizar
+file_status. Se ejecuta dos veces sobre bases nuevas:
+
+- default: engine sin configurar (journal DELETE, BEGIN diferido).
+- profile: engine con api.database.configure_sqlite_engine (WAL, pragmas,
+  BEGIN IMMEDIATE para escrituras).
+
+Uso:
+    python benchmarks/sqlite_write_concurrency.py --workers 1 4 8 --ops 200
+    python benchmarks/sqlite_write_concurrency.py --json resultados.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+from sqlalchemy import create_engine, insert, select, update  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from api.database import configure_sqlite_engine  # noqa: E402
+from api.models import db, User, MedicalFile, MedicalFileSnapshot, FileStatus, UserRole  # noqa: E402
+
+FILES = 50
+
+
+def make_engine(url, mode):
+    engine = create_engine(url)
+    if mode == "profile":
+        configure_sqlite_engine(engine)
+    return engine
+
+
+def prepare(url, mode):
+    engine = make_engine(url, mode)
+    db.metadata.create_all(engine)
+    with engine.begin() as conn:
+        user_id = conn.execute(insert(User.__table__).values(
+            first_name="Bench", first_surname="Writer", birth_day=date(1990, 1, 1),
+            email="bench@example.test", password="x", role=UserRole.student.name,
+            status="approved")).inserted_primary_key[0]
+        conn.execute(insert(MedicalFile.__table__), [
+            {"user_id": user_id, "file_status": FileStatus.progress.name} for _ in range(FILES)])
+    engine.dispose()
+    return user_id
+
+
+def worker(url, mode, user_id, ops, offset, queue):
+    engine = make_engine(url, mode)
+    ok = locked = 0
+    latencies = []
+    for i in range(ops):
+        file_id = (offset + i) % FILES + 1
+        start = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                conn.execute(select(MedicalFile.__table__.c.file_status).where(
+                    MedicalFile.__table__.c.id == file_id)).scalar()
+                conn.execute(insert(MedicalFileSnapshot.__table__).values(
+                    medical_file_id=file_id, url=f"/api/uploads/{offset}-{i}.png",
+                    uploaded_by_id=user_id, created_at=datetime.now(timezone.utc)))
+                conn.execute(update(MedicalFile.__table__).where(
+                    MedicalFile.__table__.c.id == file_id).values(
+                    file_status=FileStatus.review.name, reviewed_at=datetime.now(timezone.utc)))
+            ok += 1
+            latencies.append(time.perf_counter() - start)
+        except OperationalError as e:
+            if "locked" not in str(e):
+                raise
+            locked += 1
+    engine.dispose()
+    queue.put((ok, locked, latencies))
+
+
+def run(mode, workers, ops, tmpdir):
+    path = os.path.join(tmpdir, f"{mode}-{workers}.db")
+    url = f"sqlite:///{path}"
+    user_id = prepare(url, mode)
+
+    queue = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=worker, args=(url, mode, user_id, ops, n * ops, queue))
+             for n in range(workers)]
+    start = time.perf_counter()
+    for p in procs:
+        p.start()
+    results = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    elapsed = time.perf_counter() - start
+
+    ok = sum(r[0] for r in results)
+    locked = sum(r[1] for r in results)
+    latencies = sorted(lat for r in results for lat in r[2])
+    p95 = latencies[int(len(latencies) * 0.95) - 1] if latencies else None
+    return {
+        "mode": mode,
+        "workers": workers,
+        "attempted": workers * ops,
+        "committed": ok,
+        "locked_errors": locked,
+        "elapsed_s": round(elapsed, 3),
+        "commits_per_s": round(ok / elapsed, 1) if elapsed else None,
+        "p95_ms": round(p95 * 1000, 2) if p95 is not None else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--ops", type=int, default=200, help="transacciones por worker")
+    parser.add_argument("--json", help="guardar resultados en este archivo")
+    args = parser.parse_args()
+
+    rows = []
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for workers in args.workers:
+            for mode in ("default", "profile"):
+                rows.append(run(mode, workers, args.ops, tmpdir))
+                r = rows[-1]
+                print(f"{r['mode']:>8} workers={r['workers']:<3} committed={r['committed']:<6} "
+                      f"locked={r['locked_errors']:<5} {r['commits_per_s']:>8} commits/s  "
+                      f"p95={r['p95_ms']} ms")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(rows, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
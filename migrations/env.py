@@ -51,6 +51,18 @@ def get_metadata():
     return target_db.metadata
 
 
+# Índices FTS5 de SQLite (api/search.py): se crean fuera de los modelos, junto
+# con sus tablas sombra (<nombre>_data, _idx, _content, _docsize, _config);
+# autogenerate no debe proponer borrarlos.
+FTS_TABLE_PREFIXES = ("users_fts", "clinical_search_fts")
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    if type_ == "table" and name.startswith(FTS_TABLE_PREFIXES):
+        return False
+    return True
+
+
 def run_migrations_offline():
     """Run migrations in 'offline' mode.
 
@@ -65,7 +77,8 @@ def run_migrations_offline():
     """
     url = config.get_main_option("sqlalchemy.url")
     context.configure(
-        url=url, target_metadata=get_metadata(), literal_binds=True
+        url=url, target_metadata=get_metadata(), literal_binds=True,
+        include_object=include_object
     )
 
     with context.begin_transaction():
@@ -93,6 +106,7 @@ def run_migrations_online():
     conf_args = current_app.extensions['migrate'].configure_args
     if conf_args.get("process_revision_directives") is None:
         conf_args["process_revision_directives"] = process_revision_directives
+    conf_args.setdefault("include_object", include_object)
 
     connectable = get_engine()
 
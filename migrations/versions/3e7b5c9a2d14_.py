@@ -0,0 +1,105 @@
+"""clinical_search: texto libre de los antecedentes con índice de texto completo
+
+Revision ID: 3e7b5c9a2d14
+Revises: 9d3a6f1c4e82
+Create Date: 2026-10-19 22:31:47.915036
+
+"""
+from datetime import datetime, timezone
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '3e7b5c9a2d14'
+down_revision = '9d3a6f1c4e82'
+branch_labels = None
+depends_on = None
+
+SQLITE_TRIGGERS = ('clinical_search_fts_insert', 'clinical_search_fts_update', 'clinical_search_fts_delete')
+
+# Columnas de texto libre de cada antecedente en esta revisión (api/search.CLINICAL_FIELDS)
+CLINICAL_FIELDS = {
+    'non_pathological_background': (
+        'spiritual_practices', 'other_origin_info', 'other_living_info', 'other_education_info',
+        'other_occupation_info', 'other_insurance_info', 'supplements', 'other_diet_info',
+        'other_hygiene_info', 'exercise_details', 'sleep_details', 'hobbies', 'recent_travel',
+        'alcohol_use', 'tobacco_use', 'other_drug_use', 'addictions', 'other_recreational_info'),
+    'pathological_background': (
+        'disability_description', 'chronic_diseases', 'current_medications', 'hospitalizations',
+        'surgeries', 'accidents', 'transfusions', 'allergies', 'other_pathological_info'),
+    'family_background': ('other_family_background_info',),
+    'gynecological_background': ('other_gynecological_info',),
+}
+
+
+def backfill(bind):
+    """Llena clinical_search con el texto de los expedientes existentes (tablas o documento).
+
+    Mismo texto que api/search.clinical_texts; en SQLite los triggers llenan el FTS5.
+    """
+    files = sa.table('medical_file', sa.column('id', sa.Integer()), sa.column(
+        'backgrounds_doc', sa.JSON().with_variant(postgresql.JSONB(), 'postgresql')))
+    columns, source = [files.c.id, files.c.backgrounds_doc], files
+    for name, fields in CLINICAL_FIELDS.items():
+        section = sa.table(name, sa.column('medical_file_id', sa.Integer()), *(sa.column(f, sa.Text()) for f in fields))
+        source = source.outerjoin(section, section.c.medical_file_id == files.c.id)
+        columns += [section.c[field].label(f"{name}__{field}") for field in fields]
+
+    now = datetime.now(timezone.utc)
+    rows = []
+    for row in bind.execute(sa.select(*columns).select_from(source)).mappings():
+        doc = row['backgrounds_doc']
+        values = [((doc.get(name) or {}).get(field) if doc is not None else row[f"{name}__{field}"])
+                  for name, fields in CLINICAL_FIELDS.items() for field in fields]
+        body = "\n".join(value.strip() for value in values if isinstance(value, str) and value.strip())
+        if body:
+            rows.append({'medical_file_id': row['id'], 'body': body, 'updated_at': now})
+    if rows:
+        entries = sa.table('clinical_search', sa.column('medical_file_id', sa.Integer()),
+                           sa.column('body', sa.Text()), sa.column('updated_at', sa.DateTime()))
+        op.bulk_insert(entries, rows)
+
+
+def upgrade():
+    op.create_table('clinical_search',
+    sa.Column('medical_file_id', sa.Integer(), nullable=False),
+    sa.Column('body', sa.Text(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['medical_file_id'], ['medical_file.id'], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('medical_file_id')
+    )
+    bind = op.get_bind()
+    dialect = bind.dialect.name
+    if dialect == 'postgresql':
+        # Misma expresión que api/search.CLINICAL_TSV
+        op.execute("CREATE INDEX ix_clinical_search_tsv ON clinical_search "
+                   "USING gin (to_tsvector('spanish', clinical_search.body))")
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS clinical_search_fts USING fts5(body, "
+                   "content = 'clinical_search', content_rowid = 'medical_file_id', "
+                   "tokenize = 'unicode61 remove_diacritics 2', prefix = '3')")
+        op.execute("CREATE TRIGGER IF NOT EXISTS clinical_search_fts_insert AFTER INSERT ON clinical_search BEGIN "
+                   "INSERT INTO clinical_search_fts(rowid, body) VALUES (new.medical_file_id, new.body); END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS clinical_search_fts_update AFTER UPDATE ON clinical_search BEGIN "
+                   "INSERT INTO clinical_search_fts(clinical_search_fts, rowid, body) "
+                   "VALUES ('delete', old.medical_file_id, old.body); "
+                   "INSERT INTO clinical_search_fts(rowid, body) VALUES (new.medical_file_id, new.body); END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS clinical_search_fts_delete AFTER DELETE ON clinical_search BEGIN "
+                   "INSERT INTO clinical_search_fts(clinical_search_fts, rowid, body) "
+                   "VALUES ('delete', old.medical_file_id, old.body); END")
+    # Después de los triggers: en SQLite cada fila entra también al FTS5
+    backfill(bind)
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_clinical_search_tsv")
+    elif dialect == 'sqlite':
+        for trigger in SQLITE_TRIGGERS:
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS clinical_search_fts")
+    op.drop_table('clinical_search')
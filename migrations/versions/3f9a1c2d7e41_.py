@@ -0,0 +1,34 @@
+"""indices para listados del admin (role, status, file_status)
+
+Revision ID: 3f9a1c2d7e41
+Revises: 78a685e3dfdf
+Create Date: 2026-10-19 10:12:40.118220
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3f9a1c2d7e41'
+down_revision = '78a685e3dfdf'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_users_role'), ['role'], unique=False)
+        batch_op.create_index(batch_op.f('ix_users_status'), ['status'], unique=False)
+
+    with op.batch_alter_table('medical_file', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_medical_file_file_status'), ['file_status'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('medical_file', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_medical_file_file_status'))
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_status'))
+        batch_op.drop_index(batch_op.f('ix_users_role'))
@@ -0,0 +1,45 @@
+"""medical_file.backgrounds_doc (antecedentes en documento) + columnas indexadas
+
+Revision ID: 5b2f8d3e6c17
+Revises: e91d4b7c2a58
+Create Date: 2026-10-19 20:14:55.302718
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision = '5b2f8d3e6c17'
+down_revision = 'e91d4b7c2a58'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('medical_file', schema=None) as batch_op:
+        batch_op.add_column(sa.Column(
+            'backgrounds_doc',
+            sa.JSON(none_as_null=True).with_variant(postgresql.JSONB(none_as_null=True), 'postgresql'),
+            nullable=True))
+        batch_op.add_column(sa.Column('blood_type', sa.String(length=5), nullable=True))
+        batch_op.add_column(sa.Column('family_diabetes', sa.Boolean(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_medical_file_blood_type'), ['blood_type'], unique=False)
+        batch_op.create_index(batch_op.f('ix_medical_file_family_diabetes'), ['family_diabetes'], unique=False)
+
+
+def downgrade():
+    # Los expedientes en documento perderían sus antecedentes: primero `flask backgrounds-storage tables`
+    pending = op.get_bind().execute(sa.text(
+        "SELECT count(*) FROM medical_file WHERE backgrounds_doc IS NOT NULL")).scalar()
+    if pending:
+        raise RuntimeError(f"{pending} expedientes tienen antecedentes en documento; "
+                           "ejecuta `flask backgrounds-storage tables` antes de bajar esta migración")
+
+    with op.batch_alter_table('medical_file', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_medical_file_family_diabetes'))
+        batch_op.drop_index(batch_op.f('ix_medical_file_blood_type'))
+        batch_op.drop_column('family_diabetes')
+        batch_op.drop_column('blood_type')
+        batch_op.drop_column('backgrounds_doc')
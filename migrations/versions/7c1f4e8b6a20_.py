@@ -0,0 +1,29 @@
+"""stats_counter: contadores materializados de /api/stats
+
+Revision ID: 7c1f4e8b6a20
+Revises: 3e7b5c9a2d14
+Create Date: 2026-10-19 23:48:06.273519
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1f4e8b6a20'
+down_revision = '3e7b5c9a2d14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Se llena con `flask stats-rebuild` al activar STATS_MATERIALIZED=1
+    op.create_table('stats_counter',
+    sa.Column('name', sa.String(length=80), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('stats_counter')
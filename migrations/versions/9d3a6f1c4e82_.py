@@ -0,0 +1,74 @@
+"""Índices de búsqueda de usuarios (tsvector/pg_trgm en PostgreSQL, FTS5 en SQLite)
+
+Revision ID: 9d3a6f1c4e82
+Revises: 5b2f8d3e6c17
+Create Date: 2026-10-19 21:05:12.604391
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '9d3a6f1c4e82'
+down_revision = '5b2f8d3e6c17'
+branch_labels = None
+depends_on = None
+
+# Misma expresión que api/search.USERS_TSV (si no coincide el planner no usa el índice)
+USERS_TSV = (
+    "to_tsvector('simple', coalesce(users.first_name, '') || ' ' || coalesce(users.second_name, '')"
+    " || ' ' || coalesce(users.first_surname, '') || ' ' || coalesce(users.second_surname, '')"
+    " || ' ' || coalesce(users.email, ''))"
+)
+
+SQLITE_NAME = ("trim(coalesce(new.first_name, '') || ' ' || coalesce(new.second_name, '') || ' ' || "
+               "coalesce(new.first_surname, '') || ' ' || coalesce(new.second_surname, ''))")
+
+SQLITE_TRIGGERS = ('users_fts_insert', 'users_fts_update', 'users_fts_delete',
+                   'users_fts_register_insert', 'users_fts_register_update', 'users_fts_register_delete')
+
+
+def upgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        op.execute(f"CREATE INDEX ix_users_search_tsv ON users USING gin ({USERS_TSV})")
+        op.execute("CREATE INDEX ix_users_email_trgm ON users USING gin (lower(email) gin_trgm_ops)")
+        op.execute("CREATE INDEX ix_professional_student_data_register_number_trgm "
+                   "ON professional_student_data USING gin (lower(register_number) gin_trgm_ops)")
+    elif dialect == 'sqlite':
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+                   "name, email, register_number, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')")
+        op.execute("CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN "
+                   f"INSERT INTO users_fts(rowid, name, email) VALUES (new.id, {SQLITE_NAME}, new.email); END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF "
+                   "first_name, second_name, first_surname, second_surname, email ON users BEGIN "
+                   f"UPDATE users_fts SET name = {SQLITE_NAME}, email = new.email WHERE rowid = new.id; END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN "
+                   "DELETE FROM users_fts WHERE rowid = old.id; END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS users_fts_register_insert AFTER INSERT ON professional_student_data "
+                   "BEGIN UPDATE users_fts SET register_number = new.register_number WHERE rowid = new.user_id; END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS users_fts_register_update AFTER UPDATE OF register_number, user_id "
+                   "ON professional_student_data BEGIN "
+                   "UPDATE users_fts SET register_number = NULL WHERE rowid = old.user_id; "
+                   "UPDATE users_fts SET register_number = new.register_number WHERE rowid = new.user_id; END")
+        op.execute("CREATE TRIGGER IF NOT EXISTS users_fts_register_delete AFTER DELETE ON professional_student_data "
+                   "BEGIN UPDATE users_fts SET register_number = NULL WHERE rowid = old.user_id; END")
+        op.execute("DELETE FROM users_fts")
+        op.execute("INSERT INTO users_fts(rowid, name, email, register_number) "
+                   "SELECT users.id, trim(coalesce(users.first_name, '') || ' ' || coalesce(users.second_name, '') "
+                   "|| ' ' || coalesce(users.first_surname, '') || ' ' || coalesce(users.second_surname, '')), "
+                   "users.email, professional_student_data.register_number FROM users "
+                   "LEFT JOIN professional_student_data ON professional_student_data.user_id = users.id")
+
+
+def downgrade():
+    dialect = op.get_bind().dialect.name
+    if dialect == 'postgresql':
+        op.execute("DROP INDEX IF EXISTS ix_professional_student_data_register_number_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_users_email_trgm")
+        op.execute("DROP INDEX IF EXISTS ix_users_search_tsv")
+    elif dialect == 'sqlite':
+        for trigger in SQLITE_TRIGGERS:
+            op.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        op.execute("DROP TABLE IF EXISTS users_fts")
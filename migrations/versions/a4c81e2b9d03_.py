@@ -0,0 +1,31 @@
+"""medical_file.updated_at (marcador de cambios para ETags)
+
+Revision ID: a4c81e2b9d03
+Revises: 3f9a1c2d7e41
+Create Date: 2026-10-19 16:05:12.481930
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4c81e2b9d03'
+down_revision = '3f9a1c2d7e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('medical_file', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+    op.execute(sa.text("UPDATE medical_file SET updated_at = CURRENT_TIMESTAMP"))
+
+    with op.batch_alter_table('medical_file', schema=None) as batch_op:
+        batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+
+
+def downgrade():
+    with op.batch_alter_table('medical_file', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
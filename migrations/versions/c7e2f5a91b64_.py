@@ -0,0 +1,46 @@
+"""version + updated_at en medical_file y antecedentes
+
+Revision ID: c7e2f5a91b64
+Revises: a4c81e2b9d03
+Create Date: 2026-10-19 17:10:03.512274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e2f5a91b64'
+down_revision = 'a4c81e2b9d03'
+branch_labels = None
+depends_on = None
+
+BACKGROUNDS = ('non_pathological_background', 'pathological_background',
+               'family_background', 'gynecological_background')
+
+
+def upgrade():
+    with op.batch_alter_table('medical_file', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=True))
+    op.execute(sa.text("UPDATE medical_file SET version = 1"))
+    with op.batch_alter_table('medical_file', schema=None) as batch_op:
+        batch_op.alter_column('version', existing_type=sa.Integer(), nullable=False)
+
+    for table in BACKGROUNDS:
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+            batch_op.add_column(sa.Column('version', sa.Integer(), nullable=True))
+        op.execute(sa.text(f"UPDATE {table} SET version = 1, updated_at = CURRENT_TIMESTAMP"))
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.alter_column('updated_at', existing_type=sa.DateTime(), nullable=False)
+            batch_op.alter_column('version', existing_type=sa.Integer(), nullable=False)
+
+
+def downgrade():
+    for table in reversed(BACKGROUNDS):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_column('version')
+            batch_op.drop_column('updated_at')
+
+    with op.batch_alter_table('medical_file', schema=None) as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,38 @@
+"""UNIQUE(medical_file_id) en los antecedentes (elimina duplicados)
+
+Revision ID: e91d4b7c2a58
+Revises: c7e2f5a91b64
+Create Date: 2026-10-19 19:02:41.118530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e91d4b7c2a58'
+down_revision = 'c7e2f5a91b64'
+branch_labels = None
+depends_on = None
+
+BACKGROUNDS = ('non_pathological_background', 'pathological_background',
+               'family_background', 'gynecological_background')
+
+
+def upgrade():
+    for table in BACKGROUNDS:
+        # Conserva la fila más reciente de cada expediente (updated_at, y a igualdad el id mayor)
+        op.execute(sa.text(
+            f"DELETE FROM {table} WHERE EXISTS ("
+            f" SELECT 1 FROM {table} newer"
+            f" WHERE newer.medical_file_id = {table}.medical_file_id"
+            f" AND (newer.updated_at > {table}.updated_at"
+            f" OR (newer.updated_at = {table}.updated_at AND newer.id > {table}.id)))"))
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.create_unique_constraint(f'uq_{table}_medical_file_id', ['medical_file_id'])
+
+
+def downgrade():
+    for table in reversed(BACKGROUNDS):
+        with op.batch_alter_table(table, schema=None) as batch_op:
+            batch_op.drop_constraint(f'uq_{table}_medical_file_id', type_='unique')
@@ -28,6 +28,13 @@ class UserView(ModelView):
         "first_name", "second_name", "first_surname", "second_surname", 
         "birth_day", "phone", "email", "password"
     ]
+    # Paginación en servidor; ordenar/filtrar sólo por columnas indexadas
+    page_size = 50
+    can_set_page_size = True
+    column_default_sort = ("id", True)
+    column_sortable_list = ["id", "role", "status", "email"]
+    column_searchable_list = ["email"]
+    column_filters = ["role", "status"]
     form_extra_fields = {
         'password': PasswordField('Password', [DataRequired()])
     }
@@ -50,6 +57,19 @@ class MedicalFileView(ModelView):
         "confirmed_at", "no_confirmed_by_id", "no_confirmed_at", "non_pathological_background",
         "pathological_background", "family_background", "gynecological_background",
     ]
+    # Los antecedentes se muestran en el listado: cargarlos con JOIN en la misma
+    # consulta de la página en lugar de un lazy load por fila.
+    column_select_related_list = [
+        MedicalFile.non_pathological_background,
+        MedicalFile.pathological_background,
+        MedicalFile.family_background,
+        MedicalFile.gynecological_background,
+    ]
+    page_size = 50
+    can_set_page_size = True
+    column_default_sort = ("id", True)
+    column_sortable_list = ["id", "file_status"]
+    column_filters = ["file_status"]
 
 class NonPathologicalBackgroundView(ModelView):
     column_list = [
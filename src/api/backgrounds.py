@@ -0,0 +1,324 @@
+"""
+Actualización parcial (PATCH) de los antecedentes de un expediente.
+
+Para cada sección se precalcula, a partir de las columnas del modelo, la
+lista blanca de campos editables y el convertidor de tipo de cada uno
+(enum, entero, decimal, booleano, texto con longitud máxima). Un PATCH:
+
+- valida sólo los campos enviados (los desconocidos o de tipo inválido se
+  rechazan juntos, con el motivo por campo);
+- emite una única sentencia por sección con esas columnas: un upsert
+  (INSERT ... ON CONFLICT (medical_file_id) DO UPDATE) que crea la sección
+  si aún no existe o incrementa version/updated_at de la fila si ya existe;
+- incrementa version/updated_at del expediente con un UPDATE condicionado a
+  la versión esperada (If-Match), que hace de control de concurrencia.
+
+Cada antecedente tiene UNIQUE(medical_file_id), así que el upsert es atómico
+en PostgreSQL y SQLite (>= 3.24); con otros motores se degrada a UPDATE y,
+si no había fila, INSERT.
+
+No pasa por el ORM: el autosave no carga los ~50 atributos de cada sección.
+
+Almacenamiento en documento (BACKGROUNDS_STORAGE=document): las cuatro
+secciones se guardan en medical_file.backgrounds_doc (JSON; JSONB en
+PostgreSQL), con la misma forma que Model.serialize(), y el expediente
+completo se lee en una sola fila. Por expediente, el documento es la fuente
+si no es NULL; si no, lo son las tablas (lectura dual en
+MedicalFile.serialize_backgrounds). Con el modo activo, la primera escritura
+de un expediente mueve sus filas al documento. Los campos que se filtran
+(DOCUMENT_COLUMNS) se copian a columnas indexadas de medical_file.
+`flask backgrounds-storage document|tables` convierte todos los expedientes
+en un sentido u otro (para volver al modo tablas hay que ejecutarlo).
+"""
+
+import enum
+import os
+from datetime import datetime, timezone
+
+from flask import current_app
+from sqlalchemy import Boolean, Enum, Float, Integer, Numeric, String, delete, select, update
+
+from api.cache import file_changed
+from api.database import upsert
+from api.search import clinical_changed, touches_clinical_text
+from api.models import (
+    db, MedicalFile, NonPathologicalBackground, PathologicalBackground,
+    FamilyBackground, GynecologicalBackground, BACKGROUND_SECTIONS,
+)
+
+# Clave del payload → modelo (se acepta el typo legacy 'patological_background')
+SECTIONS = {
+    "non_pathological_background": NonPathologicalBackground,
+    "pathological_background": PathologicalBackground,
+    "patological_background": PathologicalBackground,
+    "family_background": FamilyBackground,
+    "gynecological_background": GynecologicalBackground,
+}
+
+# Columnas que nunca edita el cliente
+PROTECTED_FIELDS = {"id", "medical_file_id", "updated_at", "version"}
+
+
+class PatchError(ValueError):
+    """Payload inválido; `errors` es {sección: {campo: motivo}}."""
+
+    def __init__(self, errors):
+        super().__init__("Payload de antecedentes inválido")
+        self.errors = errors
+
+
+def _empty_to_none(fn):
+    def convert(value):
+        if value is None or value == "":
+            return None
+        return fn(value)
+    return convert
+
+
+def _to_int(value):
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError("se esperaba un entero")
+    return int(value)
+
+
+def _to_float(value):
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError("se esperaba un número")
+    return float(value)
+
+
+def _to_bool(value):
+    if not isinstance(value, bool):
+        raise ValueError("se esperaba true/false")
+    return value
+
+
+def _enum_converter(enum_class):
+    def convert(value):
+        try:
+            return enum_class(value)
+        except ValueError:
+            raise ValueError(f"valores permitidos: {[e.value for e in enum_class]}") from None
+    return convert
+
+
+def _text_converter(length):
+    def convert(value):
+        if not isinstance(value, str):
+            raise ValueError("se esperaba texto")
+        if length and len(value) > length:
+            raise ValueError(f"máximo {length} caracteres")
+        return value
+    return convert
+
+
+def _converter_for(column):
+    col_type = column.type
+    if isinstance(col_type, Enum) and col_type.enum_class is not None:
+        return _empty_to_none(_enum_converter(col_type.enum_class))
+    if isinstance(col_type, Boolean):
+        # "" no significa False: sólo null borra el valor
+        return lambda value: None if value is None else _to_bool(value)
+    if isinstance(col_type, Integer):
+        return _empty_to_none(_to_int)
+    if isinstance(col_type, (Float, Numeric)):
+        return _empty_to_none(_to_float)
+    if isinstance(col_type, String):
+        return lambda value: None if value is None else _text_converter(col_type.length)(value)
+    return None
+
+
+def _build_field_types(model):
+    fields = {}
+    for column in model.__table__.columns:
+        if column.name in PROTECTED_FIELDS:
+            continue
+        converter = _converter_for(column)
+        if converter is not None:
+            fields[column.name] = converter
+    return fields
+
+
+# {modelo: {campo: convertidor}} — se calcula una vez al importar
+FIELD_TYPES = {model: _build_field_types(model) for model in set(SECTIONS.values())}
+
+# Sección del documento → modelo
+SECTION_MODELS = {name: SECTIONS[name] for name in BACKGROUND_SECTIONS}
+
+# Columna de medical_file → (sección, campo) del documento que copia
+DOCUMENT_COLUMNS = {
+    "blood_type": ("non_pathological_background", "blood_type"),
+    "family_diabetes": ("family_background", "diabetes"),
+}
+
+
+def known_fields(data):
+    """Deja sólo los campos editables de cada sección (el save legacy ignora el resto)."""
+    return {section: {name: value for name, value in fields.items() if name in FIELD_TYPES[SECTIONS[section]]}
+            for section, fields in data.items() if section in SECTIONS and isinstance(fields, dict)}
+
+
+def coerce_changes(data):
+    """Valida el payload {sección: {campo: valor}} y devuelve {modelo: {columna: valor}}.
+
+    Lanza PatchError con todos los errores encontrados.
+    """
+    changes, errors = {}, {}
+    for section, fields in data.items():
+        model = SECTIONS.get(section)
+        if model is None:
+            continue
+        if not isinstance(fields, dict):
+            errors[section] = {"*": "se esperaba un objeto"}
+            continue
+        allowed = FIELD_TYPES[model]
+        for name, value in fields.items():
+            converter = allowed.get(name)
+            if converter is None:
+                errors.setdefault(section, {})[name] = "campo no editable"
+                continue
+            try:
+                changes.setdefault(model, {})[name] = converter(value)
+            except (TypeError, ValueError) as e:
+                errors.setdefault(section, {})[name] = str(e)
+    if errors:
+        raise PatchError(errors)
+    return changes
+
+
+def upsert_section(table, medical_file_id, values, now):
+    """Crea o actualiza la sección `table` del expediente con una sola sentencia."""
+    upsert(db.session, table, {"medical_file_id": medical_file_id},
+           {**values, "version": 1, "updated_at": now},
+           {**values, "version": table.c.version + 1, "updated_at": now})
+
+
+def patch_backgrounds(medical_file_id, changes, expected_version=None, file_values=None, criteria=()):
+    """Aplica `changes` ({modelo: {columna: valor}}) con un upsert por sección.
+
+    `file_values` son columnas extra del expediente que se escriben en el
+    mismo UPDATE que incrementa su versión (p. ej. file_status); `criteria`,
+    condiciones extra de ese UPDATE. Si el expediente usa (o debe pasar a) el
+    documento, los cambios van ahí. Devuelve la nueva versión del
+    expediente, o None si el expediente no existe, su versión no es
+    `expected_version` o no cumple `criteria` (en ese caso no escribe).
+    No hace commit.
+    """
+    now = datetime.now(timezone.utc)
+    files = MedicalFile.__table__
+    bump_file = update(files).where(files.c.id == medical_file_id, *criteria).values(
+        **(file_values or {}), version=files.c.version + 1, updated_at=now,
+    ).returning(files.c.version, files.c.backgrounds_doc, files.c.user_id)
+    if expected_version is not None:
+        bump_file = bump_file.where(files.c.version == expected_version)
+    row = db.session.execute(bump_file).first()
+    if row is None:
+        return None
+    file_changed(medical_file_id, row.user_id)
+    if touches_clinical_text(changes):
+        clinical_changed(medical_file_id)
+
+    if row.backgrounds_doc is None and not document_storage():
+        for model, values in changes.items():
+            if values:
+                upsert_section(model.__table__, medical_file_id, values, now)
+        return row.version
+
+    # El UPDATE anterior ya bloquea la fila: leer-modificar-escribir el documento es seguro
+    doc = row.backgrounds_doc
+    if doc is None:
+        doc = move_sections_to_document(medical_file_id)
+    write_document(medical_file_id, apply_to_document(doc, changes, now))
+    return row.version
+
+
+# ---- ALMACENAMIENTO EN DOCUMENTO ----
+
+def document_storage():
+    """True si los expedientes pasan al documento en su próxima escritura."""
+    mode = current_app.config.get("BACKGROUNDS_STORAGE") or os.getenv("BACKGROUNDS_STORAGE", "tables")
+    return mode == "document"
+
+
+def _new_section(model):
+    """Sección vacía con los defaults de columna (misma forma que Model.serialize())."""
+    section = {"id": None, "version": 0, "updated_at": None}
+    for column in model.__table__.columns:
+        if column.name not in PROTECTED_FIELDS:
+            default = column.default
+            section[column.name] = default.arg if default is not None and default.is_scalar else None
+    return section
+
+
+def apply_to_document(doc, changes, now):
+    """Devuelve una copia de `doc` con `changes` aplicados y version/updated_at de cada sección."""
+    doc = {name: dict(section) for name, section in doc.items()}
+    for model, values in changes.items():
+        if not values:
+            continue
+        section = doc.get(model.__tablename__) or _new_section(model)
+        section.update({name: value.name if isinstance(value, enum.Enum) else value
+                        for name, value in values.items()})
+        section["version"] += 1
+        section["updated_at"] = now.isoformat()
+        doc[model.__tablename__] = section
+    return doc
+
+
+def write_document(medical_file_id, doc):
+    """Guarda el documento (o None) y las columnas indexadas que se copian de él."""
+    copies = {column: ((doc or {}).get(section) or {}).get(field)
+              for column, (section, field) in DOCUMENT_COLUMNS.items()}
+    files = MedicalFile.__table__
+    db.session.execute(update(files).where(files.c.id == medical_file_id)
+                       .values(backgrounds_doc=doc, **copies))
+    file_changed(medical_file_id)
+
+
+def move_sections_to_document(medical_file_id):
+    """Lee las filas de antecedentes del expediente como documento y las borra de sus tablas."""
+    doc = {}
+    for name, model in SECTION_MODELS.items():
+        table = model.__table__
+        background = db.session.execute(
+            select(model).where(model.medical_file_id == medical_file_id)).scalar_one_or_none()
+        if background is not None:
+            doc[name] = background.serialize()
+            del doc[name]["medical_file_id"]
+            db.session.expunge(background)
+            db.session.execute(delete(table).where(table.c.medical_file_id == medical_file_id))
+    return doc
+
+
+def move_document_to_tables(medical_file_id, doc):
+    """Inverso de move_sections_to_document: upsert de cada sección y documento a NULL."""
+    now = datetime.now(timezone.utc)
+    for name, section in doc.items():
+        model = SECTION_MODELS[name]
+        values = {field: convert(section.get(field)) for field, convert in FIELD_TYPES[model].items()}
+        upsert_section(model.__table__, medical_file_id, values, now)
+    write_document(medical_file_id, None)
+
+
+def convert_storage(target, batch_size=500):
+    """Mueve todos los expedientes al documento ("document") o a las tablas ("tables").
+
+    Recorre por id en lotes con un commit por lote; devuelve cuántos movió.
+    """
+    files = MedicalFile.__table__
+    pending = files.c.backgrounds_doc.is_(None) if target == "document" else files.c.backgrounds_doc.isnot(None)
+    moved, last_id = 0, 0
+    while True:
+        batch = db.session.execute(
+            select(files.c.id, files.c.backgrounds_doc).where(pending, files.c.id > last_id)
+            .order_by(files.c.id).limit(batch_size)).all()
+        if not batch:
+            return moved
+        for medical_file_id, doc in batch:
+            if target == "document":
+                write_document(medical_file_id, move_sections_to_document(medical_file_id))
+            else:
+                move_document_to_tables(medical_file_id, doc)
+        db.session.commit()
+        moved += len(batch)
+        last_id = batch[-1].id
@@ -0,0 +1,296 @@
+"""
+Caché read-through de respuestas JSON con TTL corto.
+
+Dos niveles:
+
+- LRUCache en proceso (uno por worker): OrderedDict con tamaño máximo
+  (CACHE_MAX_ENTRIES) y TTL (CACHE_TTL_SECONDS).
+- FileCache opcional (CACHE_DIR): un archivo por clave en un directorio
+  local compartido por los workers del host. Un acierto aquí también llena
+  el nivel en memoria.
+
+Las claves son "<espacio>:<id>:<versión>". Espacios:
+
+- medical_file: cuerpo de GET /medical_file/<id>. La versión es
+  medical_file.version, que ya calcula el marcador del ETag
+  (api/etag.conditional): cualquier escritura la incrementa, así que ningún
+  worker sirve una versión vieja aunque no se haya enterado de la
+  invalidación.
+- private: cuerpo de GET /private por id de usuario. Incluye el usuario,
+  sus datos académicos y su expediente completo; la versión es el hash que
+  calcula su marcador (routes.private_marker, un SELECT de esas filas y de
+  medical_file.version), así que tampoco aquí un worker sirve datos viejos.
+
+Al hacer commit se borran además las entradas afectadas por la transacción
+(sólo en este worker y en CACHE_DIR; libera memoria, la corrección la dan
+las versiones de las claves):
+
+- por el ORM: after_flush recoge los User, ProfessionalStudentData y
+  MedicalFile nuevos/modificados/borrados (el hook de models.py toca el
+  expediente en cada cambio de sus antecedentes y snapshots), lo que cubre
+  validaciones, solicitudes y cancelaciones;
+- por Core (api/backgrounds.py): file_changed(id, user_id).
+
+Uso:
+
+    @conditional(lambda file_id: file_marker(file_id))
+    @cached("medical_file")              # clave: el marcador de @conditional
+    def get_medical_file(file_id): ...
+
+    @conditional(lambda: private_marker(int(get_jwt_identity())))
+    @cached("private")
+    def private(): ...
+
+Contadores de aciertos/fallos por espacio: GET /api/health/cache (admin).
+
+Variables de entorno:
+
+- CACHE_ENABLED       1 (default) / 0
+- CACHE_TTL_SECONDS   default 30
+- CACHE_MAX_ENTRIES   default 1024 (por worker)
+- CACHE_DIR           directorio compartido (opcional)
+"""
+
+import glob
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from urllib.parse import quote
+
+from flask import current_app, g, has_app_context, make_response
+from sqlalchemy import event
+
+from api.database import RoutingSession
+from api.models import db, User, ProfessionalStudentData, MedicalFile
+
+
+class LRUCache:
+    """LRU en memoria con expiración por entrada."""
+
+    def __init__(self, max_entries, ttl):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, now):
+        with self._lock:
+            item = self._entries.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires <= now:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value, now):
+        with self._lock:
+            self._entries[key] = (now + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class FileCache:
+    """Un archivo por clave (texto) en un directorio compartido; expira por mtime."""
+
+    def __init__(self, directory, ttl):
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, quote(key, safe=""))
+
+    def get(self, key, now):
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl <= now:
+                os.remove(path)
+                return None
+            with open(path) as fh:
+                return fh.read()
+        except OSError:
+            return None
+
+    def set(self, key, value, now):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, "w") as fh:
+                fh.write(value)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def delete_prefix(self, prefix):
+        for path in glob.glob(self._path(prefix) + "*"):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def clear(self):
+        self.delete_prefix("")
+
+
+class ResponseCache:
+    """Memoria + backend compartido opcional, con contadores por espacio de nombres."""
+
+    def __init__(self, memory, shared=None):
+        self.memory = memory
+        self.shared = shared
+        self.counters = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(namespace, ident, version=""):
+        return f"{namespace}:{ident}:{version}"
+
+    def _count(self, namespace, counter):
+        with self._lock:
+            counters = self.counters.setdefault(namespace, {"hits": 0, "misses": 0, "invalidations": 0})
+            counters[counter] += 1
+
+    def get(self, namespace, ident, version=""):
+        key, now = self.key(namespace, ident, version), time.time()
+        value = self.memory.get(key, now)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key, now)
+            if value is not None:
+                self.memory.set(key, value, now)
+        self._count(namespace, "hits" if value is not None else "misses")
+        return value
+
+    def set(self, namespace, ident, version, value):
+        key, now = self.key(namespace, ident, version), time.time()
+        self.memory.set(key, value, now)
+        if self.shared is not None:
+            self.shared.set(key, value, now)
+
+    def invalidate(self, namespace, ident):
+        """Borra todas las versiones de `ident`."""
+        prefix = f"{namespace}:{ident}:"
+        self.memory.delete_prefix(prefix)
+        if self.shared is not None:
+            self.shared.delete_prefix(prefix)
+        self._count(namespace, "invalidations")
+
+    def clear(self):
+        self.memory.clear()
+        if self.shared is not None:
+            self.shared.clear()
+
+    def stats(self):
+        with self._lock:
+            counters = {name: dict(values) for name, values in self.counters.items()}
+        return {
+            "pid": os.getpid(),
+            "entries": len(self.memory),
+            "max_entries": self.memory.max_entries,
+            "ttl_seconds": self.memory.ttl,
+            "shared_dir": self.shared.directory if self.shared is not None else None,
+            "namespaces": counters,
+        }
+
+
+def cache():
+    """Caché de la app actual (None si está deshabilitada)."""
+    return current_app.extensions.get("cache")
+
+
+def cached(namespace, key=None):
+    """Decorador: sirve desde la caché las respuestas 200 de la vista.
+
+    `key(*args, **kwargs)` devuelve (id, versión). Sin `key` va debajo de
+    @conditional y usa su marcador; si la clave es None (p. ej. recurso
+    inexistente) la vista se ejecuta sin caché.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            store = cache()
+            marker = key(*args, **kwargs) if key is not None else g.get("etag_marker")
+            if store is None or marker is None:
+                return fn(*args, **kwargs)
+            body = store.get(namespace, *marker)
+            if body is not None:
+                return current_app.response_class(body, mimetype="application/json")
+            response = make_response(fn(*args, **kwargs))
+            if response.status_code == 200:
+                store.set(namespace, *marker, response.get_data(as_text=True))
+            return response
+        return wrapper
+    return decorator
+
+
+# ---- Invalidación al hacer commit ----
+
+def _changed(session, namespace, ident):
+    if ident is not None:
+        session.info.setdefault("cache_changed", set()).add((namespace, ident))
+
+
+def file_changed(medical_file_id, user_id=None, session=None):
+    """Invalida el expediente (y el /private de su paciente) cuando la transacción haga commit."""
+    session = session or db.session
+    _changed(session, "medical_file", medical_file_id)
+    _changed(session, "private", user_id)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _collect_changes(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if isinstance(obj, MedicalFile):
+            file_changed(obj.id, obj.user_id, session)
+        elif isinstance(obj, User):
+            _changed(session, "private", obj.id)
+        elif isinstance(obj, ProfessionalStudentData):
+            _changed(session, "private", obj.user_id)
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _invalidate_changes(session):
+    changed = session.info.pop("cache_changed", None)
+    store = cache() if changed and has_app_context() else None
+    if store is not None:
+        for namespace, ident in changed:
+            store.invalidate(namespace, ident)
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _forget_changes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("cache_changed", None)
+
+
+def setup_cache(app):
+    """Crea la caché del proceso (app.extensions["cache"]) si CACHE_ENABLED."""
+    app.config.setdefault("CACHE_ENABLED", os.getenv("CACHE_ENABLED", "1") == "1")
+    app.config.setdefault("CACHE_TTL_SECONDS", float(os.getenv("CACHE_TTL_SECONDS", "30")))
+    app.config.setdefault("CACHE_MAX_ENTRIES", int(os.getenv("CACHE_MAX_ENTRIES", "1024")))
+    app.config.setdefault("CACHE_DIR", os.getenv("CACHE_DIR") or None)
+    if not app.config["CACHE_ENABLED"]:
+        return None
+
+    ttl = app.config["CACHE_TTL_SECONDS"]
+    shared = FileCache(app.config["CACHE_DIR"], ttl) if app.config["CACHE_DIR"] else None
+    store = ResponseCache(LRUCache(app.config["CACHE_MAX_ENTRIES"], ttl), shared)
+    app.extensions["cache"] = store
+    return store
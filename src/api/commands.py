@@ -1,15 +1,24 @@
 
+import time
+from datetime import date
+
 import click
-from api.models import db, User
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+from api.models import db, User, UserRole, MedicalFile
+from api.seed import seed_dataset, DEFAULT_PASSWORD
+from api.backgrounds import convert_storage
+from api.search import build_sqlite_index, reindex_all
+from api.stats import rebuild_counters
 
 """
 In this file, you can add as many commands as you want using the @app.cli.command decorator
-Flask commands are usefull to run cronjobs or tasks outside of the API but sill in integration 
+Flask commands are usefull to run cronjobs or tasks outside of the API but sill in integration
 with youy database, for example: Import the price of bitcoin every night as 12am
 """
 def setup_commands(app):
-    
-    """ 
+
+    """
     This is an example command "insert-test-users" that you can run from the command line
     by typing: $ flask insert-test-users 5
     Note: 5 is the number of users to add
@@ -18,17 +27,105 @@ def setup_commands(app):
     @click.argument("count") # argument of out command
     def insert_test_users(count):
         print("Creating test users")
-        for x in range(1, int(count) + 1):
-            user = User()
-            user.email = "test_user" + str(x) + "@test.com"
-            user.password = "123456"
-            user.is_active = True
-            db.session.add(user)
-            db.session.commit()
-            print("User: ", user.email, " created.")
+        password = generate_password_hash("123456")  # un solo hash para todos
+        rows = [{
+            "first_name": "Test",
+            "first_surname": f"User{x}",
+            "birth_day": date(2000, 1, 1),
+            "email": "test_user" + str(x) + "@test.com",
+            "password": password,
+            "role": UserRole.patient,
+        } for x in range(1, int(count) + 1)]
+        user_ids = db.session.scalars(
+            insert(User).returning(User.id, sort_by_parameter_order=True), rows).all()
+        # Los pacientes siempre tienen expediente (igual que /api/register)
+        db.session.execute(insert(MedicalFile), [{"user_id": uid} for uid in user_ids])
+        db.session.commit()
+        for row in rows:
+            print("User: ", row["email"], " created.")
 
         print("All test users created")
 
     @app.cli.command("insert-test-data")
     def insert_test_data():
-        pass
\ No newline at end of file
+        """Dataset pequeño con todos los roles y estados (equivale a `flask seed` por defecto)."""
+        result = seed_dataset(admins=1, professionals=2, students=5, patients=20, prefix="td")
+        print(f"Test data created: {result['counts']}")
+
+    """
+    Generador de datasets sintéticos para pruebas de rendimiento:
+    $ flask seed --patients 1000000 --students 20000 --professionals 500 --seed 7
+    """
+    @app.cli.command("seed")
+    @click.option("--admins", default=1, show_default=True)
+    @click.option("--professionals", default=10, show_default=True)
+    @click.option("--students", default=100, show_default=True)
+    @click.option("--patients", default=1000, show_default=True,
+                  help="Un expediente por paciente, repartidos entre todos los FileStatus.")
+    @click.option("--snapshots-per-file", default=1, show_default=True)
+    @click.option("--seed", "random_seed", default=42, show_default=True,
+                  help="Semilla: el mismo valor genera el mismo dataset.")
+    @click.option("--prefix", default=None,
+                  help="Prefijo de emails (default s<seed>); cámbialo para sembrar otra vez.")
+    @click.option("--batch-size", default=5000, show_default=True)
+    def seed(admins, professionals, students, patients, snapshots_per_file,
+             random_seed, prefix, batch_size):
+        prefix = prefix if prefix is not None else f"s{random_seed}"
+        if User.query.filter(User.email.like(f"{prefix}%@seed.t")).first():
+            raise click.ClickException(
+                f"Ya existen usuarios con prefijo '{prefix}'; usa --prefix para otro dataset.")
+
+        print(f"Seeding (seed={random_seed}, prefix={prefix}, batch={batch_size})")
+        start = time.perf_counter()
+        result = seed_dataset(
+            admins=admins, professionals=professionals, students=students, patients=patients,
+            snapshots_per_file=snapshots_per_file, seed=random_seed, prefix=prefix,
+            batch_size=batch_size, log=lambda msg: print("  " + msg))
+        total = sum(result["counts"].values())
+        elapsed = time.perf_counter() - start
+        print(f"{total} rows in {elapsed:.1f}s ({total / elapsed:.0f} rows/s). "
+              f"Password for all users: {DEFAULT_PASSWORD}")
+
+    """
+    Mueve los antecedentes de todos los expedientes al documento JSON de
+    medical_file o de vuelta a sus tablas (ver BACKGROUNDS_STORAGE en api/backgrounds.py):
+    $ flask backgrounds-storage document
+    """
+    @app.cli.command("backgrounds-storage")
+    @click.argument("target", type=click.Choice(["document", "tables"]))
+    @click.option("--batch-size", default=500, show_default=True)
+    def backgrounds_storage(target, batch_size):
+        start = time.perf_counter()
+        moved = convert_storage(target, batch_size)
+        print(f"{moved} medical files moved to {target} in {time.perf_counter() - start:.1f}s")
+
+    """
+    Reconstruye los índices de búsqueda: en SQLite crea (si faltan) y llena
+    las tablas FTS5; en cualquier motor rellena clinical_search con el texto
+    de los antecedentes de todos los expedientes (un commit por lote). En
+    PostgreSQL los índices GIN los crea la migración.
+    $ flask search-index --batch-size 500
+    """
+    @app.cli.command("search-index")
+    @click.option("--batch-size", default=500, show_default=True, type=int)
+    def search_index(batch_size):
+        if db.engine.dialect.name == "sqlite":
+            with db.engine.begin() as connection:
+                build_sqlite_index(connection)
+            print("users_fts and clinical_search_fts rebuilt")
+        start = time.perf_counter()
+        indexed = reindex_all(batch_size)
+        print(f"{indexed} medical files indexed for clinical search in {time.perf_counter() - start:.1f}s")
+
+    """
+    Recalcula los contadores materializados de /api/stats (stats_counter)
+    desde las tablas, en una transacción. Necesario al activar
+    STATS_MATERIALIZED=1 y tras cargas de datos fuera de la app:
+    $ flask stats-rebuild
+    """
+    @app.cli.command("stats-rebuild")
+    def stats_rebuild():
+        start = time.perf_counter()
+        total = rebuild_counters()
+        db.session.commit()
+        print(f"{total} counters rebuilt in {time.perf_counter() - start:.1f}s")
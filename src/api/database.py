@@ -0,0 +1,352 @@
+"""
+Configuración del motor SQLAlchemy (pool de conexiones) e instrumentación del pool.
+
+Todas las opciones se leen de variables de entorno para poder ajustarlas por
+despliegue (p. ej. gunicorn con varios workers contra Postgres en Render) sin
+tocar código:
+
+- DB_POOL_SIZE            conexiones permanentes por worker (default 5)
+- DB_MAX_OVERFLOW         conexiones extra temporales por worker (default 5)
+- DB_POOL_TIMEOUT         segundos esperando una conexión libre (default 30)
+- DB_POOL_RECYCLE         segundos antes de reciclar una conexión (default 1800)
+- DB_POOL_PRE_PING        1/0, verifica la conexión antes de usarla (default 1)
+- DB_STATEMENT_TIMEOUT_MS statement_timeout de Postgres en ms (0 = sin límite)
+- DB_POOL_SLOW_CHECKOUT_MS umbral para loguear esperas largas del pool (default 100)
+
+Perfil SQLite (sólo si la URI es sqlite, desactivable con SQLITE_TUNING=0):
+
+- SQLITE_BUSY_TIMEOUT_MS  espera máxima por el lock de escritura (default 5000)
+- SQLITE_MMAP_SIZE        bytes mapeados en memoria (default 256 MB)
+- SQLITE_CACHE_SIZE_KB    caché de páginas por conexión en KiB (default 20000)
+- SQLITE_FOREIGN_KEYS     1/0, aplica claves foráneas (default 1)
+
+Réplica de lectura (opcional):
+
+- DATABASE_REPLICA_URL    URI de la réplica; los GET se leen de ella
+- REPLICA_STICKY_SECONDS  tras escribir, el mismo usuario lee del primario
+                          durante esta ventana (default 10)
+"""
+
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event, exc, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.pool import QueuePool
+
+logger = logging.getLogger(__name__)
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    try:
+        return int(value)
+    except ValueError:
+        logger.warning("Valor inválido para %s=%r; usando %s", name, value, default)
+        return default
+
+
+def _env_bool(name, default):
+    value = os.getenv(name)
+    if value is None or value == "":
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+# -------------------- INSTRUMENTACIÓN DEL POOL --------------------
+class PoolStats:
+    """Contadores de espera del pool de un worker (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.slow_checkouts = 0
+
+    def record_checkout(self, waited, slow_threshold):
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += waited
+            if waited > self.max_wait:
+                self.max_wait = waited
+            if waited >= slow_threshold:
+                self.slow_checkouts += 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def as_dict(self):
+        with self._lock:
+            avg = self.total_wait / self.checkouts if self.checkouts else 0.0
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "slow_checkouts": self.slow_checkouts,
+                "wait_ms_total": round(self.total_wait * 1000, 3),
+                "wait_ms_avg": round(avg * 1000, 3),
+                "wait_ms_max": round(self.max_wait * 1000, 3),
+            }
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool que mide cuánto tarda cada checkout (espera + conexión/pre-ping)."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = PoolStats()
+        self._slow_threshold = _env_int("DB_POOL_SLOW_CHECKOUT_MS", 100) / 1000.0
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            conn = super().connect()
+        except exc.TimeoutError:
+            self.stats.record_timeout()
+            logger.warning("Timeout esperando conexión del pool (%s)", self.status())
+            raise
+        waited = time.perf_counter() - start
+        self.stats.record_checkout(waited, self._slow_threshold)
+        if waited >= self._slow_threshold:
+            logger.warning(
+                "Checkout lento del pool: %.1f ms (pid=%s, %s)",
+                waited * 1000, os.getpid(), self.status())
+        return conn
+
+
+def build_engine_options(uri):
+    """Devuelve SQLALCHEMY_ENGINE_OPTIONS para la URI dada."""
+    options = {
+        "pool_pre_ping": _env_bool("DB_POOL_PRE_PING", True),
+        "pool_recycle": _env_int("DB_POOL_RECYCLE", 1800),
+    }
+    if uri.startswith("sqlite:"):
+        # SQLite usa su pool por defecto (archivo local, sin red)
+        return options
+
+    options.update({
+        "poolclass": InstrumentedQueuePool,
+        "pool_size": _env_int("DB_POOL_SIZE", 5),
+        "max_overflow": _env_int("DB_MAX_OVERFLOW", 5),
+        "pool_timeout": _env_int("DB_POOL_TIMEOUT", 30),
+    })
+    statement_timeout = _env_int("DB_STATEMENT_TIMEOUT_MS", 0)
+    if statement_timeout > 0 and uri.startswith("postgresql"):
+        options["connect_args"] = {
+            "options": f"-c statement_timeout={statement_timeout}"}
+    return options
+
+
+# -------------------- PERFIL SQLITE --------------------
+# Métodos HTTP que sólo leen: sus transacciones no necesitan el lock de escritura.
+READ_ONLY_METHODS = frozenset(("GET", "HEAD", "OPTIONS"))
+
+
+def sqlite_pragmas():
+    """PRAGMAs aplicados a cada conexión SQLite nueva (orden relevante)."""
+    return [
+        ("journal_mode", "WAL"),
+        ("synchronous", "NORMAL"),
+        ("busy_timeout", _env_int("SQLITE_BUSY_TIMEOUT_MS", 5000)),
+        ("mmap_size", _env_int("SQLITE_MMAP_SIZE", 256 * 1024 * 1024)),
+        ("cache_size", -_env_int("SQLITE_CACHE_SIZE_KB", 20000)),
+        ("foreign_keys", "ON" if _env_bool("SQLITE_FOREIGN_KEYS", True) else "OFF"),
+        ("temp_store", "MEMORY"),
+    ]
+
+
+def _is_write_context():
+    """Fuera de un request (CLI, arranque) se asume escritura."""
+    if has_request_context():
+        if g.get("sqlite_deferred_begin"):
+            return False
+        return request.method not in READ_ONLY_METHODS
+    return True
+
+
+def deferred_begin(fn):
+    """Marca una vista no-GET que casi nunca escribe (p. ej. login).
+
+    Sus transacciones SQLite usan BEGIN diferido para no retener el lock de
+    escritura mientras hacen trabajo de CPU (verificar contraseñas).
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        g.sqlite_deferred_begin = True
+        return fn(*args, **kwargs)
+    return wrapper
+
+
+def _sqlite_on_connect(dbapi_connection, connection_record):
+    # Desactivar el BEGIN implícito de pysqlite: lo emite _sqlite_on_begin
+    dbapi_connection.isolation_level = None
+    cursor = dbapi_connection.cursor()
+    try:
+        for pragma, value in sqlite_pragmas():
+            cursor.execute(f"PRAGMA {pragma}={value}")
+    finally:
+        cursor.close()
+
+
+def _sqlite_on_begin(conn):
+    # Ruta de escritura serializada: los requests que escriben toman el lock
+    # RESERVED al iniciar la transacción (BEGIN IMMEDIATE) y esperan en
+    # busy_timeout. Con BEGIN diferido dos workers que leen y luego escriben
+    # se bloquean mutuamente y SQLite devuelve "database is locked" sin esperar.
+    if _is_write_context():
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+    else:
+        conn.exec_driver_sql("BEGIN")
+
+
+def configure_sqlite_engine(engine):
+    """Aplica el perfil de producción SQLite (WAL, pragmas, writer serializado)."""
+    if engine.dialect.name != "sqlite" or not _env_bool("SQLITE_TUNING", True):
+        return False
+    if event.contains(engine, "connect", _sqlite_on_connect):
+        return True
+    event.listen(engine, "connect", _sqlite_on_connect)
+    event.listen(engine, "begin", _sqlite_on_begin)
+    return True
+
+
+def pool_status(engine):
+    """Estado del pool del worker actual: tamaño, checked-out, overflow y esperas."""
+    pool = engine.pool
+    status = {
+        "pid": os.getpid(),
+        "pool_class": type(pool).__name__,
+    }
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        fn = getattr(pool, name, None)
+        if callable(fn):
+            status[name] = fn()
+    stats = getattr(pool, "stats", None)
+    if stats is not None:
+        status["waits"] = stats.as_dict()
+    return status
+
+
+# -------------------- RÉPLICA DE LECTURA --------------------
+REPLICA_BIND = "replica"
+
+
+class StickyWindow:
+    """Recuerda qué usuarios escribieron recientemente (read-your-writes).
+
+    Almacenamiento en memoria del worker: una lectura servida por otro worker
+    durante la ventana puede ir a la réplica.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._until = {}
+
+    def mark(self, key, seconds):
+        now = time.monotonic()
+        with self._lock:
+            self._until[key] = now + seconds
+            if len(self._until) > 10000:
+                self._until = {k: v for k, v in self._until.items() if v > now}
+
+    def is_sticky(self, key):
+        with self._lock:
+            until = self._until.get(key)
+        return until is not None and until > time.monotonic()
+
+    def clear(self):
+        with self._lock:
+            self._until.clear()
+
+
+sticky_writes = StickyWindow()
+
+
+def current_identity():
+    """Identidad JWT del request si ya fue verificada; None en otro caso."""
+    try:
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+
+class RoutingSession(Session):
+    """Session que envía las lecturas de requests GET a la réplica.
+
+    Van al primario: métodos que escriben, cualquier flush, el resto de un
+    request que ya escribió y los usuarios dentro de su ventana sticky.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and self._use_replica():
+            replica = self._db.engines.get(REPLICA_BIND)
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+    def _use_replica(self):
+        if self._flushing or not has_request_context():
+            return False
+        if request.method not in READ_ONLY_METHODS or g.get("db_wrote"):
+            return False
+        identity = current_identity()
+        return identity is None or not sticky_writes.is_sticky(str(identity))
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _mark_request_wrote(session, flush_context):
+    if has_request_context():
+        g.db_wrote = True
+
+
+def configure_replica(app):
+    """Registra el bind de réplica (antes de db.init_app) y la ventana sticky."""
+    replica_url = os.getenv("DATABASE_REPLICA_URL")
+    if replica_url and REPLICA_BIND not in app.config.get("SQLALCHEMY_BINDS", {}):
+        replica_url = replica_url.replace("postgres://", "postgresql://")
+        app.config.setdefault("SQLALCHEMY_BINDS", {})[REPLICA_BIND] = {
+            "url": replica_url, **build_engine_options(replica_url)}
+    app.config.setdefault(
+        "REPLICA_STICKY_SECONDS", _env_int("REPLICA_STICKY_SECONDS", 10))
+
+    @app.after_request
+    def _remember_writer(response):
+        if g.get("db_wrote") and REPLICA_BIND in current_app.config.get("SQLALCHEMY_BINDS", {}):
+            identity = current_identity()
+            if identity is not None:
+                sticky_writes.mark(
+                    str(identity), current_app.config["REPLICA_STICKY_SECONDS"])
+        return response
+
+
+# ---- UPSERT ----
+
+# Dialectos con INSERT ... ON CONFLICT DO UPDATE
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def upsert(session, table, key, values, set_):
+    """Inserta la fila `key` + `values` o, si `key` ya existe, la actualiza con `set_`.
+
+    `key` ({columna: valor}) debe tener un índice único. Postgres y SQLite usan
+    una sola sentencia ON CONFLICT DO UPDATE; el resto, UPDATE y, si no tocó
+    ninguna fila, INSERT.
+    """
+    dialect_insert = UPSERT_INSERTS.get(session.connection().dialect.name)
+    if dialect_insert is None:
+        where = [table.c[name] == value for name, value in key.items()]
+        if session.execute(update(table).where(*where).values(**set_)).rowcount == 0:
+            session.execute(insert(table).values(**key, **values))
+        return
+    session.execute(dialect_insert(table).values(**key, **values).on_conflict_do_update(
+        index_elements=[table.c[name] for name in key], set_=set_))
@@ -0,0 +1,370 @@
+"""
+Buffer de borradores (autosave) de antecedentes, por medical_file_id.
+
+El formulario de antecedentes guarda cada pocos segundos. En lugar de una
+transacción por guardado, PUT /api/medical_file/<id>/backgrounds/draft
+valida los campos y los fusiona en un borrador pendiente; el borrador se
+escribe en la base (api/backgrounds.patch_backgrounds, un UPDATE por
+sección) como mucho cada DRAFT_FLUSH_SECONDS:
+
+- al guardar un borrador cuyo cambio más antiguo ya cumplió el intervalo;
+- con un hilo por worker que escribe los borradores vencidos;
+- antes de cualquier escritura explícita del expediente: PATCH de
+  antecedentes, /backgrounds/save, /backgrounds (create), mark_review y
+  upload_snapshot llaman a flush_pending() dentro de su transacción;
+- al terminar el proceso (sólo el almacén en memoria).
+
+Almacenes (pluggable, ver DraftStore):
+
+- MemoryDraftStore (default): en proceso. Con varios workers de gunicorn
+  cada uno tiene su buffer, así que sólo es correcto con un worker.
+- FileDraftStore (DRAFT_DIR=<directorio compartido>): un JSON por
+  expediente con lock de archivo; todos los workers del host ven los mismos
+  borradores.
+- Cualquier otro: DRAFT_STORE=modulo:Clase (se instancia sin argumentos).
+
+Los borradores guardan el JSON crudo ya validado, por sección canónica,
+junto con base_version: la versión del expediente cuando entró el primer
+cambio. El borrador se escribe condicionado a esa versión; si otra sesión
+escribió el expediente entre medias, o el expediente ya no está en edición
+(empty/progress), no se escribe: se conserva marcado como en conflicto y se
+lanza DraftConflict (409). El cliente lo resuelve con un PATCH que envía la
+versión que leyó (lo enviado gana) o descartándolo (DELETE del borrador).
+Un borrador tomado del buffer vuelve a él si la transacción que lo iba a
+escribir termina sin commit (error, 4xx posterior, rollback).
+"""
+
+import abc
+import atexit
+import glob
+import importlib
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import event, select
+
+from api.backgrounds import SECTIONS, coerce_changes, patch_backgrounds
+from api.database import RoutingSession
+from api.models import db, FileStatus, MedicalFile
+
+logger = logging.getLogger(__name__)
+
+# Estados en los que el estudiante todavía edita los antecedentes
+EDITABLE_STATUSES = (FileStatus.empty, FileStatus.progress)
+
+
+class DraftConflict(Exception):
+    """El borrador no se puede escribir: el expediente cambió desde base_version o ya no es editable."""
+
+    def __init__(self, medical_file_id, base_version, current_version, file_status):
+        super().__init__(f"Borrador en conflicto del expediente {medical_file_id}")
+        self.medical_file_id = medical_file_id
+        self.base_version = base_version
+        self.current_version = current_version
+        self.file_status = file_status
+
+
+def merge_changes(base, extra, keep_existing=False):
+    """Fusiona {sección: {campo: valor}}; `extra` gana salvo keep_existing."""
+    merged = {section: dict(fields) for section, fields in base.items()}
+    for section, fields in extra.items():
+        target = merged.setdefault(section, {})
+        for name, value in fields.items():
+            if not keep_existing or name not in target:
+                target[name] = value
+    return merged
+
+
+def merge_entry(entry, changes, now, keep_existing=False, base_version=None, conflict=False):
+    """Entrada resultante de fusionar `changes` en `entry` (None si no había borrador).
+
+    since y base_version quedan en los del cambio más antiguo; conflict se
+    mantiene hasta que el borrador sale del buffer.
+    """
+    entry = entry or {"changes": {}, "since": now, "base_version": base_version, "conflict": False}
+    bases = [v for v in (entry["base_version"], base_version) if v is not None]
+    return {"changes": merge_changes(entry["changes"], changes, keep_existing),
+            "since": min(entry["since"], now),
+            "base_version": min(bases) if bases else None,
+            "conflict": entry["conflict"] or conflict}
+
+
+def normalize(data):
+    """Deja sólo las secciones conocidas, con su nombre canónico (el de la tabla)."""
+    changes = {}
+    for section, fields in data.items():
+        model = SECTIONS.get(section)
+        if model is not None and fields:
+            changes = merge_changes(changes, {model.__tablename__: fields})
+    return changes
+
+
+class DraftStore(abc.ABC):
+    """Interfaz del almacén; una implementación incompleta falla al instanciarse.
+
+    Entradas: {"changes": {...}, "since": epoch del cambio más antiguo,
+    "base_version": versión del expediente entonces, "conflict": bool}.
+    """
+
+    @abc.abstractmethod
+    def merge(self, key, changes, now, keep_existing=False, base_version=None, conflict=False):
+        """Fusiona `changes` en el borrador (ver merge_entry) y devuelve la entrada resultante."""
+
+    @abc.abstractmethod
+    def take(self, key):
+        """Quita y devuelve la entrada (None si no hay)."""
+
+    @abc.abstractmethod
+    def peek(self, key):
+        """Devuelve la entrada sin quitarla (None si no hay)."""
+
+    @abc.abstractmethod
+    def due(self, older_than):
+        """Claves sin conflicto cuyo cambio más antiguo es anterior a `older_than`."""
+
+
+class MemoryDraftStore(DraftStore):
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def merge(self, key, changes, now, keep_existing=False, base_version=None, conflict=False):
+        with self._lock:
+            entry = merge_entry(self._entries.get(key), changes, now, keep_existing, base_version, conflict)
+            self._entries[key] = entry
+            return entry
+
+    def take(self, key):
+        with self._lock:
+            return self._entries.pop(key, None)
+
+    def peek(self, key):
+        with self._lock:
+            return self._entries.get(key)
+
+    def due(self, older_than):
+        with self._lock:
+            return [key for key, entry in self._entries.items()
+                    if entry["since"] <= older_than and not entry["conflict"]]
+
+
+class FileDraftStore(DraftStore):
+    """Un archivo draft_<id>.json por expediente en un directorio compartido entre workers."""
+
+    def __init__(self, directory):
+        import fcntl
+
+        self._fcntl = fcntl
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"draft_{key}.json")
+
+    def _locked(self, key):
+        fh = open(os.path.join(self.directory, f"draft_{key}.lock"), "a")
+        self._fcntl.flock(fh, self._fcntl.LOCK_EX)
+        return fh
+
+    def _read(self, key):
+        try:
+            with open(self._path(key)) as fh:
+                entry = json.load(fh)
+        except (OSError, ValueError):
+            return None
+        # Borradores escritos antes de base_version
+        entry.setdefault("base_version", None)
+        entry.setdefault("conflict", False)
+        return entry
+
+    def merge(self, key, changes, now, keep_existing=False, base_version=None, conflict=False):
+        with self._locked(key):
+            entry = merge_entry(self._read(key), changes, now, keep_existing, base_version, conflict)
+            tmp = f"{self._path(key)}.{os.getpid()}.tmp"
+            with open(tmp, "w") as fh:
+                json.dump(entry, fh)
+            os.replace(tmp, self._path(key))
+            return entry
+
+    def take(self, key):
+        with self._locked(key):
+            entry = self._read(key)
+            if entry is not None:
+                os.remove(self._path(key))
+            return entry
+
+    def peek(self, key):
+        return self._read(key)
+
+    def due(self, older_than):
+        keys = []
+        for path in glob.glob(os.path.join(self.directory, "draft_*.json")):
+            key = os.path.basename(path)[len("draft_"):-len(".json")]
+            entry = self._read(key)
+            if entry is not None and entry["since"] <= older_than and not entry["conflict"]:
+                keys.append(int(key))
+        return keys
+
+
+class DraftBuffer:
+    def __init__(self, store, flush_seconds):
+        self.store = store
+        self.flush_seconds = flush_seconds
+        self._flusher = None
+        self._flusher_pid = None
+
+    def save(self, medical_file_id, data, current_version, file_status):
+        """Valida y fusiona un guardado; escribe si el borrador ya cumplió el intervalo.
+
+        `current_version`/`file_status` son los del expediente leídos por la
+        vista; el primer cambio del borrador fija base_version = current_version.
+        Devuelve (nueva versión si escribió o None, base_version del borrador).
+        Lanza PatchError si el payload es inválido y DraftConflict (sin tocar
+        el buffer) si el expediente no es editable o cambió desde base_version.
+        """
+        coerce_changes(data)
+        entry = self.store.peek(medical_file_id)
+        if file_status not in EDITABLE_STATUSES or (
+                entry and (entry["conflict"] or entry["base_version"] not in (None, current_version))):
+            raise DraftConflict(medical_file_id, entry and entry["base_version"], current_version, file_status)
+        now = time.time()
+        entry = self.store.merge(medical_file_id, normalize(data), now, base_version=current_version)
+        if now - entry["since"] >= self.flush_seconds:
+            version = self.flush_pending(medical_file_id)
+            db.session.commit()
+            return version, entry["base_version"]
+        self._ensure_flusher()
+        return None, entry["base_version"]
+
+    def pending(self, medical_file_id):
+        """Entrada pendiente (ver DraftStore) o None."""
+        return self.store.peek(medical_file_id)
+
+    def take(self, medical_file_id):
+        """Quita el borrador del buffer; vuelve a él si la transacción no hace commit.
+
+        Devuelve la entrada (ver DraftStore) o None.
+        """
+        entry = self.store.take(medical_file_id)
+        if not entry or not entry["changes"]:
+            return None
+        db.session.info.setdefault("taken_drafts", []).append((self, medical_file_id, entry))
+        return entry
+
+    def discard(self, medical_file_id):
+        """Descarta el borrador (p. ej. tras un conflicto). True si había uno."""
+        return self.store.take(medical_file_id) is not None
+
+    def restore(self, medical_file_id, entry):
+        """Devuelve al buffer un borrador tomado que no se pudo escribir (sin pisar los cambios nuevos)."""
+        self.store.merge(medical_file_id, entry["changes"], entry["since"], keep_existing=True,
+                         base_version=entry["base_version"], conflict=entry["conflict"])
+
+    def flush_pending(self, medical_file_id):
+        """Escribe el borrador pendiente en la transacción actual (sin commit).
+
+        El UPDATE va condicionado a base_version y a que el expediente siga en
+        edición. Devuelve la nueva versión, o None si no había borrador o el
+        expediente ya no existe. Si el expediente cambió o ya no es editable
+        marca el borrador en conflicto y lanza DraftConflict: el rollback de
+        quien la atienda lo devuelve al buffer. Expira la sesión: los objetos
+        ORM cargados antes releen la version que acaba de cambiar y su
+        próximo UPDATE no choca con ella.
+        """
+        entry = self.take(medical_file_id)
+        if not entry:
+            return None
+        version = patch_backgrounds(medical_file_id, coerce_changes(entry["changes"]), entry["base_version"],
+                                    criteria=(MedicalFile.file_status.in_(EDITABLE_STATUSES),))
+        if version is None:
+            current = db.session.execute(
+                select(MedicalFile.version, MedicalFile.file_status)
+                .where(MedicalFile.id == medical_file_id)).one_or_none()
+            if current is not None:
+                entry["conflict"] = True
+                raise DraftConflict(medical_file_id, entry["base_version"], current.version, current.file_status)
+        db.session.expire_all()
+        return version
+
+    def flush_due(self):
+        for medical_file_id in self.store.due(time.time() - self.flush_seconds):
+            try:
+                self.flush_pending(medical_file_id)
+                db.session.commit()
+            except DraftConflict as e:
+                db.session.rollback()
+                logger.info("Borrador del expediente %s en conflicto (base %s, actual %s, estado %s)",
+                            medical_file_id, e.base_version, e.current_version, e.file_status.value)
+            except Exception:
+                db.session.rollback()
+                logger.warning("No se pudo escribir el borrador del expediente %s", medical_file_id,
+                               exc_info=True)
+
+    def _ensure_flusher(self):
+        # Un hilo por proceso (tras el fork de gunicorn el hilo del padre no existe)
+        if self._flusher_pid == os.getpid() and self._flusher.is_alive():
+            return
+        app = current_app._get_current_object()
+
+        def run():
+            while True:
+                time.sleep(self.flush_seconds)
+                with app.app_context():
+                    self.flush_due()
+
+        self._flusher = threading.Thread(target=run, name="draft-flusher", daemon=True)
+        self._flusher_pid = os.getpid()
+        self._flusher.start()
+
+
+@event.listens_for(RoutingSession, "after_commit")
+def _drafts_committed(session):
+    session.info.pop("taken_drafts", None)
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _drafts_not_committed(session, transaction):
+    if transaction.parent is None:
+        for buffer, medical_file_id, entry in session.info.pop("taken_drafts", ()):
+            buffer.restore(medical_file_id, entry)
+
+
+def _build_store():
+    store_path = os.getenv("DRAFT_STORE")
+    if store_path:
+        module_name, _, class_name = store_path.partition(":")
+        store_class = getattr(importlib.import_module(module_name), class_name)
+        if not (isinstance(store_class, type) and issubclass(store_class, DraftStore)):
+            raise TypeError(f"DRAFT_STORE={store_path} debe ser una subclase de api.drafts.DraftStore")
+        return store_class()
+    if os.getenv("DRAFT_DIR"):
+        return FileDraftStore(os.getenv("DRAFT_DIR"))
+    return MemoryDraftStore()
+
+
+def setup_drafts(app):
+    """Crea el buffer de borradores del proceso (app.extensions["drafts"])."""
+    app.config.setdefault("DRAFT_FLUSH_SECONDS", float(os.getenv("DRAFT_FLUSH_SECONDS", "10")))
+    buffer = DraftBuffer(_build_store(), app.config["DRAFT_FLUSH_SECONDS"])
+    app.extensions["drafts"] = buffer
+
+    if isinstance(buffer.store, MemoryDraftStore):
+        @atexit.register
+        def _flush_on_exit():
+            with app.app_context():
+                buffer.flush_seconds = 0
+                buffer.flush_due()
+
+    return buffer
+
+
+def drafts():
+    """Buffer de la app actual (lo crea con la configuración por defecto si falta)."""
+    buffer = current_app.extensions.get("drafts")
+    if buffer is None:
+        buffer = setup_drafts(current_app._get_current_object())
+    return buffer
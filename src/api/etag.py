@@ -0,0 +1,119 @@
+"""
+GET condicional con ETags débiles.
+
+Los endpoints de lectura que el cliente consulta en bucle declaran un
+"marcador": una función barata (una consulta agregada, sin cargar el grafo
+de objetos) que devuelve una tupla que cambia cuando cambia la respuesta,
+p. ej. (count, max(updated_at)) de un listado. El ETag es un hash de:
+
+    endpoint + identidad JWT + marcador
+
+Si la cabecera If-None-Match del cliente coincide se responde 304 sin
+ejecutar la vista (ni consultar ni serializar). Si el marcador devuelve None
+(p. ej. recurso inexistente o ajeno) se ejecuta la vista sin ETag para que
+responda su 404/403 habitual.
+
+Uso (debajo del decorador de rol, que valida el JWT antes):
+
+    @api.route('/student/assigned_patients', methods=['GET'])
+    @student_required
+    @conditional(lambda: files_marker(...))
+    def get_assigned_patients(): ...
+
+Escrituras condicionales (concurrencia optimista): el cliente envía la
+`version` del expediente que leyó, en `If-Match: "<version>"` o como
+`"version"` en el body JSON. GET /medical_file/<id> usa
+`conditional(..., strong_version=True)` y devuelve justo ese ETag fuerte, así
+que basta con reenviarlo; If-Match se compara en modo fuerte (un ETag débil
+nunca coincide y se rechaza con 400). check_version() responde 409 si ya no es la
+actual. Si el cambio concurrente ocurre entre la lectura y el commit, el
+UPDATE versionado (version_id_col) lanza StaleDataError y el blueprint lo
+traduce también a 409.
+"""
+
+import hashlib
+from functools import wraps
+
+from flask import current_app, g, jsonify, make_response, request
+
+from api.database import current_identity
+
+
+def weak_etag(*parts):
+    """Hash corto y estable de las partes del marcador."""
+    raw = "|".join("" if p is None else str(p) for p in parts)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:20]
+
+
+def conditional(marker, strong_version=False):
+    """Decorador: responde 304 si el ETag del marcador coincide con If-None-Match.
+
+    Con strong_version=True el último elemento del marcador es la versión del
+    expediente y el ETag es fuerte: `"<version>"`, el mismo valor que aceptan
+    If-Match y check_version(). Sólo vale para respuestas que no dependen de
+    quién las pide.
+    """
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            parts = marker(*args, **kwargs)
+            # Disponible para la vista (api/cache.cached lo usa como clave)
+            g.etag_marker = parts
+            if parts is None:
+                return fn(*args, **kwargs)
+
+            if strong_version:
+                etag, weak = str(parts[-1]), False
+            else:
+                etag, weak = weak_etag(request.endpoint, current_identity(), *parts), True
+            if request.if_none_match.contains_weak(etag):
+                response = current_app.response_class(status=304)
+                response.set_etag(etag, weak=weak)
+                return response
+
+            response = make_response(fn(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag, weak=weak)
+                # El cliente debe revalidar siempre: el ETag sólo ahorra el cuerpo
+                response.headers.setdefault("Cache-Control", "private, no-cache")
+            return response
+        return wrapper
+    return decorator
+
+
+def requested_version():
+    """Versión que el cliente dice haber leído (None si no envió ninguna).
+
+    If-Match se compara en modo fuerte: sólo cuentan los ETags fuertes. Lanza
+    ValueError si el valor no es un entero o si sólo llegaron ETags débiles.
+    """
+    if request.if_match and not request.if_match.star_tag:
+        tags = request.if_match.as_set()
+        if not tags:
+            raise ValueError("If-Match sin ETag fuerte")
+        return int(next(iter(tags)))
+    body = request.get_json(silent=True)
+    if isinstance(body, dict) and body.get("version") is not None:
+        return int(body["version"])
+    return None
+
+
+VERSION_ERROR = 'If-Match debe ser el ETag fuerte del expediente ("<version>") y version un entero'
+
+
+def version_conflict(current_version=None):
+    payload = {"error": "El expediente fue modificado por otra sesión; recarga y vuelve a intentar"}
+    if current_version is not None:
+        payload["current_version"] = current_version
+    return jsonify(payload), 409
+
+
+def check_version(current_version):
+    """None si el cliente no envió versión o coincide; si no, la respuesta 409 (400 si es inválida)."""
+    try:
+        expected = requested_version()
+    except (TypeError, ValueError):
+        return jsonify({"error": VERSION_ERROR}), 400
+    if expected is None or expected == current_version:
+        return None
+    return version_conflict(current_version)
@@ -0,0 +1,151 @@
+"""
+Instrumentación de SQL por request.
+
+Escucha before/after_cursor_execute de todos los engines y acumula en `g`:
+número de sentencias, tiempo total en base de datos y las sentencias más
+lentas. Al terminar el request:
+
+- En desarrollo (FLASK_DEBUG=1) se añaden cabeceras X-DB-Query-Count,
+  X-DB-Time-Ms y X-DB-Slow-Request.
+- Los requests que superan los umbrales se registran como WARNING con sus
+  sentencias lentas (el resto en DEBUG); el formato lo pone api/logs.py.
+
+Umbrales (variables de entorno):
+
+- DB_SLOW_REQUEST_QUERIES  máximo de sentencias por request (default 30)
+- DB_SLOW_REQUEST_MS       máximo de tiempo de DB por request en ms (default 500)
+- DB_SLOW_QUERY_MS         una sentencia individual se considera lenta (default 100)
+"""
+
+import heapq
+import logging
+import os
+import time
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+
+def _threshold_ms(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return float(default)
+
+
+SLOW_QUERY_MS = _threshold_ms("DB_SLOW_QUERY_MS", 100)
+
+# Sentencias lentas que se conservan por request
+SLOWEST_KEPT = 5
+STATEMENT_PREVIEW_CHARS = 300
+
+
+class RequestQueryStats:
+    """Acumulador de sentencias SQL de un request."""
+
+    __slots__ = ("count", "total", "_slowest", "_seq")
+
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self._slowest = []
+        self._seq = 0
+
+    def record(self, statement, elapsed):
+        self.count += 1
+        self.total += elapsed
+        self._seq += 1
+        item = (elapsed, self._seq, statement)
+        if len(self._slowest) < SLOWEST_KEPT:
+            heapq.heappush(self._slowest, item)
+        elif elapsed > self._slowest[0][0]:
+            heapq.heapreplace(self._slowest, item)
+
+    @property
+    def total_ms(self):
+        return self.total * 1000
+
+    def slowest(self):
+        return [
+            {"ms": round(elapsed * 1000, 3), "sql": " ".join(statement.split())[:STATEMENT_PREVIEW_CHARS]}
+            for elapsed, _seq, statement in sorted(self._slowest, reverse=True)
+        ]
+
+
+def current_query_stats():
+    """Stats del request en curso (None fuera de un request instrumentado)."""
+    if not has_request_context():
+        return None
+    return g.get("db_query_stats")
+
+
+@event.listens_for(Engine, "before_cursor_execute")
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, "after_cursor_execute")
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get("query_start")
+    if not starts:
+        return
+    elapsed = time.perf_counter() - starts.pop()
+    stats = current_query_stats()
+    if stats is not None:
+        stats.record(statement, elapsed)
+    if elapsed * 1000 >= SLOW_QUERY_MS:
+        logger.warning("Sentencia lenta (%.1f ms): %s", elapsed * 1000,
+                       " ".join(statement.split())[:STATEMENT_PREVIEW_CHARS])
+
+
+@event.listens_for(Engine, "handle_error")
+def _discard_failed_start(context):
+    # Una sentencia que falla no llega a after_cursor_execute: sin esto su inicio
+    # quedaría en conn.info, que vive tanto como la conexión del pool. Una
+    # conexión ejecuta una sentencia a la vez, así que no queda ninguna en curso.
+    if context.connection is not None:
+        context.connection.info.pop("query_start", None)
+
+
+def setup_query_instrumentation(app):
+    """Registra los hooks de request que publican las métricas SQL."""
+    app.config.setdefault("DB_STATS_HEADERS", os.getenv("FLASK_DEBUG") == "1")
+    app.config.setdefault("DB_SLOW_REQUEST_QUERIES", int(_threshold_ms("DB_SLOW_REQUEST_QUERIES", 30)))
+    app.config.setdefault("DB_SLOW_REQUEST_MS", _threshold_ms("DB_SLOW_REQUEST_MS", 500))
+
+    @app.before_request
+    def _start_query_stats():
+        g.db_query_stats = RequestQueryStats()
+
+    @app.after_request
+    def _publish_query_stats(response):
+        stats = g.get("db_query_stats")  # también lo lee api/metrics.py
+        if stats is None:
+            return response
+
+        slow = (stats.count > app.config["DB_SLOW_REQUEST_QUERIES"]
+                or stats.total_ms > app.config["DB_SLOW_REQUEST_MS"])
+
+        if app.config["DB_STATS_HEADERS"]:
+            response.headers["X-DB-Query-Count"] = str(stats.count)
+            response.headers["X-DB-Time-Ms"] = f"{stats.total_ms:.2f}"
+            if slow:
+                response.headers["X-DB-Slow-Request"] = "1"
+
+        # El registro "request" de api/logs.py ya lleva los totales; aquí sólo
+        # el detalle de los requests lentos (WARNING) y, en debug, de todos.
+        fields = {
+            "status": response.status_code,
+            "db_queries": stats.count,
+            "db_time_ms": round(stats.total_ms, 3),
+            "slow": slow,
+        }
+        if slow:
+            fields["slowest"] = stats.slowest()
+            logger.warning("request_db_stats", extra={"fields": fields})
+        else:
+            logger.debug("request_db_stats", extra={"fields": fields})
+        return response
@@ -0,0 +1,151 @@
+"""
+Logging estructurado y no bloqueante.
+
+- Los registros se encolan (QueueHandler) y un hilo (QueueListener) los
+  escribe en stdout: el request nunca espera por la escritura.
+- Formato JSON (LOG_FORMAT=json, default en producción) o texto legible
+  (LOG_FORMAT=text, default con FLASK_DEBUG=1).
+- Cada registro emitido dentro de un request lleva request_id, user_id,
+  method y route. El request_id se toma de la cabecera X-Request-ID o se
+  genera, y se devuelve en la respuesta.
+- Al terminar cada request se emite un registro "request" con status,
+  duration_ms y las métricas SQL de api/instrumentation.py.
+- LOG_LEVEL (default INFO; DEBUG con FLASK_DEBUG=1). Los logger.debug(...)
+  con argumentos diferidos no cuestan nada cuando el nivel es INFO.
+
+Campos adicionales: logger.info("mensaje", extra={"fields": {...}}).
+"""
+
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+from flask import g, has_request_context, request
+
+from api.database import current_identity
+from api.instrumentation import current_query_stats
+
+REQUEST_ID_HEADER = "X-Request-ID"
+
+logger = logging.getLogger("api.request")
+
+_listener = None
+
+
+class RequestContextFilter(logging.Filter):
+    """Agrega los datos del request en curso (corre en el hilo del request)."""
+
+    def filter(self, record):
+        if has_request_context():
+            record.request_id = g.get("request_id")
+            record.user_id = current_identity()
+            record.method = request.method
+            record.route = request.url_rule.rule if request.url_rule else request.path
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    CONTEXT_FIELDS = ("request_id", "user_id", "method", "route")
+
+    def format(self, record):
+        payload = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for field in self.CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                payload[field] = value
+        payload.update(getattr(record, "fields", None) or {})
+        if record.exc_info:
+            payload["exc"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            payload["exc"] = record.exc_text
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+class TextFormatter(logging.Formatter):
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)s [%(name)s] %(message)s")
+
+    def format(self, record):
+        line = super().format(record)
+        context = {f: getattr(record, f, None) for f in JsonFormatter.CONTEXT_FIELDS}
+        context.update(getattr(record, "fields", None) or {})
+        extras = " ".join(f"{k}={v}" for k, v in context.items() if v is not None)
+        return f"{line} {extras}" if extras else line
+
+
+class _StructuredQueueHandler(QueueHandler):
+    """QueueHandler que conserva los campos del registro en vez de aplanarlo a texto."""
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def configure_logging(level=None, fmt=None, stream=None):
+    """Instala el QueueHandler en el logger raíz (una vez por proceso)."""
+    global _listener
+    debug = os.getenv("FLASK_DEBUG") == "1"
+    level = level or os.getenv("LOG_LEVEL") or ("DEBUG" if debug else "INFO")
+    fmt = fmt or os.getenv("LOG_FORMAT") or ("text" if debug else "json")
+
+    root = logging.getLogger()
+    root.setLevel(level.upper())
+    if _listener is not None:
+        return root
+
+    output = logging.StreamHandler(stream or sys.stdout)
+    output.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+    records = queue.SimpleQueue()
+    handler = _StructuredQueueHandler(records)
+    handler.addFilter(RequestContextFilter())
+    root.addHandler(handler)
+
+    _listener = QueueListener(records, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_listener.stop)
+    return root
+
+
+def setup_logging(app):
+    """Configura el logging del proceso y los hooks de request_id y log por request."""
+    configure_logging()
+
+    @app.before_request
+    def _start_request_log():
+        g.request_id = request.headers.get(REQUEST_ID_HEADER) or uuid.uuid4().hex
+        g.request_started = time.perf_counter()
+
+    @app.after_request
+    def _finish_request_log(response):
+        started = g.get("request_started")
+        if started is None:
+            return response
+        response.headers[REQUEST_ID_HEADER] = g.request_id
+        fields = {
+            "status": response.status_code,
+            "duration_ms": round((time.perf_counter() - started) * 1000, 3),
+        }
+        stats = current_query_stats()
+        if stats is not None:
+            fields["db_queries"] = stats.count
+            fields["db_time_ms"] = round(stats.total_ms, 3)
+        logger.info("request", extra={"fields": fields})
+        return response
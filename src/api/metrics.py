@@ -0,0 +1,284 @@
+"""
+Métricas HTTP por endpoint en formato de texto de Prometheus (/metrics).
+
+Por cada (método, ruta) se acumulan:
+
+- http_requests_total{status}        peticiones por código de estado
+- http_request_duration_seconds      histograma de latencia
+- http_response_size_bytes           histograma de tamaño de respuesta
+- http_request_db_seconds            histograma de tiempo en base de datos
+                                     (de api/instrumentation.py)
+- http_request_db_queries_total      sentencias SQL emitidas
+
+La ruta es la regla de Flask (p. ej. /api/medical_file/<int:file_id>), no la
+URL, para no disparar la cardinalidad; lo que no coincide con ninguna regla
+se agrupa en "<unmatched>".
+
+Varios workers (gunicorn): con METRICS_DIR cada proceso vuelca su estado a
+METRICS_DIR/metrics_<pid>.json (como mucho cada METRICS_FLUSH_SECONDS y al
+salir) y /metrics suma los archivos de todos los workers. Los contadores de
+workers ya terminados se conservan, como hace el modo multiproceso del
+cliente oficial; vacía el directorio antes de arrancar gunicorn.
+
+Variables de entorno:
+
+- METRICS_ENABLED        1 (default) / 0
+- METRICS_DIR            directorio compartido entre workers (opcional)
+- METRICS_FLUSH_SECONDS  intervalo mínimo entre volcados (default 5)
+- METRICS_TOKEN          si se define, /metrics exige "Authorization: Bearer <token>".
+                         Obligatorio fuera de desarrollo (FLASK_DEBUG != 1): sin
+                         él las métricas no se registran, para no publicar el
+                         tráfico por ruta sin autenticación.
+"""
+
+import atexit
+import glob
+import json
+import logging
+import os
+import threading
+import time
+
+from flask import Response, g, request
+
+from api.instrumentation import current_query_stats
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (100, 1000, 10_000, 100_000, 1_000_000, 10_000_000)
+
+UNMATCHED_ROUTE = "<unmatched>"
+
+
+class Histogram:
+    """Histograma acumulativo estilo Prometheus (conteos por bucket + suma)."""
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # el último es +Inf
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                break
+        else:
+            i = len(self.buckets)
+        self.counts[i] += 1
+        self.sum += value
+
+    @property
+    def count(self):
+        return sum(self.counts)
+
+    def merge(self, data):
+        for i, n in enumerate(data["counts"]):
+            self.counts[i] += n
+        self.sum += data["sum"]
+
+    def to_dict(self):
+        return {"counts": self.counts, "sum": self.sum}
+
+
+class RouteStats:
+    __slots__ = ("statuses", "latency", "size", "db_time", "db_queries")
+
+    def __init__(self):
+        self.statuses = {}
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        self.db_time = Histogram(LATENCY_BUCKETS)
+        self.db_queries = 0
+
+    def merge(self, data):
+        for status, n in data["statuses"].items():
+            self.statuses[status] = self.statuses.get(status, 0) + n
+        self.latency.merge(data["latency"])
+        self.size.merge(data["size"])
+        self.db_time.merge(data["db_time"])
+        self.db_queries += data["db_queries"]
+
+    def to_dict(self):
+        return {
+            "statuses": self.statuses,
+            "latency": self.latency.to_dict(),
+            "size": self.size.to_dict(),
+            "db_time": self.db_time.to_dict(),
+            "db_queries": self.db_queries,
+        }
+
+
+class MetricsRegistry:
+    """Estado de métricas de este proceso y volcado/lectura del directorio compartido."""
+
+    def __init__(self, directory=None, flush_seconds=5.0):
+        self.directory = directory
+        self.flush_seconds = flush_seconds
+        self._routes = {}
+        self._lock = threading.Lock()
+        self._last_flush = 0.0
+
+    def observe(self, method, route, status, seconds, size, db_seconds, db_queries):
+        with self._lock:
+            stats = self._routes.get((method, route))
+            if stats is None:
+                stats = self._routes[(method, route)] = RouteStats()
+            key = str(status)
+            stats.statuses[key] = stats.statuses.get(key, 0) + 1
+            stats.latency.observe(seconds)
+            stats.size.observe(size)
+            stats.db_time.observe(db_seconds)
+            stats.db_queries += db_queries
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_seconds:
+            self.flush()
+
+    def snapshot(self):
+        with self._lock:
+            return [{"method": m, "route": r, **stats.to_dict()} for (m, r), stats in self._routes.items()]
+
+    # ---- Multiproceso ----
+    def _own_path(self):
+        return os.path.join(self.directory, f"metrics_{os.getpid()}.json")
+
+    def flush(self):
+        """Escribe el estado de este worker (reemplazo atómico del archivo)."""
+        if not self.directory:
+            return
+        self._last_flush = time.monotonic()
+        path = self._own_path()
+        tmp = f"{path}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp, "w") as fh:
+                json.dump(self.snapshot(), fh)
+            os.replace(tmp, path)
+        except OSError:
+            pass
+
+    def collect(self):
+        """Suma el estado propio (en memoria) con los volcados de los demás workers."""
+        merged = {}
+        sources = [self.snapshot()]
+        if self.directory:
+            own = self._own_path()
+            for path in glob.glob(os.path.join(self.directory, "metrics_*.json")):
+                if path == own:
+                    continue
+                try:
+                    with open(path) as fh:
+                        sources.append(json.load(fh))
+                except (OSError, ValueError):
+                    continue
+        for rows in sources:
+            for row in rows:
+                key = (row["method"], row["route"])
+                if key not in merged:
+                    merged[key] = RouteStats()
+                merged[key].merge(row)
+        return merged
+
+
+# -------------------- Formato de exposición --------------------
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(**labels):
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_bound(bound):
+    return repr(float(bound)) if isinstance(bound, float) else str(bound)
+
+
+def _histogram_lines(name, hist, labels):
+    lines = []
+    cumulative = 0
+    for bound, n in zip(hist.buckets, hist.counts):
+        cumulative += n
+        lines.append(f"{name}_bucket{_labels(**labels, le=_format_bound(bound))} {cumulative}")
+    lines.append(f'{name}_bucket{_labels(**labels, le="+Inf")} {hist.count}')
+    lines.append(f"{name}_sum{_labels(**labels)} {hist.sum}")
+    lines.append(f"{name}_count{_labels(**labels)} {hist.count}")
+    return lines
+
+
+def render_prometheus(merged):
+    out = [
+        "# HELP http_requests_total Peticiones HTTP atendidas.",
+        "# TYPE http_requests_total counter",
+    ]
+    ordered = sorted(merged.items())
+    for (method, route), stats in ordered:
+        for status, n in sorted(stats.statuses.items()):
+            out.append(f"http_requests_total{_labels(method=method, route=route, status=status)} {n}")
+
+    for name, attr, help_text in (
+        ("http_request_duration_seconds", "latency", "Latencia de la petición en segundos."),
+        ("http_response_size_bytes", "size", "Tamaño del cuerpo de la respuesta en bytes."),
+        ("http_request_db_seconds", "db_time", "Tiempo en base de datos por petición en segundos."),
+    ):
+        out.append(f"# HELP {name} {help_text}")
+        out.append(f"# TYPE {name} histogram")
+        for (method, route), stats in ordered:
+            out.extend(_histogram_lines(name, getattr(stats, attr), {"method": method, "route": route}))
+
+    out.append("# HELP http_request_db_queries_total Sentencias SQL emitidas.")
+    out.append("# TYPE http_request_db_queries_total counter")
+    for (method, route), stats in ordered:
+        out.append(f"http_request_db_queries_total{_labels(method=method, route=route)} {stats.db_queries}")
+    return "\n".join(out) + "\n"
+
+
+# -------------------- Integración con Flask --------------------
+def setup_metrics(app):
+    """Registra el middleware de tiempos y la ruta /metrics."""
+    app.config.setdefault("METRICS_ENABLED", os.getenv("METRICS_ENABLED", "1") == "1")
+    app.config.setdefault("METRICS_DIR", os.getenv("METRICS_DIR") or None)
+    app.config.setdefault("METRICS_FLUSH_SECONDS", float(os.getenv("METRICS_FLUSH_SECONDS", "5")))
+    app.config.setdefault("METRICS_TOKEN", os.getenv("METRICS_TOKEN") or None)
+    app.config.setdefault("METRICS_REQUIRE_TOKEN", os.getenv("FLASK_DEBUG") != "1")
+    if not app.config["METRICS_ENABLED"]:
+        return None
+    if app.config["METRICS_REQUIRE_TOKEN"] and not app.config["METRICS_TOKEN"]:
+        logger.warning("METRICS_TOKEN no definido: /metrics no se registra fuera de desarrollo")
+        return None
+
+    registry = MetricsRegistry(app.config["METRICS_DIR"], app.config["METRICS_FLUSH_SECONDS"])
+    app.extensions["metrics"] = registry
+    if registry.directory:
+        atexit.register(registry.flush)
+
+    @app.before_request
+    def _start_timer():
+        g.metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_metrics(response):
+        start = g.pop("metrics_start", None)
+        if start is None:
+            return response
+        stats = current_query_stats()
+        registry.observe(
+            request.method,
+            request.url_rule.rule if request.url_rule else UNMATCHED_ROUTE,
+            response.status_code,
+            time.perf_counter() - start,
+            response.content_length or 0,  # sin leer respuestas en streaming
+            stats.total if stats else 0.0,
+            stats.count if stats else 0,
+        )
+        return response
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        token = app.config["METRICS_TOKEN"]
+        if token and request.headers.get("Authorization") != f"Bearer {token}":
+            return Response("unauthorized\n", status=401, mimetype="text/plain")
+        return Response(render_prometheus(registry.collect()),
+                        mimetype="text/plain; version=0.0.4; charset=utf-8")
+
+    return registry
@@ -1,12 +1,15 @@
 # -------------------- INICIALIZACIÓN DE LA BASE DE DATOS --------------------
 
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import String, Integer, Boolean, DateTime, ForeignKey, Enum, Text, func
-from sqlalchemy.orm import Mapped, mapped_column, relationship
+from sqlalchemy import String, Integer, Boolean, DateTime, ForeignKey, Enum, Text, func, event
+from sqlalchemy.orm import Mapped, mapped_column, relationship, declared_attr, attributes
+from sqlalchemy.dialects.postgresql import JSONB
 from datetime import datetime, date, timezone
 import enum
+from api.database import RoutingSession
 
-db = SQLAlchemy()
+# RoutingSession envía las lecturas de requests GET a la réplica (si está configurada)
+db = SQLAlchemy(session_options={"class_": RoutingSession})
 
 
 # -------------------- SERIALIZACIÓN DE DATETIME --------------------
@@ -16,6 +19,23 @@ def serialize_datetime(value):
         return None
     return value.isoformat()
 
+# -------------------- VERSIÓN DE FILA --------------------
+class VersionedMixin:
+    """updated_at + version para el expediente y sus antecedentes.
+
+    `version` es el version_id_col del mapper: SQLAlchemy lo incrementa en
+    cada UPDATE y agrega `WHERE version = <leída>`, así que una escritura
+    sobre una fila que otro ya cambió lanza StaleDataError en vez de pisarla.
+    updated_at lo mantiene _touch_medical_files (al final del módulo).
+    """
+    updated_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), nullable=False)
+    version = db.Column(db.Integer, default=1, nullable=False)
+
+    @declared_attr.directive
+    def __mapper_args__(cls):
+        return {"version_id_col": cls.version}
+
+
 # -------------------- ENUMS PERSONALIZADOS --------------------
 class UserRole(str, enum.Enum):
     admin = "admin"
@@ -100,8 +120,11 @@ class User(db.Model):
     phone: Mapped[str] = mapped_column(String(20), nullable=True)
     email: Mapped[str] = mapped_column(String(30), unique=True, nullable=False)
     password: Mapped[str] = mapped_column(String(200), nullable=False)
-    role: Mapped[UserRole] = mapped_column(Enum(UserRole), nullable=False)
-    status: Mapped[UserStatus] = mapped_column(Enum(UserStatus), nullable=False, default=UserStatus.pre_approved)
+    # active_history: los contadores de api/stats.py restan el valor anterior,
+    # que así se carga al asignar aunque el atributo estuviera expirado
+    role: Mapped[UserRole] = mapped_column(Enum(UserRole), nullable=False, index=True, active_history=True)
+    status: Mapped[UserStatus] = mapped_column(Enum(UserStatus), nullable=False, default=UserStatus.pre_approved,
+                                               index=True, active_history=True)
 
     # Relaciones
     professional_student_data: Mapped["ProfessionalStudentData"] = relationship(
@@ -151,7 +174,8 @@ class ProfessionalStudentData(db.Model):
     register_number: Mapped[str] = mapped_column(String(30), nullable=False)
 
     # -------- VALIDACIÓN DEL ADMIN AL PROFESSIONAL --------
-    validated_by_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=True)  
+    # active_history: ver User.role (api/stats.py cuenta estudiantes por profesional)
+    validated_by_id: Mapped[int] = mapped_column(ForeignKey("users.id"), nullable=True, active_history=True)
     validated_at: Mapped[datetime] = mapped_column(DateTime, nullable=True)
     
     validated_by: Mapped["User"] = relationship(
@@ -217,15 +241,22 @@ class ProfessionalStudentData(db.Model):
         }
 
 
+# Relaciones 1:1 de antecedentes del expediente (mismo nombre que su tabla)
+BACKGROUND_SECTIONS = ("non_pathological_background", "pathological_background",
+                       "family_background", "gynecological_background")
+
+
 # -------------------- MODELO: MEDICAL FILE --------------------
-class MedicalFile(db.Model):
+class MedicalFile(VersionedMixin, db.Model):
     __tablename__ = "medical_file"
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     user = relationship("User", back_populates="medical_file", foreign_keys=[user_id])
 
-    file_status = db.Column(Enum(FileStatus), default=FileStatus.empty, nullable=False)
+    # active_history: ver User.role (api/stats.py cuenta expedientes por estado)
+    file_status = mapped_column(Enum(FileStatus), default=FileStatus.empty, nullable=False, index=True,
+                                active_history=True)
 
     selected_student_id = db.Column(db.Integer, db.ForeignKey('users.id'))
     selected_student = relationship("User", foreign_keys=[selected_student_id])
@@ -272,6 +303,12 @@ class MedicalFile(db.Model):
     family_background = relationship("FamilyBackground", uselist=False, back_populates="medical_file")
     gynecological_background = relationship("GynecologicalBackground", uselist=False, back_populates="medical_file")
 
+    # Almacenamiento consolidado (BACKGROUNDS_STORAGE=document, ver api/backgrounds.py):
+    # si no es NULL, el documento reemplaza a las cuatro tablas de antecedentes del expediente
+    backgrounds_doc = db.Column(db.JSON(none_as_null=True).with_variant(JSONB(none_as_null=True), "postgresql"))
+    # Copias indexadas de campos del documento que se usan para filtrar
+    blood_type = db.Column(db.String(5), index=True)
+    family_diabetes = db.Column(db.Boolean, index=True)
 
     snapshots = relationship(
         "MedicalFileSnapshot",
@@ -303,12 +340,20 @@ class MedicalFile(db.Model):
             "confirmed_at": serialize_datetime(self.confirmed_at),
             "no_confirmed_by_id": self.no_confirmed_by_id,
             "no_confirmed_at": serialize_datetime(self.no_confirmed_at),
-            "non_pathological_background": self.non_pathological_background.serialize() if self.non_pathological_background else None,
-            "pathological_background": self.pathological_background.serialize() if self.pathological_background else None,
-            "family_background": self.family_background.serialize() if self.family_background else None,
-            "gynecological_background": self.gynecological_background.serialize() if self.gynecological_background else None,
+            "updated_at": serialize_datetime(self.updated_at),
+            "version": self.version,
+            **self.serialize_backgrounds(),
         }
 
+    def serialize_backgrounds(self):
+        """Los cuatro antecedentes, del documento si el expediente lo usa (sin tocar las tablas)."""
+        if self.backgrounds_doc is not None:
+            return {name: {**self.backgrounds_doc[name], "medical_file_id": self.id}
+                    if self.backgrounds_doc.get(name) else None
+                    for name in BACKGROUND_SECTIONS}
+        return {name: getattr(self, name).serialize() if getattr(self, name) else None
+                for name in BACKGROUND_SECTIONS}
+
 
 # -------------------- MODELO: MedicalFileSnapshot --------------------
 
@@ -346,11 +391,12 @@ class MedicalFileSnapshot(db.Model):
 
 
 # -------------------- MODELO: NonPathologicalBackground --------------------
-class NonPathologicalBackground(db.Model):
+class NonPathologicalBackground(VersionedMixin, db.Model):
     __tablename__ = "non_pathological_background"
 
     id = db.Column(db.Integer, primary_key=True)
-    medical_file_id = db.Column(db.Integer, db.ForeignKey('medical_file.id'), nullable=False)
+    # Una sola fila por expediente: el upsert de antecedentes hace ON CONFLICT sobre esta columna
+    medical_file_id = db.Column(db.Integer, db.ForeignKey('medical_file.id'), nullable=False, unique=True)
     medical_file = relationship("MedicalFile", back_populates="non_pathological_background")
 
     sex = db.Column(db.String(20))
@@ -411,6 +457,8 @@ class NonPathologicalBackground(db.Model):
         return {
             "id": self.id,
             "medical_file_id": self.medical_file_id,
+            "updated_at": serialize_datetime(self.updated_at),
+            "version": self.version,
             "sex": self.sex,
             "nationality": self.nationality,
             "ethnic_group": self.ethnic_group,
@@ -459,11 +507,11 @@ class NonPathologicalBackground(db.Model):
         }
 
 # -------------------- MODELO: PathologicalBackground --------------------
-class PathologicalBackground(db.Model):
+class PathologicalBackground(VersionedMixin, db.Model):
     __tablename__ = "pathological_background"
 
     id = db.Column(db.Integer, primary_key=True)
-    medical_file_id = db.Column(db.Integer, db.ForeignKey('medical_file.id'), nullable=False)
+    medical_file_id = db.Column(db.Integer, db.ForeignKey('medical_file.id'), nullable=False, unique=True)
     medical_file = relationship("MedicalFile", back_populates="pathological_background")
 
     disability_description = db.Column(db.Text)
@@ -485,6 +533,8 @@ class PathologicalBackground(db.Model):
         return {
             "id": self.id,
             "medical_file_id": self.medical_file_id,
+            "updated_at": serialize_datetime(self.updated_at),
+            "version": self.version,
             "disability_description": self.disability_description,
             "visual_disability": self.visual_disability,
             "hearing_disability": self.hearing_disability,
@@ -501,11 +551,11 @@ class PathologicalBackground(db.Model):
         }
 
 # -------------------- MODELO: FamilyBackground --------------------
-class FamilyBackground(db.Model):
+class FamilyBackground(VersionedMixin, db.Model):
     __tablename__ = "family_background"
 
     id = db.Column(db.Integer, primary_key=True)
-    medical_file_id = db.Column(db.Integer, db.ForeignKey('medical_file.id'), nullable=False)
+    medical_file_id = db.Column(db.Integer, db.ForeignKey('medical_file.id'), nullable=False, unique=True)
     medical_file = relationship("MedicalFile", back_populates="family_background")
 
     hypertension = db.Column(db.Boolean, default=False)
@@ -522,6 +572,8 @@ class FamilyBackground(db.Model):
         return {
             "id": self.id,
             "medical_file_id": self.medical_file_id,
+            "updated_at": serialize_datetime(self.updated_at),
+            "version": self.version,
             "hypertension": self.hypertension,
             "diabetes": self.diabetes,
             "cancer": self.cancer,
@@ -534,11 +586,11 @@ class FamilyBackground(db.Model):
         }
 
 # -------------------- MODELO: GynecologicalBackground --------------------
-class GynecologicalBackground(db.Model):
+class GynecologicalBackground(VersionedMixin, db.Model):
     __tablename__ = "gynecological_background"
 
     id = db.Column(db.Integer, primary_key=True)
-    medical_file_id = db.Column(db.Integer, db.ForeignKey('medical_file.id'), nullable=False)
+    medical_file_id = db.Column(db.Integer, db.ForeignKey('medical_file.id'), nullable=False, unique=True)
     medical_file = relationship("MedicalFile", back_populates="gynecological_background")
 
     menarche_age = db.Column(db.Integer)
@@ -553,6 +605,8 @@ class GynecologicalBackground(db.Model):
         return {
             "id": self.id,
             "medical_file_id": self.medical_file_id,
+            "updated_at": serialize_datetime(self.updated_at),
+            "version": self.version,
             "menarche_age": self.menarche_age,
             "pregnancies": self.pregnancies,
             "births": self.births,
@@ -560,4 +614,64 @@ class GynecologicalBackground(db.Model):
             "abortions": self.abortions,
             "contraceptive_methods": self.contraceptive_methods,
             "other_gynecological_info": self.other_gynecological_info
-        }
\ No newline at end of file
+        }
+
+
+# -------------------- MODELO: ClinicalSearchEntry --------------------
+class ClinicalSearchEntry(db.Model):
+    """Texto libre de los antecedentes de un expediente, para la búsqueda clínica.
+
+    Una fila por expediente; la mantiene api/search.py al hacer commit.
+    """
+    __tablename__ = "clinical_search"
+
+    medical_file_id = db.Column(db.Integer, db.ForeignKey('medical_file.id', ondelete="CASCADE"), primary_key=True)
+    body = db.Column(db.Text, nullable=False)
+    updated_at = db.Column(db.DateTime, nullable=False)
+
+
+# -------------------- MODELO: StatsCounter --------------------
+class StatsCounter(db.Model):
+    """Contador materializado de GET /api/stats (STATS_MATERIALIZED=1, ver api/stats.py)."""
+    __tablename__ = "stats_counter"
+
+    name = db.Column(db.String(80), primary_key=True)
+    value = db.Column(db.Integer, nullable=False, default=0)
+
+
+# -------------------- MARCA DE CAMBIOS DEL EXPEDIENTE --------------------
+FILE_CHILDREN = (NonPathologicalBackground, PathologicalBackground, FamilyBackground,
+                 GynecologicalBackground, MedicalFileSnapshot)
+# Datos del paciente que GET /medical_file/<id> devuelve junto con su expediente
+PATIENT_FIELDS = ("first_name", "second_name", "first_surname", "second_surname", "birth_day", "email", "phone")
+
+
+@event.listens_for(RoutingSession, "before_flush")
+def _touch_medical_files(session, flush_context, instances):
+    """Mantiene updated_at (y con él, version) en cada escritura del expediente o sus hijos.
+
+    Un cambio en un antecedente o snapshot, o en los datos del paciente que
+    se devuelven con el expediente, también toca al MedicalFile, de modo que
+    su version/updated_at describen el expediente completo: es el marcador
+    de los ETags y el valor que se compara en If-Match.
+    """
+    now = datetime.now(timezone.utc)
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if obj in session.dirty and not session.is_modified(obj):
+            continue
+        if isinstance(obj, MedicalFile):
+            medical_file = obj
+        elif isinstance(obj, FILE_CHILDREN):
+            if isinstance(obj, VersionedMixin) and obj not in session.deleted:
+                obj.updated_at = now
+            # Los objetos nuevos creados sólo con medical_file_id no cargan la relación
+            medical_file = obj.medical_file or (
+                session.get(MedicalFile, obj.medical_file_id) if obj.medical_file_id else None)
+        elif isinstance(obj, User) and obj in session.dirty:
+            if not any(attributes.get_history(obj, name).has_changes() for name in PATIENT_FIELDS):
+                continue
+            medical_file = obj.medical_file
+        else:
+            continue
+        if medical_file is not None and medical_file not in session.deleted:
+            medical_file.updated_at = now
@@ -0,0 +1,165 @@
+"""
+Profiler por muestreo opcional para requests en producción.
+
+Un request se perfila si:
+
+- se sortea con probabilidad PROFILE_SAMPLE_RATE (0 = nunca, default), o
+- trae la cabecera `X-Profile: 1` con un JWT de admin.
+
+Mientras dura el request, un hilo muestrea la pila del hilo que lo atiende
+cada PROFILE_INTERVAL_MS (sys._current_frames) y al terminar se guarda la
+salida en formato "collapsed stacks" (una línea `f1;f2;f3 N` por pila), que
+abren directamente flamegraph.pl y speedscope:
+
+    PROFILE_DIR/<METODO>_<ruta>/<fecha>_<pid>_<ms>ms_<status>.collapsed
+
+Se conservan los PROFILE_KEEP archivos más recientes por ruta. Para los
+requests pedidos con cabecera, la respuesta incluye X-Profile-File con la
+ruta relativa del archivo.
+
+Sin perfilar el costo es una comparación y una lectura de cabecera por
+request; con muestreo, el hilo toma el GIL sólo en cada muestra.
+"""
+
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+
+from flask import g, request
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request
+
+PROFILE_HEADER = "X-Profile"
+
+
+def _env_float(name, default):
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return float(default)
+
+
+def _frame_label(code):
+    filename = code.co_filename
+    marker = "site-packages" + os.sep
+    if marker in filename:
+        filename = filename.split(marker, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})".replace(";", ":")
+
+
+class StackSampler:
+    """Muestrea la pila de un hilo desde un hilo auxiliar."""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self):
+        return "".join(f"{stack} {n}\n" for stack, n in self.samples.most_common())
+
+
+def route_slug(method, rule):
+    return f"{method}_{re.sub(r'[^A-Za-z0-9]+', '_', rule).strip('_') or 'root'}"
+
+
+def _is_admin_request():
+    from api.models import db, User, UserRole
+
+    try:
+        verify_jwt_in_request(optional=True)
+        identity = get_jwt_identity()
+    except Exception:
+        return False
+    if identity is None:
+        return False
+    try:
+        user = db.session.get(User, int(identity))
+    except (TypeError, ValueError):
+        return False
+    return bool(user and user.role == UserRole.admin)
+
+
+def _prune(directory, keep):
+    files = sorted(name for name in os.listdir(directory) if name.endswith(".collapsed"))
+    for name in files[:-keep] if keep > 0 else []:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+
+def setup_profiling(app):
+    """Registra los hooks del profiler (inactivo salvo muestreo o cabecera de admin)."""
+    app.config.setdefault("PROFILE_SAMPLE_RATE", _env_float("PROFILE_SAMPLE_RATE", 0))
+    app.config.setdefault("PROFILE_INTERVAL_MS", _env_float("PROFILE_INTERVAL_MS", 5))
+    app.config.setdefault("PROFILE_DIR", os.getenv("PROFILE_DIR") or os.path.join(os.getcwd(), "profiles"))
+    app.config.setdefault("PROFILE_KEEP", int(_env_float("PROFILE_KEEP", 50)))
+
+    @app.before_request
+    def _start_profiler():
+        rate = app.config["PROFILE_SAMPLE_RATE"]
+        requested = request.headers.get(PROFILE_HEADER) == "1"
+        if not requested and not (rate > 0 and random.random() < rate):
+            return
+        if requested and not _is_admin_request():
+            return
+        g.profiler = StackSampler(threading.get_ident(), app.config["PROFILE_INTERVAL_MS"] / 1000).start()
+        g.profiler_started = time.perf_counter()
+        g.profiler_requested = requested
+
+    @app.after_request
+    def _write_profile(response):
+        sampler = g.pop("profiler", None)
+        if sampler is None:
+            return response
+        sampler.stop()
+        elapsed_ms = (time.perf_counter() - g.pop("profiler_started")) * 1000
+        slug = route_slug(request.method, request.url_rule.rule if request.url_rule else "unmatched")
+        directory = os.path.join(app.config["PROFILE_DIR"], slug)
+        filename = (f"{datetime.now().strftime('%Y%m%dT%H%M%S%f')}_{os.getpid()}_"
+                    f"{elapsed_ms:.0f}ms_{response.status_code}.collapsed")
+        try:
+            os.makedirs(directory, exist_ok=True)
+            with open(os.path.join(directory, filename), "w") as fh:
+                fh.write(sampler.collapsed())
+            _prune(directory, app.config["PROFILE_KEEP"])
+        except OSError as e:
+            app.logger.warning("No se pudo guardar el perfil de %s: %s", slug, e)
+            return response
+        if g.pop("profiler_requested", False):
+            response.headers["X-Profile-File"] = f"{slug}/{filename}"
+        return response
+
+    @app.teardown_request
+    def _stop_profiler(exc):
+        # Si el request no llegó a after_request, no dejar el hilo vivo
+        sampler = g.pop("profiler", None)
+        if sampler is not None:
+            sampler.stop()
@@ -14,12 +14,20 @@ Notas clave:
 """
 
 from flask import Flask, request, jsonify, url_for, Blueprint, send_from_directory
+import logging
 import os
 import base64
 import uuid
 from werkzeug.utils import secure_filename
-from api.models import db, User, ProfessionalStudentData, MedicalFile, FileStatus, UserRole, UserStatus, GynecologicalBackground, NonPathologicalBackground, PathologicalBackground, FamilyBackground, MedicalFileSnapshot
+from api.models import db, User, ProfessionalStudentData, MedicalFile, FileStatus, UserRole, UserStatus, GynecologicalBackground, NonPathologicalBackground, PathologicalBackground, FamilyBackground, MedicalFileSnapshot, BACKGROUND_SECTIONS
 from api.utils import generate_sitemap, APIException
+from api.database import pool_status, deferred_begin
+from api.etag import VERSION_ERROR, conditional, check_version, requested_version, version_conflict, weak_etag
+from api.cache import cache, cached
+from api.stats import file_status_changed, stats, user_counts
+from api.search import DEFAULT_LIMIT, MIN_QUERY_LENGTH, search_clinical, search_users
+from api.backgrounds import PatchError, coerce_changes, document_storage, known_fields, patch_backgrounds
+from api.drafts import DraftConflict, drafts, merge_changes, normalize
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, timedelta, timezone
@@ -28,10 +36,15 @@ import uuid
 from werkzeug.utils import secure_filename
 from flask_jwt_extended import create_access_token, get_jwt_identity, jwt_required
 from functools import wraps
+from sqlalchemy import case, func, select
+from sqlalchemy.orm import joinedload, selectinload
+from sqlalchemy.orm.exc import StaleDataError
 
 api = Blueprint('api', __name__)
 CORS(api)
 
+logger = logging.getLogger(__name__)
+
 
 # Helper: compat wrapper to replace legacy Query.get()
 def session_get(model, pk):
@@ -54,6 +67,25 @@ def session_get(model, pk):
             return None
 
 
+def with_backgrounds(loader):
+    """Agrega a `loader` la carga de los cuatro antecedentes (1:1) del expediente.
+
+    Uso: options(with_backgrounds(selectinload(User.medical_file))).
+    """
+    return loader.options(*background_loads())
+
+
+def background_loads():
+    """joinedload de los cuatro antecedentes, salvo en modo documento (api/backgrounds.py).
+
+    En modo documento los expedientes ya convertidos no usan las tablas; los
+    que aún no se convirtieron las cargan con lazy load.
+    """
+    if document_storage():
+        return []
+    return [joinedload(getattr(MedicalFile, name)) for name in BACKGROUND_SECTIONS]
+
+
 # Carpeta pública para uploads locales (se crea si no existe)
 UPLOAD_FOLDER = os.path.join(os.getcwd(), 'uploads')
 if not os.path.exists(UPLOAD_FOLDER):
@@ -81,8 +113,8 @@ def serve_upload(filename):
 # ---------------------------- Decoradores de roles ----------------------------
 
 
-def role_required(role_name):
-    """Crea un decorador que exige JWT y un rol específico.
+def role_required(*role_names):
+    """Crea un decorador que exige JWT y uno de los roles indicados.
 
     Uso: @role_required("student") → verifica que el usuario JWT tenga ese rol.
     Lanza APIException 403 si el rol no coincide.
@@ -92,7 +124,7 @@ def role_required(role_name):
         @jwt_required()
         def wrapper(*args, **kwargs):
             current_user = session_get(User, get_jwt_identity())
-            if not current_user or current_user.role.value != role_name:
+            if not current_user or current_user.role.value not in role_names:
                 raise APIException("Acceso no autorizado", status_code=403)
             return fn(*args, **kwargs)
         return wrapper
@@ -104,6 +136,215 @@ student_required = role_required("student")
 professional_required = role_required("professional")
 patient_required = role_required("patient")
 
+# ------------------ Consultas compartidas (listados y /dashboard) ------------------
+
+
+def load_current_user():
+    """Usuario del JWT con expediente (y antecedentes) y datos académicos en una consulta."""
+    try:
+        user_id = int(get_jwt_identity())
+    except (TypeError, ValueError):
+        return None
+    return User.query.options(
+        with_backgrounds(joinedload(User.medical_file)),
+        joinedload(User.professional_student_data),
+    ).filter(User.id == user_id).first()
+
+
+def private_user_data(user):
+    """Serialización de /private: usuario + medical_file_id y solicitudes activas."""
+    medical_file = user.medical_file
+    academic_data = user.professional_student_data
+
+    user_data = user.serialize()
+    user_data["medical_file_id"] = medical_file.id if medical_file else None
+    user_data["academic_data"] = {
+        "requested_professional_id": academic_data.requested_professional_id if academic_data else None
+    }
+    user_data["patient_requested_student_id"] = (
+        medical_file.patient_requested_student_id if medical_file else None) or None
+    return user_data
+
+
+def patient_requests_for(student_id):
+    """Solicitudes de pacientes dirigidas a `student_id`."""
+    requests = MedicalFile.query.options(joinedload(MedicalFile.user)).filter_by(
+        patient_requested_student_id=student_id).all()
+    return [{
+        "id": req.user.id,
+        "full_name": f"{req.user.first_name} {req.user.first_surname}",
+        "medicalFileId": req.id,
+        "approved": req.student_validated_patient_id == student_id
+    } for req in requests]
+
+
+def assigned_patients_for(student_id):
+    """Pacientes asignados a `student_id` con el estado de su expediente."""
+    files = MedicalFile.query.options(joinedload(MedicalFile.user)).filter_by(
+        selected_student_id=student_id).all()
+    return [{
+        "id": f.user.id,
+        "full_name": f"{f.user.first_name} {f.user.first_surname}",
+        "medicalFileId": f.id,
+        "file_status": f.file_status.name if f.file_status else "N/A",
+    } for f in files]
+
+
+def student_requests_for(professional_id):
+    """Solicitudes de validación de estudiantes hacia `professional_id`."""
+    student_requests = ProfessionalStudentData.query.options(
+        joinedload(ProfessionalStudentData.user)).filter_by(
+        requested_professional_id=professional_id).all()
+    return [{
+        "id": data.user.id,
+        "full_name": f"{data.user.first_name} {data.user.first_surname}",
+        "email": data.user.email,
+        "career": data.career,
+        "academic_grade": data.academic_grade_prof.value if data.academic_grade_prof else "N/A",
+        "requested_at": data.requested_at.isoformat() if data.requested_at else None,
+        "status": data.user.status.value
+    } for data in student_requests]
+
+
+def review_files_criteria(professional_id):
+    """Expedientes en review de los estudiantes aprobados por `professional_id`."""
+    # Estudiantes aprobados por este profesional (subconsulta)
+    approved_student_ids = select(ProfessionalStudentData.user_id).where(
+        ProfessionalStudentData.validated_by_id == professional_id)
+    return (MedicalFile.file_status == FileStatus.review,
+            MedicalFile.selected_student_id.in_(approved_student_ids))
+
+
+def review_files_for(professional_id):
+    """Expedientes en review de los estudiantes aprobados por `professional_id`."""
+    # Buscar expedientes en review de esos estudiantes, con paciente,
+    # estudiante y snapshots en la misma ida a la base
+    files = MedicalFile.query.options(
+        joinedload(MedicalFile.user),
+        joinedload(MedicalFile.selected_student),
+        selectinload(MedicalFile.snapshots),
+    ).filter(*review_files_criteria(professional_id)).all()
+
+    result = []
+    for f in files:
+        patient = f.user
+        student = f.selected_student
+        result.append({
+            "id": f.id,
+            "file_status": f.file_status.value,
+            "patient_id": patient.id,
+            "patient_name": f"{patient.first_name} {patient.first_surname}",
+            "student_id": student.id,
+            "student_name": f"{student.first_name} {student.first_surname}",
+            "snapshots": [
+                {
+                    "id": s.id,
+                    "url": s.url,
+                    "created_at": s.created_at.isoformat() if s.created_at else None,
+                    "uploaded_by_id": s.uploaded_by_id
+                } for s in f.snapshots
+            ] if f.snapshots else [],
+        })
+    return result
+
+
+def snapshots_for(medical_file_id):
+    """Snapshots de un expediente, del más reciente al más antiguo."""
+    snapshots = MedicalFileSnapshot.query.filter_by(
+        medical_file_id=medical_file_id).order_by(MedicalFileSnapshot.created_at.desc()).all()
+    return [
+        {
+            "id": s.id,
+            "medical_file_id": s.medical_file_id,
+            "url": s.url,
+            "created_at": s.created_at.isoformat() if s.created_at else None,
+            "uploaded_by_id": s.uploaded_by_id,
+        }
+        for s in snapshots
+    ]
+
+# ---------------- Marcadores de versión para ETags (ver api/etag.py) ----------------
+
+
+def file_marker(medical_file_id, *criteria):
+    """version del expediente (None si no existe o no cumple `criteria`)."""
+    version = db.session.execute(
+        select(MedicalFile.version).where(MedicalFile.id == medical_file_id, *criteria)).scalar()
+    return (medical_file_id, version) if version is not None else None
+
+
+def private_marker(user_id):
+    """(user_id, hash) de todo lo que serializa /private, en un solo SELECT.
+
+    users y professional_student_data no tienen version: se usan sus columnas
+    (menos password) junto con la version del expediente, que cubre
+    antecedentes y snapshots. None si el usuario no existe.
+    """
+    columns = [c for c in User.__table__.c if c.name != "password"]
+    row = db.session.execute(
+        select(*columns, *ProfessionalStudentData.__table__.c, MedicalFile.version)
+        .outerjoin(ProfessionalStudentData, ProfessionalStudentData.user_id == User.id)
+        .outerjoin(MedicalFile, MedicalFile.user_id == User.id)
+        .where(User.id == user_id)).first()
+    return (user_id, weak_etag(*row)) if row is not None else None
+
+
+def assigned_file(medical_file_id):
+    """(fila, None) si el expediente es del estudiante del JWT; si no, (None, respuesta 404/403).
+
+    Existencia, propiedad, version y file_status en un solo SELECT.
+    """
+    row = db.session.execute(
+        select(MedicalFile.selected_student_id, MedicalFile.version, MedicalFile.file_status)
+        .where(MedicalFile.id == medical_file_id)).one_or_none()
+    if row is None:
+        return None, (jsonify({"error": "Expediente no encontrado"}), 404)
+    if row.selected_student_id != int(get_jwt_identity()):
+        return None, (jsonify({"error": "Acceso denegado"}), 403)
+    return row, None
+
+
+def files_marker(*criteria):
+    """(count, max(updated_at)) de los expedientes de un listado.
+
+    Cualquier alta o cambio en el listado mueve max(updated_at); una baja, el count.
+    """
+    return tuple(db.session.execute(
+        select(func.count(MedicalFile.id), func.max(MedicalFile.updated_at)).where(*criteria)).one())
+
+
+def student_requests_marker(professional_id):
+    """(count, max(requested_at), aprobados) de las solicitudes al profesional."""
+    return tuple(db.session.execute(
+        select(
+            func.count(ProfessionalStudentData.id),
+            func.max(ProfessionalStudentData.requested_at),
+            func.sum(case((User.status == UserStatus.approved, 1), else_=0)),
+        ).join(User, User.id == ProfessionalStudentData.user_id)
+        .where(ProfessionalStudentData.requested_professional_id == professional_id)).one())
+
+
+@api.errorhandler(StaleDataError)
+def handle_stale_write(error):
+    """Otra sesión actualizó la fila entre nuestra lectura y el commit (version_id_col)."""
+    db.session.rollback()
+    logger.info("Escritura concurrente rechazada: %s", error)
+    return version_conflict()
+
+
+@api.errorhandler(DraftConflict)
+def handle_draft_conflict(error):
+    """El borrador de autosave no se pudo escribir (api/drafts.py); el rollback lo conserva."""
+    db.session.rollback()
+    return jsonify({
+        "error": "El borrador de autosave está en conflicto: el expediente cambió o ya no está en edición",
+        "draft_conflict": True,
+        "base_version": error.base_version,
+        "current_version": error.current_version,
+        "file_status": error.file_status.value,
+    }), 409
+
+
 # 01 EPT para registrar un nuevo usuario
 
 
@@ -123,6 +364,10 @@ def register_user():
         if field not in data or not data[field]:
             return jsonify({"message": f"Campo requerido: {field}"}), 400
 
+    # Hashear antes de la primera consulta: en SQLite la transacción de un POST
+    # toma el lock de escritura desde su primera sentencia.
+    password_hash = generate_password_hash(data["password"])
+
     if User.query.filter_by(email=data["email"]).first():
         return jsonify({"message": "El correo ya está registrado"}), 400
 
@@ -143,7 +388,7 @@ def register_user():
             birth_day=bd,
             phone=data.get("phone"),
             email=data["email"],
-            password=generate_password_hash(data["password"]),
+            password=password_hash,
             role=data["role"]
         )
         db.session.add(new_user)
@@ -195,6 +440,7 @@ def register_user():
 
 # 02 EPT para login
 @api.route('/login', methods=['POST'])
+@deferred_begin
 def login():
     """Autentica al usuario y devuelve un JWT de corta duración."""
     data = request.get_json()
@@ -235,44 +481,24 @@ def login():
 
 @api.route('/private', methods=['GET'])
 @jwt_required()
+@conditional(lambda: private_marker(int(get_jwt_identity())))
+@cached("private")
 def private():
     """Devuelve datos del usuario autenticado y referencias útiles.
 
     - Incluye medical_file_id si existe un expediente asociado.
     - Incluye requested_professional_id (para estudiantes) y
       patient_requested_student_id (para pacientes) si aplican.
-    """
-    current_user = session_get(User, get_jwt_identity())
-
-    # Buscar expediente médico (MedicalFile) del usuario
-    medical_file = MedicalFile.query.filter_by(user_id=current_user.id).first()
-    medical_file_id = medical_file.id if medical_file else None
-
-    # Serializar usuario
-    user_data = current_user.serialize()
-
-    # Agregar medical_file_id al JSON
-    user_data["medical_file_id"] = medical_file_id
 
-    # 🔥 Agregar requested_professional_id para estudiantes
-    academic_data = ProfessionalStudentData.query.filter_by(
-        user_id=current_user.id).first()
-    if academic_data and academic_data.requested_professional_id:
-        user_data["academic_data"] = {
-            "requested_professional_id": academic_data.requested_professional_id
-        }
-    else:
-        user_data["academic_data"] = {
-            "requested_professional_id": None
-        }
-
-    # 🔥 Agregar patient_requested_student_id para pacientes
-    if medical_file and medical_file.patient_requested_student_id:
-        user_data["patient_requested_student_id"] = medical_file.patient_requested_student_id
-    else:
-        user_data["patient_requested_student_id"] = None
+    La respuesta se cachea (api/cache.py) con la clave del marcador
+    private_marker: cualquier cambio de su usuario, datos académicos o
+    expediente cambia la clave, también en los demás workers.
+    """
+    current_user = load_current_user()
+    if not current_user:
+        return jsonify({"error": "Usuario no encontrado"}), 404
 
-    return jsonify({"msg": "Acceso autorizado", "user": user_data}), 200
+    return jsonify({"msg": "Acceso autorizado", "user": private_user_data(current_user)}), 200
 
 
 # 04 EPT para obtener todos los usuarios (admin)
@@ -280,9 +506,51 @@ def private():
 @admin_required
 def get_users():
     """Lista todos los usuarios (sólo admin)."""
-    users = User.query.all()
+    users = User.query.options(
+        with_backgrounds(selectinload(User.medical_file)),
+        selectinload(User.professional_student_data),
+    ).all()
     return jsonify([user.serialize() for user in users]), 200
 
+
+# 04.1 EPT estado del pool de conexiones del worker (admin)
+@api.route('/health/db_pool', methods=['GET'])
+@admin_required
+def db_pool_health():
+    """Devuelve conexiones checked-out/overflow y tiempos de espera del pool.
+
+    Los valores son por worker (cada proceso de gunicorn tiene su propio pool);
+    el campo pid identifica qué worker respondió.
+    """
+    return jsonify(pool_status(db.engine)), 200
+
+
+# 04.2 EPT contadores de la caché de respuestas del worker (admin)
+@api.route('/health/cache', methods=['GET'])
+@admin_required
+def cache_health():
+    """Aciertos/fallos/invalidaciones por espacio de nombres (api/cache.py).
+
+    Igual que /health/db_pool, los valores son del worker que responde (pid).
+    """
+    store = cache()
+    if store is None:
+        return jsonify({"enabled": False}), 200
+    return jsonify({"enabled": True, **store.stats()}), 200
+
+
+# 04.3 EPT estadísticas agregadas (admin)
+@api.route('/stats', methods=['GET'])
+@admin_required
+def get_stats():
+    """Conteos de expedientes por estado, usuarios por rol/estado, estudiantes por
+    profesional y antigüedad del backlog de revisión (ver api/stats.py).
+
+    Con STATS_MATERIALIZED=1 los conteos salen de stats_counter (un SELECT).
+    """
+    return jsonify(stats()), 200
+
+
 # 05 EPT para validar profesional (admin)
 
 
@@ -449,48 +717,20 @@ def validate_patient(patient_id):
 # 09 EPT para obtener solicitudes de pacientes al estudiante
 @api.route('/student/patient_requests', methods=['GET'])
 @student_required
+@conditional(lambda: files_marker(MedicalFile.patient_requested_student_id == get_jwt_identity()))
 def get_patient_requests():
     """Lista solicitudes de pacientes dirigidas al estudiante autenticado."""
-    student_id = get_jwt_identity()
-    requests = MedicalFile.query.filter_by(
-        patient_requested_student_id=student_id).all()
-    result = []
-
-    for req in requests:
-        patient_user = session_get(User, req.user_id)
-        result.append({
-            "id": patient_user.id,
-            "full_name": f"{patient_user.first_name} {patient_user.first_surname}",
-            "medicalFileId": req.id,
-            "approved": req.student_validated_patient_id == student_id
-        })
-
-    return jsonify(result), 200
+    # La identidad del JWT es str; "approved" compara con un id entero
+    return jsonify(patient_requests_for(int(get_jwt_identity()))), 200
 
 
 # 10 EPT para obtener solicitudes de estudiantes al profesional
 @api.route('/professional/student_requests', methods=['GET'])
 @professional_required
+@conditional(lambda: student_requests_marker(get_jwt_identity()))
 def get_student_requests():
     """Lista solicitudes de estudiantes al profesional autenticado."""
-    professional_id = get_jwt_identity()
-    student_requests = ProfessionalStudentData.query.filter_by(
-        requested_professional_id=professional_id).all()
-
-    result = []
-    for data in student_requests:
-        student = session_get(User, data.user_id)
-        result.append({
-            "id": student.id,
-            "full_name": f"{student.first_name} {student.first_surname}",
-            "email": student.email,
-            "career": data.career,
-            "academic_grade": data.academic_grade_prof.value if data.academic_grade_prof else "N/A",
-            "requested_at": data.requested_at.isoformat() if data.requested_at else None,
-            "status": student.status.value
-        })
-
-    return jsonify(result), 200
+    return jsonify(student_requests_for(get_jwt_identity())), 200
 
 # 10.1 EPT estado de solicitud del estudiante hacia un profesional
 
@@ -532,13 +772,20 @@ def cancel_professional_request():
 # 11 EPT para obtener el expediente médico de un paciente
 @api.route('/medical_file/<int:file_id>', methods=['GET'])
 @jwt_required()
+@conditional(lambda file_id: file_marker(file_id), strong_version=True)
+@cached("medical_file")
 def get_medical_file(file_id):
-    """Obtiene un expediente médico por id con datos básicos del paciente."""
-    medical_file = session_get(MedicalFile, file_id)
+    """Obtiene un expediente médico por id con datos básicos del paciente.
+
+    Expediente, paciente y antecedentes en un solo SELECT con JOINs.
+    """
+    medical_file = db.session.execute(
+        select(MedicalFile).options(joinedload(MedicalFile.user), *background_loads())
+        .where(MedicalFile.id == file_id)).scalar_one_or_none()
     if not medical_file:
         return jsonify({"error": "Expediente no encontrado"}), 404
 
-    user = session_get(User, medical_file.user_id)
+    user = medical_file.user
     if not user:
         return jsonify({"error": "Paciente no encontrado"}), 404
 
@@ -580,6 +827,26 @@ def save_backgrounds():
     if not medical_file:
         return jsonify({"error": "Expediente no encontrado"}), 404
 
+    stale = check_version(medical_file.version)
+    if stale:
+        return stale
+
+    # Escribir primero el autosave pendiente (api/drafts.py)
+    drafts().flush_pending(medical_file.id)
+
+    # Antecedentes en documento (api/backgrounds.py): misma escritura que el PATCH
+    if medical_file.backgrounds_doc is not None or document_storage():
+        try:
+            changes = coerce_changes(known_fields(data))
+        except PatchError as e:
+            return jsonify({"error": str(e), "fields": e.errors}), 400
+        version = patch_backgrounds(medical_file.id, changes, expected_version=medical_file.version)
+        if version is None:
+            db.session.rollback()
+            return version_conflict()
+        db.session.commit()
+        return jsonify({"message": "Antecedentes guardados exitosamente", "version": version}), 200
+
     # ---------- Non Pathological Background ----------
     non_path_data = data.get("non_pathological_background")
     if non_path_data:
@@ -631,7 +898,7 @@ def save_backgrounds():
                 setattr(medical_file.gynecological_background, key, value)
 
     db.session.commit()
-    return jsonify({"message": "Antecedentes guardados exitosamente"}), 200
+    return jsonify({"message": "Antecedentes guardados exitosamente", "version": medical_file.version}), 200
 
 
 # 13 EPT para marcar expediente como en revisión (estudiante)
@@ -643,11 +910,18 @@ def mark_file_review(medical_file_id):
     if not medical_file:
         return jsonify({"error": "Expediente no encontrado"}), 404
 
+    stale = check_version(medical_file.version)
+    if stale:
+        return stale
+
+    # Escribir primero el autosave pendiente (api/drafts.py)
+    drafts().flush_pending(medical_file.id)
+
     medical_file.file_status = FileStatus.review
     medical_file.reviewed_at = datetime.now(timezone.utc)
     db.session.commit()
 
-    return jsonify({"message": "Expediente marcado como en revisión"}), 200
+    return jsonify({"message": "Expediente marcado como en revisión", "version": medical_file.version}), 200
 
 # 14 EPT para que el estudiante suba un snapshot del expediente
 
@@ -668,6 +942,10 @@ def upload_snapshot(file_id):
         if not medical_file:
             return jsonify({"error": "Expediente no encontrado"}), 404
 
+        stale = check_version(medical_file.version)
+        if stale:
+            return stale
+
         data = request.get_json()
         snapshot_url = data.get("snapshot_url")
         if not snapshot_url:
@@ -718,23 +996,17 @@ def upload_snapshot(file_id):
                     # Construir URL absoluta pública para el archivo subido
                     try:
                         # Cuando el request proviene del test client de Werkzeug, devolver ruta relativa
-                        # Imprimir valores de entorno útiles para diagnóstico cuando se ejecutan tests
-                        try:
-                            from flask import current_app
-                            print("[UPLOAD DEBUG] werkzeug.test=",
-                                  request.environ.get('werkzeug.test'))
-                            print("[UPLOAD DEBUG] HTTP_HOST=",
-                                  request.environ.get('HTTP_HOST'))
-                            print("[UPLOAD DEBUG] SERVER_NAME=",
-                                  request.environ.get('SERVER_NAME'))
-                            print("[UPLOAD DEBUG] SERVER_PORT=",
-                                  request.environ.get('SERVER_PORT'))
-                            print("[UPLOAD DEBUG] host_url=", request.host_url)
-                            print("[UPLOAD DEBUG] url_root=", request.url_root)
-                            print("[UPLOAD DEBUG] current_app.testing=",
-                                  getattr(current_app, 'testing', None))
-                        except Exception:
-                            pass
+                        # Valores de entorno útiles para diagnóstico (sólo con LOG_LEVEL=DEBUG)
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug("upload_snapshot: snapshot guardado localmente", extra={"fields": {
+                                "file": filename,
+                                "bytes": len(decoded),
+                                "http_host": request.environ.get('HTTP_HOST'),
+                                "server_name": request.environ.get('SERVER_NAME'),
+                                "server_port": request.environ.get('SERVER_PORT'),
+                                "host_url": request.host_url,
+                                "url_root": request.url_root,
+                            }})
                         # Si el host incluye puerto explícito (ej. 'localhost:3001'),
                         # devolver URL absoluta; si no (ej. test client que usa 'localhost'),
                         # devolver ruta relativa para mantener comportamiento esperado en tests unitarios.
@@ -746,8 +1018,8 @@ def upload_snapshot(file_id):
                             cloud_url = f"/api/uploads/{filename}"
                     except Exception:
                         cloud_url = f"/api/uploads/{filename}"
-                except Exception as e:
-                    print(f"Failed saving data URL locally: {e}")
+                except Exception:
+                    logger.warning("upload_snapshot: no se pudo guardar el data URL localmente", exc_info=True)
             # Si Cloudinary está configurado, intentar subir y preferir secure_url
             elif os.environ.get('CLOUDINARY_URL') or os.environ.get('CLOUDINARY_CLOUD_NAME'):
                 try:
@@ -759,8 +1031,11 @@ def upload_snapshot(file_id):
                             'url') or cloud_url
                         cloudinary_used = bool(
                             res.get('secure_url') or res.get('url'))
-                except Exception as ce:
-                    print(f"Cloudinary upload failed: {ce}")
+                except Exception:
+                    logger.warning("upload_snapshot: falló la subida a Cloudinary", exc_info=True)
+
+        # Escribir primero el autosave pendiente (api/drafts.py)
+        drafts().flush_pending(medical_file.id)
 
         new_snapshot = MedicalFileSnapshot(
             medical_file_id=file_id,
@@ -779,8 +1054,10 @@ def upload_snapshot(file_id):
             msg += " (subido a Cloudinary)"
 
         # Devolver la URL pública para consumo inmediato del frontend
-        return jsonify({"message": msg, "url": cloud_url}), 200
+        return jsonify({"message": msg, "url": cloud_url, "version": medical_file.version}), 200
 
+    except (StaleDataError, DraftConflict):
+        raise
     except Exception as e:
         db.session.rollback()
         return jsonify({"error": f"Error interno: {str(e)}"}), 500
@@ -804,6 +1081,10 @@ def review_file(medical_file_id):
     if not medical_file:
         return jsonify({"error": "Expediente no encontrado"}), 404
 
+    stale = check_version(medical_file.version)
+    if stale:
+        return stale
+
     if action == "approve":
         medical_file.file_status = FileStatus.approved
         medical_file.approved_at = datetime.now(timezone.utc)
@@ -823,7 +1104,8 @@ def review_file(medical_file_id):
     db.session.commit()
     return jsonify({
         "message": f"Expediente {action} correctamente.",
-        "file_status": medical_file.file_status.value if medical_file.file_status else None
+        "file_status": medical_file.file_status.value if medical_file.file_status else None,
+        "version": medical_file.version
     }), 200
 
 # 16 EPT para que el estudiante obtenga sus pacientes asignados
@@ -831,22 +1113,10 @@ def review_file(medical_file_id):
 
 @api.route('/student/assigned_patients', methods=['GET'])
 @student_required
+@conditional(lambda: files_marker(MedicalFile.selected_student_id == get_jwt_identity()))
 def get_assigned_patients():
     """Lista pacientes asignados a un estudiante con estado del expediente."""
-    student_id = get_jwt_identity()
-    files = MedicalFile.query.filter_by(selected_student_id=student_id).all()
-
-    result = []
-    for f in files:
-        patient = session_get(User, f.user_id)
-        result.append({
-            "id": patient.id,
-            "full_name": f"{patient.first_name} {patient.first_surname}",
-            "medicalFileId": f.id,
-            "file_status": f.file_status.name if f.file_status else "N/A",
-        })
-
-    return jsonify(result), 200
+    return jsonify(assigned_patients_for(get_jwt_identity())), 200
 
 # 17 EPT para que el estudiante cree antecedentes médicos
 
@@ -865,6 +1135,14 @@ def create_backgrounds():
     if not medical_file:
         return jsonify({"error": "MedicalFile no encontrado"}), 404
 
+    stale = check_version(medical_file.version)
+    if stale:
+        return stale
+
+    # Escribir primero el autosave pendiente (api/drafts.py); la escritura
+    # final se condiciona a la versión resultante
+    expected_version = drafts().flush_pending(medical_file.id) or medical_file.version
+
     # Helper para convertir bool a "yes" o "no"
     def bool_to_yesno(value):
         if value is True:
@@ -888,9 +1166,8 @@ def create_backgrounds():
     gyneco_data = clean_empty_strings(data.get("gynecological_background", {}))
     personal_data = clean_empty_strings(data.get("personal_data", {}))
 
-    # Crear antecedentes no patológicos
-    non_path = NonPathologicalBackground(
-        medical_file_id=medical_file.id,
+    # Antecedentes no patológicos
+    non_path = dict(
         sex=personal_data.get("sex"),
         address=personal_data.get("address"),
         education_institution=non_path_data.get("education_level"),
@@ -906,11 +1183,9 @@ def create_backgrounds():
         tobacco_use=non_path_data.get("tobacco_use"),
         other_recreational_info=non_path_data.get("others")
     )
-    db.session.add(non_path)
 
-    # Crear antecedentes patológicos
-    path = PathologicalBackground(
-        medical_file_id=medical_file.id,
+    # Antecedentes patológicos
+    path = dict(
         chronic_diseases=path_data.get("personal_diseases"),
         current_medications=path_data.get("medications"),
         hospitalizations=path_data.get("hospitalizations"),
@@ -920,11 +1195,9 @@ def create_backgrounds():
         allergies=path_data.get("allergies"),
         other_pathological_info=path_data.get("others")
     )
-    db.session.add(path)
 
-    # Crear antecedentes familiares
-    family = FamilyBackground(
-        medical_file_id=medical_file.id,
+    # Antecedentes familiares
+    family = dict(
         hypertension=family_data.get("hypertension", False),
         diabetes=family_data.get("diabetes", False),
         cancer=family_data.get("cancer", False),
@@ -935,15 +1208,13 @@ def create_backgrounds():
         congenital_diseases=family_data.get("congenital_malformations", False),
         other_family_background_info=family_data.get("others")
     )
-    db.session.add(family)
 
     # Helper para convertir string vacío a None y luego int
     def safe_int(value):
         return int(value) if value not in [None, ""] else None
 
-    # Crear antecedentes ginecológicos
-    gyneco = GynecologicalBackground(
-        medical_file_id=medical_file.id,
+    # Antecedentes ginecológicos
+    gyneco = dict(
         menarche_age=safe_int(gyneco_data.get("menarche_age")),
         pregnancies=safe_int(gyneco_data.get("pregnancies")),
         births=safe_int(gyneco_data.get("births")),
@@ -952,91 +1223,58 @@ def create_backgrounds():
         contraceptive_methods=gyneco_data.get("contraceptive_method"),
         other_gynecological_info=gyneco_data.get("others")
     )
-    db.session.add(gyneco)
-
-    # Actualizar estado a review
-    medical_file.file_status = FileStatus.review
-    medical_file.reviewed_at = datetime.now(timezone.utc)
 
+    # Un upsert por sección (sin duplicar filas si ya existían) y el cambio a
+    # review en el mismo UPDATE que incrementa la versión del expediente
+    version = patch_backgrounds(
+        medical_file.id,
+        {NonPathologicalBackground: non_path, PathologicalBackground: path,
+         FamilyBackground: family, GynecologicalBackground: gyneco},
+        expected_version=expected_version,
+        file_values={"file_status": FileStatus.review, "reviewed_at": datetime.now(timezone.utc)})
+    if version is None:
+        db.session.rollback()
+        return version_conflict()
+    # El UPDATE es por Core; la versión esperada garantiza que el estado previo es el leído
+    file_status_changed(medical_file.file_status, FileStatus.review)
     db.session.commit()
 
-    return jsonify({"message": "Antecedentes creados y expediente enviado a revisión"}), 201
+    return jsonify({"message": "Antecedentes creados y expediente enviado a revisión",
+                    "version": version}), 201
 
 
 # 18 EPT para que el profesional obtenga los archivos en revisión de estudiantes aprobados
 @api.route('/professional/review_files', methods=['GET'])
 @professional_required
+@conditional(lambda: files_marker(*review_files_criteria(get_jwt_identity())))
 def get_review_files():
     """Lista expedientes en estado 'review' de estudiantes aprobados por el profesional.
 
     Nota: snapshots se devuelven como lista de strings (URLs).
     """
-    professional_id = get_jwt_identity()
-
-    # Buscar estudiantes aprobados por este profesional
-    approved_students = ProfessionalStudentData.query.filter_by(
-        validated_by_id=professional_id).all()
-    approved_student_ids = [s.user_id for s in approved_students if s.user_id]
-
-    # Buscar expedientes en review de esos estudiantes
-    files = MedicalFile.query.filter(
-        MedicalFile.file_status == FileStatus.review,
-        MedicalFile.selected_student_id.in_(approved_student_ids)
-    ).all()
-
-    result = []
-    for f in files:
-        patient = session_get(User, f.user_id)
-        student = session_get(User, f.selected_student_id)
-        result.append({
-            "id": f.id,
-            "file_status": f.file_status.value,
-            "patient_id": patient.id,
-            "patient_name": f"{patient.first_name} {patient.first_surname}",
-            "student_id": student.id,
-            "student_name": f"{student.first_name} {student.first_surname}",
-            "snapshots": [
-                {
-                    "id": s.id,
-                    "url": s.url,
-                    "created_at": s.created_at.isoformat() if s.created_at else None,
-                    "uploaded_by_id": s.uploaded_by_id
-                } for s in f.snapshots
-            ] if f.snapshots else [],
-        })
-
-    return jsonify(result), 200
+    return jsonify(review_files_for(get_jwt_identity())), 200
 
 # 19 EPT para que profesional obtenga los snapshots de un expediente
 
 
 @api.route('/professional/snapshots/<int:medical_file_id>', methods=['GET'])
 @professional_required
+@conditional(lambda medical_file_id: file_marker(medical_file_id))
 def get_snapshots(medical_file_id):
     """Lista snapshots de un expediente para el profesional."""
     medical_file = session_get(MedicalFile, medical_file_id)
     if not medical_file:
         return jsonify({"error": "Expediente no encontrado"}), 404
 
-    snapshots = MedicalFileSnapshot.query.filter_by(
-        medical_file_id=medical_file_id).order_by(MedicalFileSnapshot.created_at.desc()).all()
-    result = [
-        {
-            "id": s.id,
-            "medical_file_id": s.medical_file_id,
-            "url": s.url,
-            "created_at": s.created_at.isoformat() if s.created_at else None,
-            "uploaded_by_id": s.uploaded_by_id,
-        }
-        for s in snapshots
-    ]
-    return jsonify(result), 200
+    return jsonify(snapshots_for(medical_file_id)), 200
 
 # 20 EPT para que el paciente obtenga snapshots del expediente propio
 
 
 @api.route('/patient/snapshots/<int:medical_file_id>', methods=['GET'])
 @patient_required
+@conditional(lambda medical_file_id: file_marker(
+    medical_file_id, MedicalFile.user_id == int(get_jwt_identity())))
 def get_patient_snapshots(medical_file_id):
     """Lista snapshots visibles al paciente dueño del expediente."""
     medical_file = session_get(MedicalFile, medical_file_id)
@@ -1047,19 +1285,7 @@ def get_patient_snapshots(medical_file_id):
     if medical_file.user_id != int(get_jwt_identity()):
         return jsonify({"error": "Acceso denegado"}), 403
 
-    snapshots = MedicalFileSnapshot.query.filter_by(
-        medical_file_id=medical_file_id).order_by(MedicalFileSnapshot.created_at.desc()).all()
-    result = [
-        {
-            "id": s.id,
-            "medical_file_id": s.medical_file_id,
-            "url": s.url,
-            "created_at": s.created_at.isoformat() if s.created_at else None,
-            "uploaded_by_id": s.uploaded_by_id,
-        }
-        for s in snapshots
-    ]
-    return jsonify(result), 200
+    return jsonify(snapshots_for(medical_file_id)), 200
 
 # 21 EPT estado de la solicitud del paciente hacia un estudiante
 
@@ -1133,6 +1359,10 @@ def patient_confirm_file(medical_file_id):
     if medical_file.user_id != patient_id:
         return jsonify({"error": "Acceso denegado"}), 403
 
+    stale = check_version(medical_file.version)
+    if stale:
+        return stale
+
     if action == "confirm":
         medical_file.file_status = FileStatus.confirmed
         medical_file.confirmed_by_id = patient_id
@@ -1155,4 +1385,253 @@ def patient_confirm_file(medical_file_id):
         return jsonify({"error": "Acción no válida. Usa 'confirm' o 'reject'"}), 400
 
     db.session.commit()
-    return jsonify({"message": f"Expediente {action} correctamente."}), 200
+    return jsonify({"message": f"Expediente {action} correctamente.", "version": medical_file.version}), 200
+
+# 24 EPT panel del usuario autenticado según su rol
+
+
+@api.route('/dashboard', methods=['GET'])
+@jwt_required()
+def dashboard():
+    """Devuelve en una sola respuesta lo que necesita la pantalla inicial de cada rol.
+
+    Reemplaza las llamadas sueltas del cliente (/private + listados del rol) por
+    un número fijo de consultas, sin importar cuántos registros haya:
+
+    - student: solicitud al profesional, solicitudes de pacientes y pacientes asignados.
+    - professional: solicitudes de estudiantes y expedientes en revisión (con snapshots).
+    - patient: solicitud al estudiante y snapshots del expediente propio.
+    - admin: conteos de usuarios por rol/estado y profesionales pendientes de validar.
+
+    Las listas tienen la misma forma que sus endpoints individuales.
+    """
+    user = load_current_user()
+    if not user:
+        return jsonify({"error": "Usuario no encontrado"}), 404
+
+    payload = {"role": user.role.value, "user": private_user_data(user)}
+
+    if user.role == UserRole.student:
+        academic_data = user.professional_student_data
+        if academic_data and academic_data.requested_professional_id:
+            payload["professional_request"] = {
+                "status": "requested",
+                "professional_id": academic_data.requested_professional_id
+            }
+        else:
+            payload["professional_request"] = {"status": "none"}
+        payload["patient_requests"] = patient_requests_for(user.id)
+        payload["assigned_patients"] = assigned_patients_for(user.id)
+
+    elif user.role == UserRole.professional:
+        payload["student_requests"] = student_requests_for(user.id)
+        payload["review_files"] = review_files_for(user.id)
+
+    elif user.role == UserRole.patient:
+        medical_file = user.medical_file
+        if medical_file and medical_file.patient_requested_student_id:
+            payload["student_request"] = {
+                "status": "requested",
+                "student_id": medical_file.patient_requested_student_id,
+                "professional_id": medical_file.selected_student_id
+            }
+        else:
+            payload["student_request"] = {"status": "none"}
+        payload["snapshots"] = snapshots_for(medical_file.id) if medical_file else []
+
+    elif user.role == UserRole.admin:
+        counts = user_counts()
+        pending = User.query.options(joinedload(User.professional_student_data)).filter_by(
+            role=UserRole.professional, status=UserStatus.pre_approved).order_by(User.id).all()
+        payload["user_counts"] = counts
+        payload["pending_professionals"] = [{
+            "id": p.id,
+            "full_name": f"{p.first_name} {p.first_surname}",
+            "email": p.email,
+            "professional_student_data": p.professional_student_data.serialize() if p.professional_student_data else None
+        } for p in pending]
+
+    return jsonify(payload), 200
+
+
+# 25 EPT actualización parcial de antecedentes (autosave)
+@api.route('/medical_file/<int:file_id>/backgrounds', methods=['PATCH'])
+@student_required
+def patch_backgrounds_view(file_id):
+    """Guarda sólo los campos de antecedentes que cambiaron.
+
+    Entrada JSON: { "<sección>": { campo: valor, ... }, "version"?: n }
+    (misma forma que /backgrounds/save, pero sólo con los campos modificados).
+    Los campos se validan contra la lista blanca/tipos de api/backgrounds.py y
+    cada sección se escribe con un único UPDATE de esas columnas.
+    Con If-Match o "version" responde 409 si el expediente cambió.
+    Incluye el borrador pendiente de autosave (ver 26 EPT).
+    Sólo el estudiante asignado al expediente (403 para cualquier otro).
+    """
+    _, denied = assigned_file(file_id)
+    if denied:
+        return denied
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Se esperaba un objeto JSON"}), 400
+
+    try:
+        expected_version = requested_version()
+        coerce_changes(data)
+    except PatchError as e:
+        return jsonify({"error": str(e), "fields": e.errors}), 400
+    except (TypeError, ValueError):
+        return jsonify({"error": VERSION_ERROR}), 400
+
+    # El autosave pendiente viaja en la misma escritura (lo enviado ahora gana);
+    # sin versión explícita se condiciona a la base del borrador
+    pending = drafts().take(file_id)
+    if pending and expected_version is None:
+        expected_version = pending["base_version"]
+    changes = coerce_changes(merge_changes(pending["changes"] if pending else {}, normalize(data)))
+
+    new_version = patch_backgrounds(file_id, changes, expected_version)
+    if new_version is None:
+        db.session.rollback()
+        current_version = db.session.execute(
+            select(MedicalFile.version).where(MedicalFile.id == file_id)).scalar()
+        if current_version is None:
+            return jsonify({"error": "Expediente no encontrado"}), 404
+        return version_conflict(current_version)
+
+    db.session.commit()
+    return jsonify({
+        "message": "Antecedentes actualizados",
+        "version": new_version,
+        "updated": {model.__tablename__: sorted(values) for model, values in changes.items()},
+    }), 200
+
+
+# 26 EPT borrador de autosave de antecedentes
+@api.route('/medical_file/<int:file_id>/backgrounds/draft', methods=['PUT', 'GET', 'DELETE'])
+@student_required
+def backgrounds_draft(file_id):
+    """Autosave con buffer en el servidor (api/drafts.py).
+
+    PUT: misma entrada que el PATCH de antecedentes; los cambios se fusionan
+    con el borrador pendiente y se escriben como mucho cada
+    DRAFT_FLUSH_SECONDS o en la próxima escritura explícita del expediente,
+    condicionados a base_version (la versión cuando entró el primer cambio).
+    Responde 202 si quedó en el buffer o 200 con la nueva version si escribió;
+    ambos con base_version. 409 si el expediente no está en edición
+    (empty/progress) o cambió desde base_version (el borrador se conserva).
+    GET: devuelve el borrador pendiente (para restaurar el formulario).
+    DELETE: descarta el borrador (p. ej. para resolver un conflicto).
+    Sólo para el estudiante asignado al expediente (403 para cualquier otro).
+    """
+    current, denied = assigned_file(file_id)
+    if denied:
+        return denied
+
+    if request.method == 'GET':
+        entry = drafts().pending(file_id)
+        return jsonify({
+            "medical_file_id": file_id,
+            "changes": entry["changes"] if entry else {},
+            "base_version": entry["base_version"] if entry else None,
+            "conflict": bool(entry) and (
+                entry["conflict"] or entry["base_version"] not in (None, current.version)),
+        }), 200
+
+    if request.method == 'DELETE':
+        return jsonify({"message": "Borrador descartado", "discarded": drafts().discard(file_id)}), 200
+
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "Se esperaba un objeto JSON"}), 400
+    stale = check_version(current.version)
+    if stale:
+        return stale
+    try:
+        version, base_version = drafts().save(file_id, data, current.version, current.file_status)
+    except PatchError as e:
+        return jsonify({"error": str(e), "fields": e.errors}), 400
+
+    if version is None:
+        return jsonify({"message": "Borrador guardado", "buffered": True, "base_version": base_version}), 202
+    return jsonify({"message": "Borrador escrito", "buffered": False, "version": version,
+                    "base_version": base_version}), 200
+
+
+# 27 EPT búsqueda de usuarios (admin y profesional)
+@api.route('/search', methods=['GET'])
+@role_required("admin", "professional")
+def search_view():
+    """Busca usuarios por nombre, apellidos, email o register_number (api/search.py).
+
+    Query params: q (mínimo 2 caracteres), limit (default 20, máximo 50) y
+    role opcional. Devuelve los resultados ordenados por relevancia.
+    """
+    query = (request.args.get("q") or "").strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return jsonify({"error": f"q debe tener al menos {MIN_QUERY_LENGTH} caracteres"}), 400
+    try:
+        limit = int(request.args.get("limit", DEFAULT_LIMIT))
+        role = UserRole(request.args["role"]) if request.args.get("role") else None
+    except ValueError:
+        return jsonify({"error": "limit debe ser un número y role un rol válido"}), 400
+
+    rows, engine = search_users(query, limit, role)
+    results = [{
+        "id": user.id,
+        "first_name": user.first_name,
+        "second_name": user.second_name,
+        "first_surname": user.first_surname,
+        "second_surname": user.second_surname,
+        "email": user.email,
+        "role": user.role.value,
+        "status": user.status.value,
+        "register_number": register_number,
+    } for user, register_number in rows]
+    return jsonify({"query": query, "engine": engine, "count": len(results), "results": results}), 200
+
+
+def clinical_search_criteria(user):
+    """Expedientes que `user` puede buscar: todos (admin), los de los estudiantes
+    que aprobó (profesional) o los que tiene asignados (estudiante)."""
+    if user.role == UserRole.admin:
+        return ()
+    if user.role == UserRole.professional:
+        approved_student_ids = select(ProfessionalStudentData.user_id).where(
+            ProfessionalStudentData.validated_by_id == user.id)
+        return (MedicalFile.selected_student_id.in_(approved_student_ids),)
+    return (MedicalFile.selected_student_id == user.id,)
+
+
+# 28 EPT búsqueda en el texto clínico de los antecedentes
+@api.route('/search/clinical', methods=['GET'])
+@role_required("admin", "professional", "student")
+def search_clinical_view():
+    """Busca expedientes por el texto libre de sus antecedentes (alergias, medicamentos...).
+
+    Query params: q (mínimo 2 caracteres), page (desde 1) y per_page
+    (default 20, máximo 50). Cada usuario sólo ve los expedientes de su
+    alcance (clinical_search_criteria).
+    """
+    query = (request.args.get("q") or "").strip()
+    if len(query) < MIN_QUERY_LENGTH:
+        return jsonify({"error": f"q debe tener al menos {MIN_QUERY_LENGTH} caracteres"}), 400
+    try:
+        page = int(request.args.get("page", 1))
+        per_page = int(request.args.get("per_page", DEFAULT_LIMIT))
+    except ValueError:
+        return jsonify({"error": "page y per_page deben ser números"}), 400
+
+    user = session_get(User, get_jwt_identity())
+    rows, engine, has_more = search_clinical(query, clinical_search_criteria(user), page, per_page)
+    results = [{
+        "medical_file_id": row.id,
+        "file_status": row.file_status.value,
+        "patient_id": row.patient_id,
+        "patient_name": f"{row.first_name} {row.first_surname}",
+        "student_id": row.selected_student_id,
+        "snippet": row.snippet,
+    } for row in rows]
+    return jsonify({"query": query, "engine": engine, "page": max(page, 1), "has_more": has_more,
+                    "count": len(results), "results": results}), 200
@@ -0,0 +1,355 @@
+"""
+Búsqueda de usuarios (nombre, apellidos, email y register_number) y búsqueda
+clínica en el texto libre de los antecedentes.
+
+Usuarios. Cada motor usa su índice:
+
+- PostgreSQL: índice GIN sobre to_tsvector('simple', nombres + email)
+  (USERS_TSV; la consulta usa exactamente la misma expresión para que el
+  planner lo use) con búsqueda por prefijo (`ana:* & lop:*`) y ranking
+  ts_rank; índices trigram (pg_trgm) sobre lower(email) y
+  lower(register_number) para los LIKE 'texto%'.
+- SQLite: tabla FTS5 users_fts (rowid = users.id) mantenida por triggers
+  sobre users y professional_student_data, con prefijos indexados y ranking
+  bm25. Se crea con el esquema (create_all) o con la migración; en una base
+  que no la tenga, `flask search-index` la crea y la llena.
+- Cualquier otro caso: LIKE por prefijo sin ranking.
+
+Cada palabra de la búsqueda debe coincidir (AND) como prefijo de alguna
+palabra de los campos; el orden es por relevancia y después por id.
+
+Clínica. clinical_search guarda, por expediente, las columnas Text de sus
+cuatro antecedentes (alergias, medicamentos, enfermedades crónicas, other_*
+...), leídas de las tablas o del documento (BACKGROUNDS_STORAGE). Se
+reconstruye antes del commit para los expedientes cuyo texto cambió en la
+transacción: por el ORM (after_flush sobre los antecedentes) o por Core
+(api/backgrounds.py llama a clinical_changed). Índices: GIN sobre
+to_tsvector('spanish', body) en PostgreSQL (con stemming: "alergia" encuentra
+"alergias") y FTS5 con contenido externo clinical_search_fts en SQLite. El
+alcance por rol (qué expedientes ve cada usuario) lo decide la ruta.
+`flask search-index` rellena clinical_search para los expedientes existentes.
+"""
+
+import re
+from datetime import datetime, timezone
+
+from sqlalchemy import DDL, Text, and_, column, delete, event, func, insert, literal_column, null, or_, select, table, text
+from sqlalchemy.orm import aliased, attributes
+
+from api.database import RoutingSession
+from api.models import (
+    db, User, ProfessionalStudentData, MedicalFile, ClinicalSearchEntry,
+    NonPathologicalBackground, PathologicalBackground, FamilyBackground, GynecologicalBackground,
+)
+
+MIN_QUERY_LENGTH = 2
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 50
+
+# Debe coincidir con el índice ix_users_search_tsv (migración de búsqueda)
+USERS_TSV = (
+    "to_tsvector('simple', coalesce(users.first_name, '') || ' ' || coalesce(users.second_name, '')"
+    " || ' ' || coalesce(users.first_surname, '') || ' ' || coalesce(users.second_surname, '')"
+    " || ' ' || coalesce(users.email, ''))"
+)
+
+# ---- FTS5 (SQLite) ----
+_FTS_NAME = ("trim(coalesce(new.first_name, '') || ' ' || coalesce(new.second_name, '') || ' ' || "
+             "coalesce(new.first_surname, '') || ' ' || coalesce(new.second_surname, ''))")
+
+SQLITE_FTS_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS users_fts USING fts5("
+    "name, email, register_number, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_insert AFTER INSERT ON users BEGIN "
+    f"INSERT INTO users_fts(rowid, name, email) VALUES (new.id, {_FTS_NAME}, new.email); END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_update AFTER UPDATE OF "
+    "first_name, second_name, first_surname, second_surname, email ON users BEGIN "
+    f"UPDATE users_fts SET name = {_FTS_NAME}, email = new.email WHERE rowid = new.id; END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_delete AFTER DELETE ON users BEGIN "
+    "DELETE FROM users_fts WHERE rowid = old.id; END",
+)
+
+SQLITE_REGISTER_DDL = (
+    "CREATE TRIGGER IF NOT EXISTS users_fts_register_insert AFTER INSERT ON professional_student_data BEGIN "
+    "UPDATE users_fts SET register_number = new.register_number WHERE rowid = new.user_id; END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_register_update AFTER UPDATE OF register_number, user_id "
+    "ON professional_student_data BEGIN "
+    "UPDATE users_fts SET register_number = NULL WHERE rowid = old.user_id; "
+    "UPDATE users_fts SET register_number = new.register_number WHERE rowid = new.user_id; END",
+    "CREATE TRIGGER IF NOT EXISTS users_fts_register_delete AFTER DELETE ON professional_student_data BEGIN "
+    "UPDATE users_fts SET register_number = NULL WHERE rowid = old.user_id; END",
+)
+
+SQLITE_FTS_FILL = (
+    "DELETE FROM users_fts",
+    "INSERT INTO users_fts(rowid, name, email, register_number) "
+    "SELECT users.id, trim(coalesce(users.first_name, '') || ' ' || coalesce(users.second_name, '') || ' ' || "
+    "coalesce(users.first_surname, '') || ' ' || coalesce(users.second_surname, '')), users.email, "
+    "professional_student_data.register_number FROM users "
+    "LEFT JOIN professional_student_data ON professional_student_data.user_id = users.id",
+)
+
+# Contenido externo: el texto vive en clinical_search y los triggers mantienen el índice
+SQLITE_CLINICAL_DDL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS clinical_search_fts USING fts5(body, content = 'clinical_search', "
+    "content_rowid = 'medical_file_id', tokenize = 'unicode61 remove_diacritics 2', prefix = '3')",
+    "CREATE TRIGGER IF NOT EXISTS clinical_search_fts_insert AFTER INSERT ON clinical_search BEGIN "
+    "INSERT INTO clinical_search_fts(rowid, body) VALUES (new.medical_file_id, new.body); END",
+    "CREATE TRIGGER IF NOT EXISTS clinical_search_fts_update AFTER UPDATE ON clinical_search BEGIN "
+    "INSERT INTO clinical_search_fts(clinical_search_fts, rowid, body) "
+    "VALUES ('delete', old.medical_file_id, old.body); "
+    "INSERT INTO clinical_search_fts(rowid, body) VALUES (new.medical_file_id, new.body); END",
+    "CREATE TRIGGER IF NOT EXISTS clinical_search_fts_delete AFTER DELETE ON clinical_search BEGIN "
+    "INSERT INTO clinical_search_fts(clinical_search_fts, rowid, body) "
+    "VALUES ('delete', old.medical_file_id, old.body); END",
+)
+
+SQLITE_CLINICAL_FILL = ("INSERT INTO clinical_search_fts(clinical_search_fts) VALUES ('rebuild')",)
+
+# Con create_all (desarrollo/tests) las tablas FTS y los triggers nacen con el esquema
+for _statement in SQLITE_FTS_DDL:
+    event.listen(User.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+for _statement in SQLITE_REGISTER_DDL:
+    event.listen(ProfessionalStudentData.__table__, "after_create",
+                 DDL(_statement).execute_if(dialect="sqlite"))
+for _statement in SQLITE_CLINICAL_DDL:
+    event.listen(ClinicalSearchEntry.__table__, "after_create", DDL(_statement).execute_if(dialect="sqlite"))
+
+
+# rank = bm25 (menor es más relevante)
+USERS_FTS = table("users_fts", column("rowid"), column("rank"))
+CLINICAL_FTS = table("clinical_search_fts", column("rowid"), column("rank"))
+
+
+def build_sqlite_index(connection):
+    """Crea (si faltan) y vuelve a llenar users_fts y clinical_search_fts en una base SQLite existente."""
+    for statement in (*SQLITE_FTS_DDL, *SQLITE_REGISTER_DDL, *SQLITE_FTS_FILL,
+                      *SQLITE_CLINICAL_DDL, *SQLITE_CLINICAL_FILL):
+        connection.execute(text(statement))
+
+
+_fts_available = {}
+
+
+def _has_sqlite_fts(connection, name="users_fts"):
+    """Se recuerda por base sólo cuando existe (una migración posterior la activa sin reiniciar)."""
+    key = (str(connection.engine.url), name)
+    if not _fts_available.get(key):
+        _fts_available[key] = connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": name}).first() is not None
+    return _fts_available[key]
+
+
+# ---- Consulta ----
+
+def query_terms(query):
+    """Palabras de la búsqueda (letras, dígitos y guiones; sin operadores)."""
+    return [term.lower() for term in re.findall(r"[\w-]+", query or "", flags=re.UNICODE) if term.strip("-_")]
+
+
+def _fts5_match(terms):
+    return " ".join('"{}"*'.format(term.replace('"', '""')) for term in terms)
+
+
+def _tsquery(terms):
+    return " & ".join(re.sub(r"[^\w-]", "", term) + ":*" for term in terms)
+
+
+def _like_prefix(term):
+    return term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+
+
+def _like_search(terms, academic):
+    fields = (User.first_name, User.second_name, User.first_surname, User.second_surname,
+              User.email, academic.register_number)
+    return and_(*(or_(*(func.lower(field).like(_like_prefix(term), escape="\\") for field in fields))
+                  for term in terms))
+
+
+def search_users(query, limit=DEFAULT_LIMIT, role=None):
+    """Devuelve ([(User, register_number)], motor) ordenados por relevancia."""
+    terms = query_terms(query)
+    if not terms:
+        return [], None
+    limit = max(1, min(int(limit), MAX_LIMIT))
+    academic = aliased(ProfessionalStudentData)
+    statement = select(User, academic.register_number).outerjoin(academic, academic.user_id == User.id)
+    if role is not None:
+        statement = statement.where(User.role == role)
+
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        engine = "postgresql"
+        tsv = literal_column(USERS_TSV)
+        tsquery = func.to_tsquery("simple", _tsquery(terms))
+        prefix = _like_prefix(" ".join(terms))
+        statement = statement.where(or_(
+            tsv.op("@@")(tsquery),
+            func.lower(User.email).like(prefix, escape="\\"),
+            func.lower(academic.register_number).like(prefix, escape="\\"),
+        )).order_by(func.ts_rank(tsv, tsquery).desc(), User.id)
+    elif dialect == "sqlite" and _has_sqlite_fts(connection):
+        engine = "fts5"
+        statement = (statement
+                     .join(USERS_FTS, USERS_FTS.c.rowid == User.id)
+                     .where(literal_column("users_fts").op("MATCH")(_fts5_match(terms)))
+                     .order_by(USERS_FTS.c.rank, User.id))
+    else:
+        engine = "like"
+        statement = statement.where(_like_search(terms, academic)).order_by(
+            User.first_surname, User.first_name, User.id)
+
+    return db.session.execute(statement.limit(limit)).all(), engine
+
+
+# ---- Búsqueda clínica: mantenimiento del índice ----
+
+CLINICAL_MODELS = (NonPathologicalBackground, PathologicalBackground, FamilyBackground, GynecologicalBackground)
+
+# Columnas de texto libre de cada antecedente (nombre de sección = nombre de tabla)
+CLINICAL_FIELDS = {
+    model.__tablename__: tuple(c.name for c in model.__table__.columns if isinstance(c.type, Text))
+    for model in CLINICAL_MODELS
+}
+
+# Debe coincidir con el índice ix_clinical_search_tsv (migración de búsqueda clínica)
+CLINICAL_TSV = "to_tsvector('spanish', clinical_search.body)"
+
+
+def clinical_texts(medical_file_ids, session=None):
+    """{id: texto libre de sus antecedentes} en una sola sentencia (documento o tablas)."""
+    session = session or db.session
+    files = MedicalFile.__table__
+    columns, source = [files.c.id, files.c.backgrounds_doc], files
+    for name, fields in CLINICAL_FIELDS.items():
+        section = db.metadata.tables[name]
+        source = source.outerjoin(section, section.c.medical_file_id == files.c.id)
+        columns += [section.c[field].label(f"{name}__{field}") for field in fields]
+    rows = session.execute(select(*columns).select_from(source).where(files.c.id.in_(medical_file_ids)))
+
+    texts = {}
+    for row in rows.mappings():
+        doc = row["backgrounds_doc"]
+        values = [((doc.get(name) or {}).get(field) if doc is not None else row[f"{name}__{field}"])
+                  for name, fields in CLINICAL_FIELDS.items() for field in fields]
+        texts[row["id"]] = "\n".join(value.strip() for value in values if isinstance(value, str) and value.strip())
+    return texts
+
+
+def reindex_files(medical_file_ids, session=None):
+    """Reemplaza las filas de clinical_search de esos expedientes (sin fila si no tienen texto)."""
+    session = session or db.session
+    ids = sorted(medical_file_ids)
+    entries = ClinicalSearchEntry.__table__
+    now = datetime.now(timezone.utc)
+    texts = clinical_texts(ids, session)
+    session.execute(delete(entries).where(entries.c.medical_file_id.in_(ids)))
+    rows = [{"medical_file_id": i, "body": body, "updated_at": now} for i, body in texts.items() if body]
+    if rows:
+        session.execute(insert(entries), rows)
+
+
+def reindex_all(batch_size=500):
+    """Reconstruye clinical_search para todos los expedientes, por lotes con commit; devuelve cuántos."""
+    files = MedicalFile.__table__
+    done, last_id = 0, 0
+    while True:
+        ids = db.session.execute(select(files.c.id).where(files.c.id > last_id)
+                                 .order_by(files.c.id).limit(batch_size)).scalars().all()
+        if not ids:
+            return done
+        reindex_files(ids)
+        db.session.commit()
+        done += len(ids)
+        last_id = ids[-1]
+
+
+def clinical_changed(medical_file_id, session=None):
+    """Marca el expediente para reindexar su texto antes del commit de la transacción."""
+    (session or db.session).info.setdefault("clinical_changed", set()).add(medical_file_id)
+
+
+def touches_clinical_text(changes):
+    """True si `changes` ({modelo: {columna: valor}}) escribe alguna columna indexada."""
+    return any(set(values) & set(CLINICAL_FIELDS.get(model.__tablename__, ()))
+               for model, values in changes.items())
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _collect_clinical_changes(session, flush_context):
+    for obj in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(obj, CLINICAL_MODELS) or obj.medical_file_id is None:
+            continue
+        # Un antecedente modificado sólo cuenta si cambió su texto libre
+        if obj in session.dirty and not any(attributes.get_history(obj, field).has_changes()
+                                            for field in CLINICAL_FIELDS[obj.__tablename__]):
+            continue
+        clinical_changed(obj.medical_file_id, session)
+
+
+@event.listens_for(RoutingSession, "before_commit")
+def _reindex_changes(session):
+    session.flush()
+    changed = session.info.pop("clinical_changed", None)
+    if changed:
+        reindex_files(changed, session)
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _forget_clinical_changes(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("clinical_changed", None)
+
+
+# ---- Búsqueda clínica: consulta ----
+
+def search_clinical(query, criteria=(), page=1, per_page=DEFAULT_LIMIT):
+    """Expedientes cuyo texto clínico contiene todas las palabras de `query`.
+
+    `criteria` son condiciones sobre MedicalFile (alcance del rol). Devuelve
+    (filas, motor, hay_más); cada fila trae id, file_status, paciente,
+    estudiante y un fragmento con las coincidencias entre corchetes.
+    """
+    terms = query_terms(query)
+    if not terms:
+        return [], None, False
+    per_page = max(1, min(int(per_page), MAX_LIMIT))
+    page = max(1, int(page))
+    patient = aliased(User)
+    entries = ClinicalSearchEntry
+    columns = (MedicalFile.id, MedicalFile.file_status, MedicalFile.selected_student_id,
+               patient.id.label("patient_id"), patient.first_name, patient.first_surname)
+    base = (select(*columns).select_from(MedicalFile).join(patient, patient.id == MedicalFile.user_id)
+            .where(*criteria))
+
+    connection = db.session.connection()
+    dialect = connection.dialect.name
+    if dialect == "postgresql":
+        engine = "postgresql"
+        tsv = literal_column(CLINICAL_TSV)
+        tsquery = func.to_tsquery("spanish", _tsquery(terms))
+        snippet = func.ts_headline("spanish", entries.body, tsquery,
+                                   "StartSel=[, StopSel=], MaxWords=20, MinWords=5")
+        statement = (base.add_columns(snippet.label("snippet"))
+                     .join(entries, entries.medical_file_id == MedicalFile.id)
+                     .where(tsv.op("@@")(tsquery))
+                     .order_by(func.ts_rank(tsv, tsquery).desc(), MedicalFile.id))
+    elif dialect == "sqlite" and _has_sqlite_fts(connection, "clinical_search_fts"):
+        engine = "fts5"
+        fts = literal_column("clinical_search_fts")
+        snippet = func.snippet(fts, 0, "[", "]", "…", 12)
+        statement = (base.add_columns(snippet.label("snippet"))
+                     .join(CLINICAL_FTS, CLINICAL_FTS.c.rowid == MedicalFile.id)
+                     .where(fts.op("MATCH")(_fts5_match(terms)))
+                     .order_by(CLINICAL_FTS.c.rank, MedicalFile.id))
+    else:
+        engine = "like"
+        body = func.lower(entries.body)
+        statement = (base.add_columns(null().label("snippet"))
+                     .join(entries, entries.medical_file_id == MedicalFile.id)
+                     .where(*(body.like("%" + _like_prefix(term), escape="\\") for term in terms))
+                     .order_by(MedicalFile.id))
+
+    rows = db.session.execute(statement.offset((page - 1) * per_page).limit(per_page + 1)).all()
+    return rows[:per_page], engine, len(rows) > per_page
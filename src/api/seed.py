@@ -0,0 +1,304 @@
+"""
+Generador de datos sintéticos para pruebas de rendimiento.
+
+Crea usuarios de cada rol, expedientes en todos los FileStatus con sus cuatro
+antecedentes completos y snapshots. Es determinista para un mismo `seed` y
+escribe con inserciones masivas por lotes (INSERT ... RETURNING en
+executemany), de modo que datasets de millones de filas se generan en minutos.
+
+Lo usan el comando `flask seed` (api/commands.py) y benchmarks/load_test.py.
+"""
+
+import random
+from datetime import date, datetime, timedelta, timezone
+
+from sqlalchemy import insert
+from werkzeug.security import generate_password_hash
+
+from api.models import (
+    db,
+    User,
+    ProfessionalStudentData,
+    MedicalFile,
+    MedicalFileSnapshot,
+    NonPathologicalBackground,
+    PathologicalBackground,
+    FamilyBackground,
+    GynecologicalBackground,
+    UserRole,
+    UserStatus,
+    FileStatus,
+    AcademicGradeProf,
+    CivilStatus,
+    HousingType,
+    QualityLevel,
+    YesNo,
+)
+
+DEFAULT_PASSWORD = "SeedPass123!"
+# Fecha fija de referencia: todas las marcas de tiempo salen de aquí menos un
+# desfase del rng, así el mismo `seed` produce exactamente las mismas filas.
+BASE_DATE = datetime(2025, 1, 1, tzinfo=timezone.utc)
+
+FIRST_NAMES = ["Ana", "Luis", "María", "José", "Carmen", "Jorge", "Lucía", "Pedro", "Sofía", "Diego"]
+SURNAMES = ["García", "Hernández", "López", "Martínez", "Pérez", "Sánchez", "Ramírez", "Cruz", "Flores", "Torres"]
+CAREERS = ["Medicina", "Enfermería", "Nutrición", "Psicología", "Odontología"]
+INSTITUTIONS = ["UNAM", "IPN", "UAM", "UdeG", "BUAP"]
+ALLERGIES = [None, "penicilina", "polen", "mariscos", "ácaros", "sulfas", "látex"]
+CHRONIC = [None, "diabetes tipo 2", "hipertensión", "asma", "hipotiroidismo"]
+MEDICATIONS = [None, "metformina", "losartán", "salbutamol", "levotiroxina"]
+BLOOD_TYPES = ["O+", "O-", "A+", "A-", "B+", "B-", "AB+", "AB-"]
+
+
+def _batches(rows, size):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _insert(model, rows, batch_size, returning=True):
+    """Inserta filas por lotes (un commit por lote). Todas las filas deben
+    traer las mismas claves.
+
+    Con returning=True devuelve los ids en el orden de entrada; si no, el
+    número de filas insertadas.
+    """
+    # insert() sobre la tabla (Core) y no sobre el modelo: el bulk insert del ORM
+    # con RETURNING emite una sentencia por fila en SQLite.
+    table = model.__table__
+    ids = []
+    inserted = 0
+    for batch in _batches(rows, batch_size):
+        if returning:
+            ids.extend(db.session.scalars(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True), batch).all())
+        else:
+            db.session.execute(insert(table), batch)
+        inserted += len(batch)
+        db.session.commit()
+    return ids if returning else inserted
+
+
+def _users(rng, prefix, role, count, password, status=UserStatus.approved):
+    for i in range(count):
+        yield {
+            "first_name": rng.choice(FIRST_NAMES),
+            "first_surname": rng.choice(SURNAMES),
+            "second_surname": rng.choice(SURNAMES),
+            "birth_day": date(1950 + rng.randrange(55), 1 + rng.randrange(12), 1 + rng.randrange(28)),
+            "phone": f"55{rng.randrange(10**8):08d}",
+            "email": f"{prefix}{role.value[:2]}{i}@seed.t",
+            "password": password,
+            "role": role,
+            "status": status,
+        }
+
+
+def _non_pathological(rng, file_id):
+    return {
+        "medical_file_id": file_id,
+        "sex": rng.choice(["female", "male", "other"]),
+        "nationality": "Mexicana",
+        "ethnic_group": rng.choice([None, "mestizo", "nahua", "maya"]),
+        "languages": rng.choice(["español", "español, inglés", "español, náhuatl"]),
+        "blood_type": rng.choice(BLOOD_TYPES),
+        "spiritual_practices": rng.choice([None, "católica", "ninguna"]),
+        "other_origin_info": None,
+        "address": f"Calle {rng.randrange(1, 500)} #{rng.randrange(1, 200)}",
+        "housing_type": rng.choice(list(HousingType)),
+        "civil_status": rng.choice(list(CivilStatus)),
+        "cohabitants": str(rng.randrange(0, 6)),
+        "dependents": str(rng.randrange(0, 4)),
+        "other_living_info": None,
+        "education_institution": rng.choice(INSTITUTIONS),
+        "academic_degree": rng.choice(["secundaria", "preparatoria", "licenciatura"]),
+        "career": rng.choice(CAREERS),
+        "institute_registration_number": f"R{rng.randrange(10**6):06d}",
+        "other_education_info": None,
+        "economic_activity": rng.choice(["empleado", "comerciante", "estudiante", "hogar"]),
+        "is_employer": rng.random() < 0.1,
+        "other_occupation_info": None,
+        "has_medical_insurance": rng.choice(list(YesNo)),
+        "insurance_institution": rng.choice([None, "IMSS", "ISSSTE"]),
+        "insurance_number": f"{rng.randrange(10**10):010d}",
+        "other_insurance_info": None,
+        "diet_quality": rng.choice(list(QualityLevel)),
+        "meals_per_day": rng.randint(1, 5),
+        "daily_liquid_intake_liters": round(rng.uniform(0.5, 3.5), 1),
+        "supplements": rng.choice([None, "vitamina D", "hierro"]),
+        "other_diet_info": None,
+        "hygiene_quality": rng.choice(list(QualityLevel)),
+        "other_hygiene_info": None,
+        "exercise_quality": rng.choice(list(QualityLevel)),
+        "exercise_details": rng.choice([None, "camina 30 min", "gimnasio 3 veces por semana"]),
+        "sleep_quality": rng.choice(list(QualityLevel)),
+        "sleep_details": rng.choice([None, "7 horas", "insomnio ocasional"]),
+        "hobbies": rng.choice(["leer", "futbol", "cocinar", "música"]),
+        "recent_travel": None,
+        "has_piercings": rng.choice(list(YesNo)),
+        "has_tattoos": rng.choice(list(YesNo)),
+        "alcohol_use": rng.choice([None, "social", "ocasional"]),
+        "tobacco_use": rng.choice([None, "no fuma", "5 cigarros al día"]),
+        "other_drug_use": None,
+        "addictions": None,
+        "other_recreational_info": None,
+    }
+
+
+def _pathological(rng, file_id):
+    return {
+        "medical_file_id": file_id,
+        "disability_description": None,
+        "visual_disability": rng.random() < 0.05,
+        "hearing_disability": rng.random() < 0.03,
+        "motor_disability": rng.random() < 0.03,
+        "intellectual_disability": rng.random() < 0.01,
+        "chronic_diseases": rng.choice(CHRONIC),
+        "current_medications": rng.choice(MEDICATIONS),
+        "hospitalizations": rng.choice([None, "apendicectomía 2015"]),
+        "surgeries": rng.choice([None, "cesárea", "colecistectomía"]),
+        "accidents": None,
+        "transfusions": None,
+        "allergies": rng.choice(ALLERGIES),
+        "other_pathological_info": None,
+    }
+
+
+def _family(rng, file_id):
+    return {
+        "medical_file_id": file_id,
+        "hypertension": rng.random() < 0.3,
+        "diabetes": rng.random() < 0.25,
+        "cancer": rng.random() < 0.1,
+        "mental_illnesses": rng.random() < 0.08,
+        "congenital_diseases": rng.random() < 0.03,
+        "heart_diseases": rng.random() < 0.12,
+        "liver_diseases": rng.random() < 0.05,
+        "kidney_diseases": rng.random() < 0.05,
+        "other_family_background_info": None,
+    }
+
+
+def _gynecological(rng, file_id):
+    births = rng.randint(0, 3)
+    return {
+        "medical_file_id": file_id,
+        "menarche_age": rng.randint(9, 15),
+        "pregnancies": births + rng.randint(0, 1),
+        "births": births,
+        "c_sections": rng.randint(0, births),
+        "abortions": 0,
+        "contraceptive_methods": rng.choice([None, "DIU", "preservativo", "hormonal"]),
+        "other_gynecological_info": None,
+    }
+
+
+def seed_dataset(admins=1, professionals=10, students=100, patients=1000,
+                 snapshots_per_file=1, seed=42, prefix=None, batch_size=5000,
+                 password=DEFAULT_PASSWORD, log=None):
+    """Genera el dataset completo. Requiere app context.
+
+    Devuelve un dict con los ids creados: admins, professionals, students y
+    patients (lista de tuplas (patient_id, medical_file_id)), más `counts`.
+    """
+    rng = random.Random(seed)
+    prefix = prefix if prefix is not None else f"s{seed}"
+    log = log or (lambda msg: None)
+    password_hash = generate_password_hash(password)  # un solo hash para todos
+    counts = {}
+
+    admin_ids = _insert(User, _users(rng, prefix, UserRole.admin, admins, password_hash), batch_size)
+    prof_ids = _insert(User, _users(rng, prefix, UserRole.professional, professionals, password_hash), batch_size)
+    stud_ids = _insert(User, _users(rng, prefix, UserRole.student, students, password_hash), batch_size)
+    pat_ids = _insert(User, _users(rng, prefix, UserRole.patient, patients, password_hash), batch_size)
+    counts["users"] = len(admin_ids) + len(prof_ids) + len(stud_ids) + len(pat_ids)
+    log(f"users: {counts['users']}")
+
+    validator = admin_ids[0] if admin_ids else None
+    grades = list(AcademicGradeProf)
+    psd_rows = [{
+        "user_id": uid, "institution": rng.choice(INSTITUTIONS), "career": "Medicina",
+        "academic_grade_prof": rng.choice(grades), "register_number": f"{prefix}P{uid}",
+        "requested_professional_id": None, "requested_at": None,
+        "validated_by_id": validator, "validated_at": BASE_DATE,
+    } for uid in prof_ids]
+    for i, uid in enumerate(stud_ids):
+        prof = prof_ids[i % len(prof_ids)] if prof_ids else None
+        psd_rows.append({
+            "user_id": uid, "institution": rng.choice(INSTITUTIONS), "career": rng.choice(CAREERS),
+            "academic_grade_prof": None,
+            "register_number": f"{prefix}S{uid}", "requested_professional_id": prof,
+            "requested_at": BASE_DATE - timedelta(days=rng.randrange(365)),
+            "validated_by_id": prof, "validated_at": BASE_DATE if prof else None,
+        })
+    counts["professional_student_data"] = _insert(
+        ProfessionalStudentData, psd_rows, batch_size, returning=False)
+
+    # Expedientes: se reparten en orden entre todos los FileStatus
+    statuses = list(FileStatus)
+    file_meta = []
+
+    def file_rows():
+        for i, uid in enumerate(pat_ids):
+            status = statuses[i % len(statuses)]
+            student = stud_ids[i % len(stud_ids)] if stud_ids and status != FileStatus.empty else None
+            prof = prof_ids[(i % len(stud_ids)) % len(prof_ids)] if student and prof_ids else None
+            progressed = BASE_DATE - timedelta(days=rng.randrange(1, 180), minutes=rng.randrange(1440))
+            reviewed = progressed + timedelta(days=rng.randrange(1, 10)) if status in (
+                FileStatus.review, FileStatus.approved, FileStatus.confirmed) else None
+            approved = reviewed + timedelta(days=rng.randrange(1, 5)) if reviewed and status != FileStatus.review else None
+            confirmed = approved + timedelta(days=1) if approved and status == FileStatus.confirmed else None
+            file_meta.append((status, student, progressed))
+            yield {
+                "user_id": uid, "file_status": status,
+                "selected_student_id": student,
+                "student_validated_patient_id": student,
+                "student_validated_patient_at": progressed if student else None,
+                "progressed_by_id": student, "progressed_at": progressed,
+                "reviewed_at": reviewed,
+                "approved_by_id": prof if approved else None, "approved_at": approved,
+                "confirmed_by_id": uid if confirmed else None, "confirmed_at": confirmed,
+                "updated_at": confirmed or approved or reviewed or progressed,
+            }
+
+    file_ids = _insert(MedicalFile, file_rows(), batch_size)
+    counts["medical_file"] = len(file_ids)
+    log(f"medical_file: {counts['medical_file']}")
+
+    filled = [(fid, progressed) for fid, (status, _, progressed) in zip(file_ids, file_meta)
+              if status != FileStatus.empty]
+    for model, builder in ((NonPathologicalBackground, _non_pathological),
+                           (PathologicalBackground, _pathological),
+                           (FamilyBackground, _family),
+                           (GynecologicalBackground, _gynecological)):
+        counts[model.__tablename__] = _insert(
+            model, ({**builder(rng, fid), "updated_at": progressed} for fid, progressed in filled),
+            batch_size, returning=False)
+        log(f"{model.__tablename__}: {counts[model.__tablename__]}")
+
+    def snapshot_rows():
+        for fid, (status, student, _) in zip(file_ids, file_meta):
+            if status in (FileStatus.empty, FileStatus.progress) or not student:
+                continue
+            for n in range(snapshots_per_file):
+                yield {
+                    "medical_file_id": fid, "url": f"/api/uploads/seed-{fid}-{n}.png",
+                    "uploaded_by_id": student, "created_at": BASE_DATE - timedelta(days=n),
+                }
+
+    counts["medical_file_snapshot"] = _insert(
+        MedicalFileSnapshot, snapshot_rows(), batch_size, returning=False)
+    log(f"medical_file_snapshot: {counts['medical_file_snapshot']}")
+
+    return {
+        "admins": admin_ids,
+        "professionals": prof_ids,
+        "students": stud_ids,
+        "patients": list(zip(pat_ids, file_ids)),
+        "counts": counts,
+    }
@@ -0,0 +1,261 @@
+"""
+Estadísticas agregadas para administración (GET /api/stats).
+
+- files_by_status: expedientes por file_status.
+- users: usuarios por rol y estado.
+- students_per_professional: estudiantes validados por cada profesional
+  (ProfessionalStudentData.validated_by_id, el mismo criterio que
+  /professional/review_files).
+- review_backlog: expedientes en review, el más antiguo (reviewed_at) y
+  su reparto por antigüedad.
+
+Dos fuentes para los tres primeros:
+
+- live (default): GROUP BY sobre las tablas.
+- materializada (STATS_MATERIALIZED=1): una fila por contador en
+  stats_counter ("file_status:review", "user:student:approved",
+  "professional_students:<id>"), leídas con un solo SELECT sin importar el
+  volumen. Las escrituras la mantienen en la misma transacción: after_flush
+  calcula los deltas a partir del historial de los atributos (altas, bajas
+  y cambios de file_status, role/status y validated_by_id) y before_commit
+  los suma con un upsert atómico (value = value + delta) por contador, así
+  que escrituras concurrentes no se pisan. Las escrituras por Core avisan
+  con file_status_changed (create_backgrounds).
+  `flask stats-rebuild` recalcula la tabla desde los GROUP BY: hay que
+  ejecutarlo al activar el modo y tras cargas masivas fuera de la app.
+
+review_backlog depende de la hora actual, así que siempre se calcula al
+momento; sólo recorre los expedientes en review (índice en file_status).
+"""
+
+import os
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app, has_app_context
+from sqlalchemy import case, delete, event, func, insert, select
+from sqlalchemy.orm import attributes
+
+from api.database import RoutingSession, upsert
+from api.models import (
+    db, User, ProfessionalStudentData, MedicalFile, StatsCounter, UserRole, UserStatus, FileStatus,
+)
+
+# Tramos de antigüedad del backlog de revisión: (nombre, límite superior)
+BACKLOG_BUCKETS = (("under_1d", timedelta(days=1)), ("1d_to_7d", timedelta(days=7)), ("over_7d", None))
+
+
+def materialized():
+    """True si /api/stats lee (y las escrituras mantienen) stats_counter."""
+    return has_app_context() and current_app.config.get("STATS_MATERIALIZED", False)
+
+
+# ---- Contadores ----
+# Los enums se normalizan: las rutas también asignan el valor como str (p. ej. role=data["role"])
+
+def _file_key(status):
+    return f"file_status:{FileStatus(status).value}"
+
+
+def _user_key(role, status):
+    return f"user:{UserRole(role).value}:{UserStatus(status).value}"
+
+
+def _professional_key(professional_id):
+    return f"professional_students:{professional_id}"
+
+
+def live_counters():
+    """Todos los contadores calculados con GROUP BY ({nombre: valor})."""
+    counters = {}
+    for status, total in db.session.execute(
+            select(MedicalFile.file_status, func.count(MedicalFile.id)).group_by(MedicalFile.file_status)):
+        counters[_file_key(status)] = total
+    for role, status, total in db.session.execute(
+            select(User.role, User.status, func.count(User.id)).group_by(User.role, User.status)):
+        counters[_user_key(role, status)] = total
+    for professional_id, total in db.session.execute(
+            select(ProfessionalStudentData.validated_by_id, func.count(ProfessionalStudentData.id))
+            .join(User, User.id == ProfessionalStudentData.user_id)
+            .where(User.role == UserRole.student, ProfessionalStudentData.validated_by_id.isnot(None))
+            .group_by(ProfessionalStudentData.validated_by_id)):
+        counters[_professional_key(professional_id)] = total
+    return counters
+
+
+def stored_counters():
+    """Contadores de stats_counter ({nombre: valor}), sin los que quedaron en cero."""
+    rows = db.session.execute(select(StatsCounter.name, StatsCounter.value).where(StatsCounter.value != 0))
+    return dict(rows.all())
+
+
+def counters():
+    """Contadores de la fuente activa (materializada o live)."""
+    return stored_counters() if materialized() else live_counters()
+
+
+def rebuild_counters():
+    """Reemplaza stats_counter con los GROUP BY actuales (no hace commit); devuelve cuántos."""
+    values = live_counters()
+    db.session.execute(delete(StatsCounter.__table__))
+    if values:
+        db.session.execute(insert(StatsCounter.__table__), [{"name": k, "value": v} for k, v in values.items()])
+    return len(values)
+
+
+# ---- Mantenimiento incremental ----
+
+def _add(session, key, delta):
+    session.info.setdefault("stats_deltas", Counter())[key] += delta
+
+
+def file_status_changed(old_status, new_status, session=None):
+    """Registra un cambio de file_status hecho por Core (fuera del ORM)."""
+    if materialized() and old_status != new_status:
+        session = session or db.session
+        _add(session, _file_key(old_status), -1)
+        _add(session, _file_key(new_status), 1)
+
+
+def _old(obj, name):
+    """Valor del atributo antes del flush.
+
+    Los atributos contados se mapean con active_history=True (api/models.py):
+    el valor anterior está en el historial aunque estuviera expirado al asignar.
+    """
+    history = attributes.get_history(obj, name)
+    return history.deleted[0] if history.deleted else getattr(obj, name)
+
+
+def _changed(obj, *names):
+    return any(attributes.get_history(obj, name).has_changes() for name in names)
+
+
+def _student_deltas(session, obj, sign, professional_id):
+    if professional_id is not None and obj.user is not None and obj.user.role == UserRole.student:
+        _add(session, _professional_key(professional_id), sign)
+
+
+@event.listens_for(RoutingSession, "after_flush")
+def _collect_deltas(session, flush_context):
+    if not materialized():
+        return
+    for obj in session.new:
+        if isinstance(obj, MedicalFile):
+            _add(session, _file_key(obj.file_status), 1)
+        elif isinstance(obj, User):
+            _add(session, _user_key(obj.role, obj.status), 1)
+        elif isinstance(obj, ProfessionalStudentData):
+            _student_deltas(session, obj, 1, obj.validated_by_id)
+    for obj in session.deleted:
+        if isinstance(obj, MedicalFile):
+            _add(session, _file_key(_old(obj, "file_status")), -1)
+        elif isinstance(obj, User):
+            _add(session, _user_key(_old(obj, "role"), _old(obj, "status")), -1)
+        elif isinstance(obj, ProfessionalStudentData):
+            _student_deltas(session, obj, -1, _old(obj, "validated_by_id"))
+    for obj in session.dirty:
+        if isinstance(obj, MedicalFile) and _changed(obj, "file_status"):
+            _add(session, _file_key(_old(obj, "file_status")), -1)
+            _add(session, _file_key(obj.file_status), 1)
+        elif isinstance(obj, User) and _changed(obj, "role", "status"):
+            _add(session, _user_key(_old(obj, "role"), _old(obj, "status")), -1)
+            _add(session, _user_key(obj.role, obj.status), 1)
+        elif isinstance(obj, ProfessionalStudentData) and _changed(obj, "validated_by_id"):
+            _student_deltas(session, obj, -1, _old(obj, "validated_by_id"))
+            _student_deltas(session, obj, 1, obj.validated_by_id)
+
+
+def apply_deltas(deltas, session=None):
+    """Suma `deltas` ({nombre: delta}) a stats_counter, en orden de nombre (evita deadlocks)."""
+    session = session or db.session
+    table = StatsCounter.__table__
+    for name, delta in sorted(deltas.items()):
+        if delta != 0:
+            upsert(session, table, {"name": name}, {"value": delta}, {"value": table.c.value + delta})
+
+
+@event.listens_for(RoutingSession, "before_commit")
+def _apply_deltas(session):
+    session.flush()
+    deltas = session.info.pop("stats_deltas", None)
+    if deltas:
+        apply_deltas(deltas, session)
+
+
+@event.listens_for(RoutingSession, "after_transaction_end")
+def _forget_deltas(session, transaction):
+    if transaction.parent is None:
+        session.info.pop("stats_deltas", None)
+
+
+# ---- Respuesta ----
+
+def review_backlog(now=None):
+    """Expedientes en review: total, el más antiguo y reparto por antigüedad (una consulta)."""
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)  # reviewed_at se guarda en UTC sin zona
+    bucket = case(*((MedicalFile.reviewed_at > now - limit, name) for name, limit in BACKLOG_BUCKETS if limit),
+                  else_=BACKLOG_BUCKETS[-1][0])
+    rows = db.session.execute(
+        select(bucket, func.count(MedicalFile.id), func.min(MedicalFile.reviewed_at))
+        .where(MedicalFile.file_status == FileStatus.review).group_by(bucket)).all()
+
+    by_age = {name: 0 for name, _ in BACKLOG_BUCKETS}
+    oldest = None
+    for name, total, first in rows:
+        by_age[name] = total
+        if first is not None and (oldest is None or first < oldest):
+            oldest = first
+    return {
+        "count": sum(by_age.values()),
+        "oldest_reviewed_at": oldest.isoformat() if oldest else None,
+        "oldest_age_hours": round((now - oldest).total_seconds() / 3600, 1) if oldest else None,
+        "by_age": by_age,
+    }
+
+
+def _group_users(values):
+    result = {}
+    for name, total in values.items():
+        if name.startswith("user:") and total:
+            _, role, status = name.split(":")
+            result.setdefault(role, {})[status] = total
+    return result
+
+
+def user_counts():
+    """{rol: {estado: total}} con una consulta (sólo combinaciones con usuarios); lo usa /dashboard."""
+    if materialized():
+        rows = db.session.execute(select(StatsCounter.name, StatsCounter.value)
+                                  .where(StatsCounter.name.like("user:%"), StatsCounter.value != 0))
+        return _group_users(dict(rows.all()))
+    rows = db.session.execute(select(User.role, User.status, func.count(User.id)).group_by(User.role, User.status))
+    return _group_users({_user_key(role, status): total for role, status, total in rows})
+
+
+def stats():
+    """Cuerpo de GET /api/stats."""
+    values = counters()
+    files_by_status = {status.value: values.get(_file_key(status), 0) for status in FileStatus}
+
+    per_professional = {int(name.split(":")[1]): total for name, total in values.items()
+                        if name.startswith("professional_students:") and total}
+    names = dict(db.session.execute(
+        select(User.id, User.first_name + " " + User.first_surname).where(User.id.in_(per_professional))
+    ).all()) if per_professional else {}
+    students = sorted(({"professional_id": pid, "full_name": names.get(pid), "students": total}
+                       for pid, total in per_professional.items()),
+                      key=lambda row: (-row["students"], row["professional_id"]))
+
+    return {
+        "source": "materialized" if materialized() else "live",
+        "files_by_status": files_by_status,
+        "users": _group_users(values),
+        "students_per_professional": students,
+        "review_backlog": review_backlog(),
+    }
+
+
+def setup_stats(app):
+    """Lee STATS_MATERIALIZED (0 por defecto)."""
+    app.config.setdefault("STATS_MATERIALIZED", os.getenv("STATS_MATERIALIZED", "0") == "1")
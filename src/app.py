@@ -1,20 +1,32 @@
 """
 This module takes care of starting the API Server, Loading the DB and Adding the endpoints
 """
+import logging
 import os
 from flask import Flask, request, jsonify, send_from_directory
 from flask_migrate import Migrate
 from api.utils import APIException, generate_sitemap
 from api.models import db
+from api.database import build_engine_options, configure_sqlite_engine, configure_replica
 from api.routes import api
 from api.admin import setup_admin
 from api.commands import setup_commands
+from api.instrumentation import setup_query_instrumentation
+from api.metrics import setup_metrics
+from api.profiling import setup_profiling
+from api.drafts import setup_drafts
+from api.cache import setup_cache
+from api.stats import setup_stats
+from api.logs import setup_logging
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from werkzeug.security import generate_password_hash
 from sqlalchemy import create_engine, text, bindparam
 
 app = Flask(__name__)
+# Logging estructurado antes que nada (ver api/logs.py)
+setup_logging(app)
+logger = logging.getLogger(__name__)
 
 # Ambiente (evaluado temprano para decidir comportamiento en dev/prod)
 ENV = "development" if os.getenv("FLASK_DEBUG") == "1" else "production"
@@ -79,8 +91,8 @@ if db_url is not None:
             app.config['SQLALCHEMY_DATABASE_URI'] = normalized
         except Exception as e:
             # Fallback seguro a SQLite si psycopg2 no está disponible/compatible
-            print(
-                f"[WARN] psycopg2 no disponible ({e}). Usando SQLite persistente.")
+            logger.warning(
+                "psycopg2 no disponible (%s). Usando SQLite persistente.", e)
             app.config['SQLALCHEMY_DATABASE_URI'] = _sqlite_uri_default()
     else:
         app.config['SQLALCHEMY_DATABASE_URI'] = normalized
@@ -89,9 +101,19 @@ else:
     app.config['SQLALCHEMY_DATABASE_URI'] = _sqlite_uri_default()
 
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# Pool de conexiones configurable por entorno (ver api/database.py)
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = build_engine_options(
+    app.config['SQLALCHEMY_DATABASE_URI'])
+# Réplica de lectura opcional (DATABASE_REPLICA_URL); debe ir antes de init_app
+configure_replica(app)
 MIGRATE = Migrate(app, db, compare_type=True)
 db.init_app(app)
 
+# Perfil SQLite (WAL + pragmas + BEGIN IMMEDIATE en escrituras) antes de abrir conexiones
+with app.app_context():
+    for _engine in db.engines.values():
+        configure_sqlite_engine(_engine)
+
 # En entornos de desarrollo con SQLite, crear el esquema automáticamente si no existen tablas
 try:
     with app.app_context():
@@ -113,8 +135,8 @@ try:
                 # Evitar migrar desde el mismo origen
                 target_uri = app.config.get('SQLALCHEMY_DATABASE_URI', '')
                 if (from_url == target_uri):
-                    print(
-                        '[MIGRATE] Origen y destino son iguales; se omite migración.')
+                    logger.info(
+                        'Migración legacy: origen y destino son iguales; se omite.')
                     return
 
                 # Contar usuarios existentes para duplicados
@@ -217,8 +239,8 @@ try:
 
                 if inserted > 0 or updated > 0:
                     db.session.commit()
-                print(
-                    f"[MIGRATE] Usuarios insertados: {inserted} (existentes previos: {existing_count})")
+                logger.info(
+                    "Migración legacy: usuarios insertados: %s (existentes previos: %s)", inserted, existing_count)
 
                 # Construir mapa email -> id destino
                 email_list = list(legacy_id_to_email.values())
@@ -329,8 +351,8 @@ try:
 
                 if psd_inserted:
                     db.session.commit()
-                print(
-                    f"[MIGRATE] ProfessionalStudentData insertados: {psd_inserted}")
+                logger.info(
+                    "Migración legacy: ProfessionalStudentData insertados: %s", psd_inserted)
 
                 # ---------------- Migrar MedicalFile ----------------
                 with src_engine.connect() as conn:
@@ -392,7 +414,7 @@ try:
 
                 if mf_inserted:
                     db.session.commit()
-                print(f"[MIGRATE] MedicalFile creados: {mf_inserted}")
+                logger.info("Migración legacy: MedicalFile creados: %s", mf_inserted)
 
                 # Helper para parsear filas y setear sólo atributos existentes en modelos
                 def copy_row_to_model(model_obj, row_mapping, ignore_keys):
@@ -429,7 +451,7 @@ try:
                         count += 1
                     if count:
                         db.session.commit()
-                    print(f"[MIGRATE] {table_name} insertados: {count}")
+                    logger.info("Migración legacy: %s insertados: %s", table_name, count)
 
                 migrate_background(
                     'non_pathological_background', NonPathologicalBackground)
@@ -479,18 +501,24 @@ try:
                     snap_inserted += 1
                 if snap_inserted:
                     db.session.commit()
-                print(f"[MIGRATE] Snapshots insertados: {snap_inserted}")
-            except Exception as me:
+                logger.info("Migración legacy: snapshots insertados: %s", snap_inserted)
+            except Exception:
                 db.session.rollback()
-                print(f"[MIGRATE] Falló migración de usuarios: {me}")
+                logger.exception("Migración legacy: falló la migración de usuarios")
 
         _migrate_legacy_users()
-except Exception as _e:
+except Exception:
     # Evitar que un fallo aquí detenga la app; se puede seguir usando migraciones
-    pass
+    logger.exception("Falló la creación automática del esquema")
 
 setup_admin(app)
 setup_commands(app)
+setup_query_instrumentation(app)
+setup_metrics(app)
+setup_profiling(app)
+setup_drafts(app)
+setup_cache(app)
+setup_stats(app)
 
 app.register_blueprint(api, url_prefix='/api')
 
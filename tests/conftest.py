@@ -1,7 +1,12 @@
 import os
 import sys
+import uuid
+from contextlib import contextmanager
+from datetime import date
 from pathlib import Path
 import pytest
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 # Asegurar que el paquete `api` (ubicado en `src/`) sea importable en los tests
 ROOT = Path(__file__).resolve().parents[1]
@@ -17,6 +22,88 @@ except Exception:
     psycopg2 = None
 
 
+class QueryCounter:
+    """Sentencias SQL ejecutadas dentro de un bloque `with count_queries()`."""
+
+    def __init__(self):
+        self.statements = []
+
+    @property
+    def count(self):
+        return len(self.statements)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        self.statements.append(statement)
+
+
+@pytest.fixture
+def count_queries():
+    """Cuenta las sentencias que llegan a cualquier engine durante el bloque.
+
+    Uso:
+        with count_queries() as q:
+            client.get('/api/users', headers=headers)
+        assert q.count <= 3, q.statements
+    """
+    @contextmanager
+    def _count():
+        counter = QueryCounter()
+        event.listen(Engine, "before_cursor_execute", counter._record)
+        try:
+            yield counter
+        finally:
+            event.remove(Engine, "before_cursor_execute", counter._record)
+    return _count
+
+
+class FileContext:
+    """Expediente creado por `make_file`: su id y los ids/tokens de sus usuarios por nombre."""
+
+    def __init__(self, file_id, tag, ids, tokens):
+        self.id = file_id
+        self.tag = tag
+        self.ids = ids
+        self.tokens = tokens
+
+    def headers(self, name="student", **extra):
+        return {"Authorization": f"Bearer {self.tokens[name]}", **extra}
+
+
+@pytest.fixture
+def make_file():
+    """Fábrica: estudiante + paciente con su expediente asignado al estudiante (con commit).
+
+    Uso:
+        f = make_file(file_status=FileStatus.progress,
+                      users={"prof": UserRole.professional, "pending": (UserRole.student, UserStatus.pre_approved)},
+                      non_pathological_background=NonPathologicalBackground(hobbies="leer"))
+        client.get(f"/api/medical_file/{f.id}", headers=f.headers("student"))
+
+    `users` agrega (o reemplaza) usuarios por nombre: rol o (rol, estado); por
+    defecto aprobados. El resto de kwargs van a MedicalFile.
+    """
+    from app import app
+    from api.models import db, User, MedicalFile, UserRole, UserStatus
+    from flask_jwt_extended import create_access_token
+
+    def _make(users=None, **file_kwargs):
+        tag = uuid.uuid4().hex[:6]
+        specs = {"student": UserRole.student, "patient": UserRole.patient, **(users or {})}
+        with app.app_context():
+            people = {}
+            for name, spec in specs.items():
+                role, status = spec if isinstance(spec, tuple) else (spec, UserStatus.approved)
+                people[name] = User(first_name=name, first_surname="Test", birth_day=date(1990, 1, 1),
+                                    email=f"{name}{tag}@t.t", password="x", role=role, status=status)
+            file_kwargs.setdefault("selected_student", people["student"])
+            medical_file = MedicalFile(user=people["patient"], **file_kwargs)
+            db.session.add_all([*people.values(), medical_file])
+            db.session.commit()
+            return FileContext(medical_file.id, tag, {name: u.id for name, u in people.items()},
+                               {name: create_access_token(identity=str(u.id)) for name, u in people.items()})
+    return _make
+
+
 @pytest.fixture(scope='session')
 def db_conn():
     """Provee una conexión a la DB de pruebas si DATABASE_URL apunta a Postgres.
@@ -0,0 +1,80 @@
+import pytest
+
+from app import app
+from api.models import db, MedicalFile, NonPathologicalBackground, FamilyBackground, BACKGROUND_SECTIONS
+
+ROW_FIELDS = ("id", "version", "updated_at")
+
+
+@pytest.fixture
+def table_file(make_file):
+    f = make_file(non_pathological_background=NonPathologicalBackground(hobbies="leer", blood_type="O+"),
+                  family_background=FamilyBackground(diabetes=True))
+    return f.id, f.headers()
+
+
+def _get(file_id, headers):
+    rv = app.test_client().get(f"/api/medical_file/{file_id}", headers=headers)
+    assert rv.status_code == 200
+    return rv.get_json()["medical_file"]
+
+
+def _content(section):
+    return {k: v for k, v in section.items() if k not in ROW_FIELDS} if section else None
+
+
+def test_first_write_moves_file_to_document(table_file, monkeypatch, count_queries):
+    file_id, headers = table_file
+    before = _get(file_id, headers)
+    monkeypatch.setitem(app.config, "BACKGROUNDS_STORAGE", "document")
+
+    rv = app.test_client().patch(f"/api/medical_file/{file_id}/backgrounds", headers=headers, json={
+        "family_background": {"cancer": True}, "gynecological_background": {"births": 2}})
+    assert rv.status_code == 200, rv.get_data(as_text=True)
+
+    with count_queries() as q:
+        after = _get(file_id, headers)
+    assert not any(f"{name}." in s for s in q.statements for name in BACKGROUND_SECTIONS), q.statements
+
+    # Mismo JSON que con tablas: la sección no tocada queda idéntica
+    assert after["non_pathological_background"] == before["non_pathological_background"]
+    family = after["family_background"]
+    assert family["version"] == before["family_background"]["version"] + 1
+    assert (family["diabetes"], family["cancer"], family["medical_file_id"]) == (True, True, file_id)
+    gyneco = after["gynecological_background"]
+    assert (gyneco["births"], gyneco["pregnancies"], gyneco["version"]) == (2, None, 1)
+    assert after["pathological_background"] is None
+
+    with app.app_context():
+        medical_file = db.session.get(MedicalFile, file_id)
+        assert (medical_file.blood_type, medical_file.family_diabetes) == ("O+", True)
+        assert db.session.query(FamilyBackground).filter_by(medical_file_id=file_id).count() == 0
+
+    # Un expediente en documento sigue escribiéndose ahí también con el modo tablas
+    monkeypatch.setitem(app.config, "BACKGROUNDS_STORAGE", "tables")
+    rv = app.test_client().post("/api/backgrounds/save", headers=headers, json={
+        "medical_file_id": file_id, "family_background": {"diabetes": False, "no_existe": 1}})
+    assert rv.status_code == 200, rv.get_data(as_text=True)
+    assert _get(file_id, headers)["family_background"]["diabetes"] is False
+    with app.app_context():
+        assert db.session.get(MedicalFile, file_id).family_diabetes is False
+
+
+def test_storage_command_moves_documents_back_to_tables(table_file, monkeypatch):
+    file_id, headers = table_file
+    monkeypatch.setitem(app.config, "BACKGROUNDS_STORAGE", "document")
+    assert app.test_client().patch(f"/api/medical_file/{file_id}/backgrounds", headers=headers, json={
+        "non_pathological_background": {"sleep_quality": "good"}}).status_code == 200
+    in_document = _get(file_id, headers)
+    monkeypatch.setitem(app.config, "BACKGROUNDS_STORAGE", "tables")
+
+    result = app.test_cli_runner().invoke(args=["backgrounds-storage", "tables"])
+    assert result.exit_code == 0, result.output
+
+    with app.app_context():
+        medical_file = db.session.get(MedicalFile, file_id)
+        assert medical_file.backgrounds_doc is None and medical_file.blood_type is None
+        assert medical_file.non_pathological_background.sleep_quality.value == "good"
+    in_tables = _get(file_id, headers)
+    for name in BACKGROUND_SECTIONS:
+        assert _content(in_tables[name]) == _content(in_document[name]), name
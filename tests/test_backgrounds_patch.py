@@ -0,0 +1,99 @@
+import pytest
+
+from app import app
+from api.models import db, MedicalFile, NonPathologicalBackground, FamilyBackground, UserRole
+
+
+@pytest.fixture
+def patch_file(make_file):
+    f = make_file(non_pathological_background=NonPathologicalBackground(hobbies="leer", blood_type="O+"))
+    return f.id, f.headers()
+
+
+def _patch(file_id, headers, body, **extra):
+    return app.test_client().patch(f"/api/medical_file/{file_id}/backgrounds", json=body,
+                                   headers={**headers, **extra})
+
+
+def test_patch_updates_only_sent_columns(patch_file, count_queries):
+    file_id, headers = patch_file
+    with count_queries() as q:
+        rv = _patch(file_id, headers, {
+            "non_pathological_background": {"sleep_quality": "good", "daily_liquid_intake_liters": "1.5"},
+            "family_background": {"diabetes": True},
+        }, **{"If-Match": '"1"'})
+    assert rv.status_code == 200, rv.get_data(as_text=True)
+    assert rv.get_json()["version"] == 2
+
+    # Una sentencia (upsert) por sección, exista o no la fila
+    for table in ("non_pathological_background", "family_background"):
+        writes = [s for s in q.statements if f" {table} " in s or f" {table}(" in s]
+        assert len(writes) == 1 and "ON CONFLICT" in writes[0], writes
+    upsert = next(s for s in q.statements if "INTO non_pathological_background" in s)
+    assert "sleep_quality" in upsert and "hobbies" not in upsert
+
+    with app.app_context():
+        medical_file = db.session.get(MedicalFile, file_id)
+        background = medical_file.non_pathological_background
+        assert (background.hobbies, background.blood_type) == ("leer", "O+")
+        assert background.sleep_quality.value == "good" and background.daily_liquid_intake_liters == 1.5
+        assert background.version == 2
+        assert db.session.query(FamilyBackground).filter_by(medical_file_id=file_id).one().diabetes is True
+
+
+def test_patch_rejects_unknown_fields_and_bad_types(patch_file):
+    file_id, headers = patch_file
+    rv = _patch(file_id, headers, {
+        "non_pathological_background": {"id": 5, "sleep_quality": "excelente", "pets": 7},
+        "family_background": {"cancer": "yes"},
+    })
+    assert rv.status_code == 400
+    fields = rv.get_json()["fields"]
+    assert set(fields["non_pathological_background"]) == {"id", "sleep_quality", "pets"}
+    assert set(fields["family_background"]) == {"cancer"}
+    with app.app_context():
+        assert db.session.get(MedicalFile, file_id).version == 1
+
+
+def test_patch_with_stale_version_conflicts(patch_file):
+    file_id, headers = patch_file
+    assert _patch(file_id, headers, {"family_background": {"cancer": True}, "version": 1}).status_code == 200
+    stale = _patch(file_id, headers, {"family_background": {"cancer": False}, "version": 1})
+    assert stale.status_code == 409 and stale.get_json()["current_version"] == 2
+    assert _patch(999999, headers, {"family_background": {"cancer": True}}).status_code == 404
+
+
+def test_only_the_assigned_student_can_patch_or_draft(make_file):
+    f = make_file(users={"intruder": UserRole.student})
+    client = app.test_client()
+    body = {"family_background": {"cancer": True}}
+    draft = f"/api/medical_file/{f.id}/backgrounds/draft"
+    for name in ("intruder", "patient"):
+        assert _patch(f.id, f.headers(name), body).status_code == 403
+        assert client.put(draft, json=body, headers=f.headers(name)).status_code == 403
+        assert client.get(draft, headers=f.headers(name)).status_code == 403
+    assert client.get(draft, headers=f.headers()).status_code == 200
+    with app.app_context():
+        assert db.session.get(MedicalFile, f.id).version == 1
+
+
+def test_create_backgrounds_upserts_without_duplicates(patch_file, count_queries):
+    file_id, headers = patch_file
+    client = app.test_client()
+    body = {"medical_file_id": file_id, "family_background": {"diabetes": True},
+            "non_pathological_background": {"hobbies": "correr"}}
+    assert client.post("/api/backgrounds", json=body, headers=headers).status_code == 201
+    with count_queries() as q:
+        rv = client.post("/api/backgrounds", json={**body, "family_background": {"cancer": True}}, headers=headers)
+    assert rv.status_code == 201 and rv.get_json()["version"] == 3
+    assert sum("ON CONFLICT" in s for s in q.statements) == 4
+
+    with app.app_context():
+        for model in (NonPathologicalBackground, FamilyBackground):
+            assert db.session.query(model).filter_by(medical_file_id=file_id).count() == 1
+        medical_file = db.session.get(MedicalFile, file_id)
+        assert medical_file.file_status.value == "review"
+        assert medical_file.non_pathological_background.hobbies == "correr"
+        # La fila existente se reescribe con el nuevo payload completo
+        family = medical_file.family_background
+        assert (family.diabetes, family.cancer, family.version) == (False, True, 2)
@@ -0,0 +1,96 @@
+from sqlalchemy import update
+
+from app import app
+from api.cache import FileCache, LRUCache
+from api.models import db, MedicalFileSnapshot, User
+
+
+def test_lru_evicts_oldest_and_expires():
+    lru = LRUCache(max_entries=2, ttl=10)
+    lru.set("a", "1", now=0)
+    lru.set("b", "2", now=0)
+    assert lru.get("a", now=1) == "1"  # "a" pasa a ser la más reciente
+    lru.set("c", "3", now=1)
+    assert lru.get("b", now=1) is None and lru.get("a", now=1) == "1"
+    assert lru.get("c", now=11) is None
+
+
+def test_file_cache_is_shared_and_invalidated_by_prefix(tmp_path):
+    worker_a, worker_b = FileCache(str(tmp_path), ttl=10), FileCache(str(tmp_path), ttl=10)
+    worker_a.set("medical_file:7:1", '{"v": 1}', now=0)
+    worker_a.set("medical_file:70:1", '{"v": 70}', now=0)
+    assert worker_b.get("medical_file:7:1", now=1) == '{"v": 1}'
+    worker_b.delete_prefix("medical_file:7:")
+    assert worker_a.get("medical_file:7:1", now=0) is None
+    assert worker_a.get("medical_file:70:1", now=0) == '{"v": 70}'
+
+
+def test_medical_file_is_served_from_cache_until_a_write(make_file, count_queries):
+    f = make_file()
+    file_id, student_id, headers = f.id, f.ids["student"], f.headers()
+    client = app.test_client()
+    store = app.extensions["cache"]
+
+    def get():
+        with count_queries() as q:
+            rv = client.get(f"/api/medical_file/{file_id}", headers=headers)
+        assert rv.status_code == 200
+        return rv.get_json()["medical_file"], [s for s in q.statements if s.lstrip().startswith("SELECT")]
+
+    first, _ = get()
+    hits = store.counters["medical_file"]["hits"]
+    cached, selects = get()
+    assert cached == first and len(selects) == 1  # sólo el marcador del ETag
+    assert store.counters["medical_file"]["hits"] == hits + 1
+
+    # Escritura por Core (PATCH) y por el ORM (snapshot): se invalida al hacer commit
+    invalidations = store.counters["medical_file"]["invalidations"]
+    assert client.patch(f"/api/medical_file/{file_id}/backgrounds", headers=headers,
+                        json={"family_background": {"cancer": True}}).status_code == 200
+    assert get()[0]["family_background"]["cancer"] is True
+    with app.app_context():
+        db.session.add(MedicalFileSnapshot(medical_file_id=file_id, url="/api/uploads/c.png",
+                                           uploaded_by_id=student_id))
+        db.session.commit()
+    assert get()[0]["version"] == first["version"] + 2
+    assert store.counters["medical_file"]["invalidations"] == invalidations + 2
+
+    stats = client.get("/api/health/cache", headers=headers)
+    assert stats.status_code == 403
+
+
+def test_private_is_cached_per_user_until_its_data_changes(make_file, count_queries):
+    f = make_file(selected_student=None)
+    student_id, headers = f.ids["student"], f.headers("patient")
+    client = app.test_client()
+
+    def private():
+        with count_queries() as q:
+            rv = client.get("/api/private", headers=headers)
+        assert rv.status_code == 200
+        return rv.get_json()["user"], [s for s in q.statements if s.lstrip().startswith("SELECT")]
+
+    first, _ = private()
+    again, selects = private()
+    assert again == first and len(selects) == 1  # sólo el marcador
+    assert first["patient_requested_student_id"] is None
+
+    assert client.post(f"/api/patient/request_student_validation/{student_id}", headers=headers).status_code == 200
+    assert private()[0]["patient_requested_student_id"] == student_id
+    assert client.delete("/api/patient/cancel_student_request", headers=headers).status_code == 200
+    assert private()[0]["patient_requested_student_id"] is None
+
+
+def test_private_key_follows_writes_seen_by_other_workers(make_file):
+    f = make_file(selected_student=None)
+    client = app.test_client()
+    store = app.extensions["cache"]
+    assert client.get("/api/private", headers=f.headers("patient")).status_code == 200
+
+    # Otro worker confirma el cambio: la invalidación de este no se entera
+    with app.app_context():
+        db.session.execute(update(User).where(User.id == f.ids["patient"]).values(phone="555"))
+        db.session.commit()
+    misses = store.counters["private"]["misses"]
+    assert client.get("/api/private", headers=f.headers("patient")).get_json()["user"]["phone"] == "555"
+    assert store.counters["private"]["misses"] == misses + 1
@@ -0,0 +1,140 @@
+import pytest
+
+from sqlalchemy import update
+
+from app import app
+from api.drafts import DraftStore, FileDraftStore, setup_drafts
+from api.models import db, MedicalFile, FamilyBackground, FileStatus
+
+
+@pytest.fixture
+def draft_file(make_file, monkeypatch):
+    monkeypatch.setattr(app.extensions["drafts"], "flush_seconds", 3600)
+    f = make_file(file_status=FileStatus.progress)
+    return f.id, f.headers()
+
+
+def _draft(file_id, headers, body):
+    return app.test_client().put(f"/api/medical_file/{file_id}/backgrounds/draft", json=body, headers=headers)
+
+
+def _family(file_id):
+    with app.app_context():
+        version = db.session.get(MedicalFile, file_id).version
+        family = db.session.query(FamilyBackground).filter_by(medical_file_id=file_id).one_or_none()
+        return version, (family.diabetes, family.cancer) if family else None
+
+
+def test_saves_are_coalesced_until_mark_review(draft_file):
+    file_id, headers = draft_file
+    assert _draft(file_id, headers, {"family_background": {"diabetes": True}}).status_code == 202
+    assert _draft(file_id, headers, {"family_background": {"cancer": True}}).status_code == 202
+    assert _family(file_id) == (1, None)
+
+    pending = app.test_client().get(f"/api/medical_file/{file_id}/backgrounds/draft", headers=headers)
+    assert pending.get_json()["changes"] == {"family_background": {"diabetes": True, "cancer": True}}
+
+    # mark_review escribe el borrador antes de cambiar el estado, en la misma transacción
+    rv = app.test_client().put(f"/api/student/mark_review/{file_id}", headers={**headers, "If-Match": '"1"'})
+    assert rv.status_code == 200, rv.get_data(as_text=True)
+    assert _family(file_id) == (rv.get_json()["version"], (True, True))
+    assert app.test_client().get(f"/api/medical_file/{file_id}/backgrounds/draft",
+                                 headers=headers).get_json()["changes"] == {}
+
+
+def test_due_draft_is_written_immediately(draft_file, monkeypatch):
+    file_id, headers = draft_file
+    monkeypatch.setattr(app.extensions["drafts"], "flush_seconds", 0)
+    rv = _draft(file_id, headers, {"family_background": {"diabetes": True}})
+    assert rv.status_code == 200 and rv.get_json()["version"] == 2
+    assert _family(file_id) == (2, (True, False))
+
+
+def test_invalid_draft_is_rejected_and_failed_write_keeps_draft(draft_file):
+    file_id, headers = draft_file
+    assert _draft(file_id, headers, {"family_background": {"diabetes": "si"}}).status_code == 400
+
+    assert _draft(file_id, headers, {"family_background": {"diabetes": True}}).status_code == 202
+    stale = app.test_client().patch(f"/api/medical_file/{file_id}/backgrounds",
+                                    json={"family_background": {"cancer": True}, "version": 7}, headers=headers)
+    assert stale.status_code == 409
+    pending = app.test_client().get(f"/api/medical_file/{file_id}/backgrounds/draft", headers=headers)
+    assert pending.get_json()["changes"] == {"family_background": {"diabetes": True}}
+
+
+def test_file_store_is_shared_between_workers(tmp_path):
+    worker_a, worker_b = FileDraftStore(str(tmp_path)), FileDraftStore(str(tmp_path))
+    worker_a.merge(7, {"family_background": {"diabetes": True}}, now=100, base_version=3)
+    worker_b.merge(7, {"family_background": {"cancer": True}}, now=105, base_version=4)
+    assert worker_a.due(older_than=101) == [7]
+    assert worker_b.due(older_than=99) == []
+    assert worker_b.take(7) == {"changes": {"family_background": {"diabetes": True, "cancer": True}},
+                                "since": 100, "base_version": 3, "conflict": False}
+    assert worker_a.take(7) is None
+
+
+def _concurrent_write(file_id):
+    with app.app_context():
+        db.session.execute(update(MedicalFile).where(MedicalFile.id == file_id)
+                           .values(version=MedicalFile.version + 1))
+        db.session.commit()
+
+
+def test_draft_written_after_a_concurrent_change_conflicts_and_is_kept(draft_file):
+    file_id, headers = draft_file
+    client = app.test_client()
+    path = f"/api/medical_file/{file_id}/backgrounds/draft"
+    buffered = _draft(file_id, headers, {"family_background": {"diabetes": True}})
+    assert buffered.status_code == 202 and buffered.get_json()["base_version"] == 1
+
+    _concurrent_write(file_id)
+    rv = client.put(f"/api/student/mark_review/{file_id}", headers=headers)
+    assert rv.status_code == 409 and rv.get_json()["draft_conflict"] is True
+    assert (rv.get_json()["base_version"], rv.get_json()["current_version"]) == (1, 2)
+    assert _family(file_id) == (2, None)
+
+    # El borrador sigue ahí, marcado en conflicto, y no admite más cambios
+    pending = client.get(path, headers=headers).get_json()
+    assert pending["changes"] == {"family_background": {"diabetes": True}} and pending["conflict"] is True
+    assert _draft(file_id, headers, {"family_background": {"cancer": True}}).status_code == 409
+    assert app.extensions["drafts"].store.due(older_than=float("inf")).count(file_id) == 0
+
+    assert client.delete(path, headers=headers).get_json()["discarded"] is True
+    assert client.put(f"/api/student/mark_review/{file_id}", headers=headers).status_code == 200
+
+
+def test_flush_due_keeps_conflicting_draft(draft_file):
+    file_id, headers = draft_file
+    assert _draft(file_id, headers, {"family_background": {"diabetes": True}}).status_code == 202
+    _concurrent_write(file_id)
+    buffer = app.extensions["drafts"]
+    with app.app_context():
+        buffer.flush_seconds, seconds = 0, buffer.flush_seconds
+        try:
+            buffer.flush_due()
+        finally:
+            buffer.flush_seconds = seconds
+        assert buffer.pending(file_id)["conflict"] is True
+    assert _family(file_id) == (2, None)
+
+
+def test_drafts_only_for_files_being_edited(make_file):
+    f = make_file(file_status=FileStatus.review)
+    rv = _draft(f.id, f.headers(), {"family_background": {"diabetes": True}})
+    assert rv.status_code == 409 and rv.get_json()["file_status"] == "review"
+    assert app.test_client().get(f"/api/medical_file/{f.id}/backgrounds/draft",
+                                 headers=f.headers()).get_json()["changes"] == {}
+
+
+class IncompleteStore(DraftStore):
+    def merge(self, key, changes, now, keep_existing=False, base_version=None, conflict=False):
+        return None
+
+
+def test_incomplete_pluggable_store_fails_at_setup(monkeypatch):
+    monkeypatch.setenv("DRAFT_STORE", f"{__name__}:IncompleteStore")
+    with pytest.raises(TypeError):
+        setup_drafts(app)
+    monkeypatch.setenv("DRAFT_STORE", f"{__name__}:_draft")
+    with pytest.raises(TypeError):
+        setup_drafts(app)
@@ -0,0 +1,64 @@
+import pytest
+
+from app import app
+from api.models import db, User, UserRole, FileStatus
+
+
+@pytest.fixture
+def ctx(make_file):
+    f = make_file(users={"other": UserRole.patient}, file_status=FileStatus.progress)
+    return {"file": f.id, "ids": f.ids, "tokens": f.tokens}
+
+
+def _get(path, token, etag=None):
+    headers = {"Authorization": f"Bearer {token}"}
+    if etag:
+        headers["If-None-Match"] = etag
+    return app.test_client().get(path, headers=headers)
+
+
+def test_unchanged_list_returns_304_without_running_the_view(ctx, count_queries):
+    first = _get("/api/student/assigned_patients", ctx["tokens"]["student"])
+    assert first.status_code == 200 and first.headers["ETag"].startswith('W/"')
+
+    with count_queries() as q:
+        again = _get("/api/student/assigned_patients", ctx["tokens"]["student"], first.headers["ETag"])
+    assert again.status_code == 304
+    assert again.get_data() == b""
+    # Rol del usuario + marcador agregado; nada de joins ni serialización
+    assert len([s for s in q.statements if s.startswith("SELECT")]) == 2, q.statements
+
+
+def test_writes_to_backgrounds_change_the_etag(ctx):
+    path = f"/api/medical_file/{ctx['file']}"
+    etag = _get(path, ctx["tokens"]["student"]).headers["ETag"]
+    list_etag = _get("/api/student/assigned_patients", ctx["tokens"]["student"]).headers["ETag"]
+
+    rv = app.test_client().post("/api/backgrounds/save", json={
+        "medical_file_id": ctx["file"], "family_background": {"diabetes": True}},
+        headers={"Authorization": f"Bearer {ctx['tokens']['student']}"})
+    assert rv.status_code == 200
+
+    changed = _get(path, ctx["tokens"]["student"], etag)
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert changed.get_json()["medical_file"]["family_background"]["diabetes"] is True
+    assert _get("/api/student/assigned_patients", ctx["tokens"]["student"], list_etag).status_code == 200
+
+
+def test_patient_changes_shown_with_the_file_change_the_etag(ctx):
+    path = f"/api/medical_file/{ctx['file']}"
+    etag = _get(path, ctx["tokens"]["student"]).headers["ETag"]
+    with app.app_context():
+        db.session.get(User, ctx["ids"]["patient"]).first_name = "Renombrado"
+        db.session.commit()
+
+    changed = _get(path, ctx["tokens"]["student"], etag)
+    assert changed.status_code == 200 and changed.headers["ETag"] != etag
+    assert changed.get_json()["user"]["first_name"] == "Renombrado"
+
+
+def test_foreign_resource_is_not_revalidated(ctx):
+    path = f"/api/patient/snapshots/{ctx['file']}"
+    etag = _get(path, ctx["tokens"]["patient"]).headers["ETag"]
+    assert _get(path, ctx["tokens"]["patient"], etag).status_code == 304
+    assert _get(path, ctx["tokens"]["other"], etag).status_code == 403
@@ -0,0 +1,16 @@
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import IntegrityError
+
+import api.instrumentation  # noqa: F401  (registra los hooks de Engine)
+
+
+def test_failed_statements_do_not_leak_start_times():
+    engine = create_engine("sqlite://")
+    with engine.connect() as conn:
+        conn.execute(text("CREATE TABLE t (id INTEGER PRIMARY KEY)"))
+        conn.execute(text("INSERT INTO t VALUES (1)"))
+        for _ in range(3):
+            with pytest.raises(IntegrityError):
+                conn.execute(text("INSERT INTO t VALUES (1)"))
+        assert not conn.info.get("query_start")
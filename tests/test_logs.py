@@ -0,0 +1,48 @@
+import json
+import logging
+import sys
+
+from flask import Flask, jsonify
+
+from api.logs import JsonFormatter, RequestContextFilter, _StructuredQueueHandler, setup_logging
+
+
+def _app():
+    app = Flask(__name__)
+    setup_logging(app)
+
+    @app.route('/api/items/<int:item_id>', methods=['GET', 'PUT'])
+    def item(item_id):
+        return jsonify({"id": item_id})
+
+    return app
+
+
+def test_request_id_is_propagated_or_generated():
+    client = _app().test_client()
+    assert client.get('/api/items/1', headers={"X-Request-ID": "req-42"}).headers["X-Request-ID"] == "req-42"
+    assert len(client.get('/api/items/1').headers["X-Request-ID"]) == 32
+
+
+def test_json_record_keeps_context_and_fields_through_the_queue():
+    app = _app()
+    handler = _StructuredQueueHandler(None)
+    with app.test_request_context('/api/items/7', method='PUT'):
+        app.preprocess_request()
+        record = logging.LogRecord("api.routes", logging.WARNING, __file__, 1, "guardado %s", ("ok",), None)
+        record.fields = {"bytes": 8}
+        RequestContextFilter().filter(record)
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            record.exc_info = sys.exc_info()
+        prepared = handler.prepare(record)
+
+    payload = json.loads(JsonFormatter().format(prepared))
+    assert payload["msg"] == "guardado ok"
+    assert payload["level"] == "WARNING"
+    assert payload["method"] == "PUT"
+    assert payload["route"] == "/api/items/<int:item_id>"
+    assert payload["request_id"]
+    assert payload["bytes"] == 8
+    assert "ValueError: boom" in payload["exc"]
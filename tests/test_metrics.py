@@ -0,0 +1,79 @@
+import json
+import os
+
+import pytest
+from flask import Flask, jsonify
+
+from api.metrics import setup_metrics
+
+
+@pytest.fixture
+def metrics_app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(METRICS_ENABLED=True, METRICS_DIR=str(tmp_path), METRICS_FLUSH_SECONDS=0,
+                      METRICS_TOKEN=None, METRICS_REQUIRE_TOKEN=False)
+    registry = setup_metrics(app)
+
+    @app.route('/api/items/<int:item_id>')
+    def item(item_id):
+        if item_id == 0:
+            return jsonify({"error": "no"}), 404
+        return jsonify({"id": item_id})
+
+    return app, registry, tmp_path
+
+
+def _sample(text, line_prefix):
+    for line in text.splitlines():
+        if line.startswith(line_prefix):
+            return float(line.rsplit(" ", 1)[1])
+    raise AssertionError(f"{line_prefix} no está en /metrics")
+
+
+def test_per_route_counters_and_histograms(metrics_app):
+    app, _, _ = metrics_app
+    client = app.test_client()
+    client.get('/api/items/1')
+    client.get('/api/items/2')
+    client.get('/api/items/0')
+    client.get('/nope')
+
+    text = client.get('/metrics').get_data(as_text=True)
+    route = 'method="GET",route="/api/items/<int:item_id>"'
+    assert _sample(text, f'http_requests_total{{{route},status="200"}}') == 2
+    assert _sample(text, f'http_requests_total{{{route},status="404"}}') == 1
+    assert _sample(text, f'http_requests_total{{method="GET",route="<unmatched>",status="404"}}') == 1
+    assert _sample(text, f'http_request_duration_seconds_count{{{route}}}') == 3
+    assert _sample(text, f'http_request_duration_seconds_bucket{{{route},le="+Inf"}}') == 3
+    assert _sample(text, f'http_response_size_bytes_sum{{{route}}}') > 0
+    assert "# TYPE http_request_db_seconds histogram" in text
+
+
+def test_workers_are_aggregated_from_shared_dir(metrics_app):
+    app, registry, metrics_dir = metrics_app
+    client = app.test_client()
+    client.get('/api/items/1')
+
+    # Volcado de otro worker con el mismo endpoint
+    other = registry.snapshot()
+    (metrics_dir / "metrics_999999.json").write_text(json.dumps(other))
+    assert (metrics_dir / f"metrics_{os.getpid()}.json").exists()
+
+    client.get('/api/items/1')
+    text = client.get('/metrics').get_data(as_text=True)
+    assert _sample(text, 'http_requests_total{method="GET",route="/api/items/<int:item_id>",status="200"}') == 3
+
+
+def test_metrics_token(metrics_app):
+    app, _, _ = metrics_app
+    app.config["METRICS_TOKEN"] = "s3cret"
+    client = app.test_client()
+    assert client.get('/metrics').status_code == 401
+    assert client.get('/metrics', headers={"Authorization": "Bearer s3cret"}).status_code == 200
+
+
+def test_metrics_need_a_token_outside_development():
+    app = Flask(__name__)
+    app.config.update(METRICS_ENABLED=True, METRICS_TOKEN=None, METRICS_REQUIRE_TOKEN=True)
+    assert setup_metrics(app) is None
+    assert app.test_client().get('/metrics').status_code == 404
@@ -0,0 +1,82 @@
+import time
+from datetime import date
+
+import pytest
+from flask import Flask, jsonify
+from flask_jwt_extended import JWTManager, create_access_token
+
+from api.models import db, User, UserRole
+from api.profiling import setup_profiling
+
+
+def busy_review_files():
+    time.sleep(0.05)
+    return [1, 2, 3]
+
+
+@pytest.fixture
+def profiled_app(tmp_path):
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=f"sqlite:///{tmp_path / 'profiling.db'}",
+        JWT_SECRET_KEY="test-profiling-secret-key-0123456789abcdef",
+        PROFILE_DIR=str(tmp_path / "profiles"),
+        PROFILE_SAMPLE_RATE=0,
+        PROFILE_INTERVAL_MS=1,
+    )
+    JWTManager(app)
+    db.init_app(app)
+    setup_profiling(app)
+
+    @app.route('/api/professional/review_files')
+    def review_files():
+        return jsonify(busy_review_files())
+
+    with app.app_context():
+        db.create_all()
+        for uid, role in ((1, UserRole.admin), (2, UserRole.patient)):
+            db.session.add(User(id=uid, first_name="P", first_surname=role.value, birth_day=date(1990, 1, 1),
+                                email=f"{role.value}@profiling.test", password="x", role=role))
+        db.session.commit()
+        tokens = {uid: create_access_token(identity=str(uid)) for uid in (1, 2)}
+    return app, tokens, tmp_path / "profiles"
+
+
+def _profiles(directory):
+    return sorted(directory.rglob("*.collapsed")) if directory.exists() else []
+
+
+def test_disabled_by_default(profiled_app):
+    app, tokens, profiles = profiled_app
+    client = app.test_client()
+    client.get('/api/professional/review_files')
+    # Cabecera sin JWT de admin: se ignora
+    rv = client.get('/api/professional/review_files',
+                    headers={"X-Profile": "1", "Authorization": f"Bearer {tokens[2]}"})
+    assert "X-Profile-File" not in rv.headers
+    assert _profiles(profiles) == []
+
+
+def test_admin_header_writes_collapsed_stacks(profiled_app):
+    app, tokens, profiles = profiled_app
+    rv = app.test_client().get('/api/professional/review_files',
+                               headers={"X-Profile": "1", "Authorization": f"Bearer {tokens[1]}"})
+    assert rv.status_code == 200
+    written = _profiles(profiles)
+    assert len(written) == 1
+    assert rv.headers["X-Profile-File"] == f"GET_api_professional_review_files/{written[0].name}"
+    content = written[0].read_text()
+    assert "busy_review_files (test_profiling.py:" in content
+    for line in content.splitlines():
+        stack, count = line.rsplit(" ", 1)
+        assert int(count) > 0 and ";" in stack
+
+
+def test_sample_rate_and_retention(profiled_app):
+    app, _, profiles = profiled_app
+    app.config.update(PROFILE_SAMPLE_RATE=1.0, PROFILE_KEEP=2)
+    client = app.test_client()
+    for _ in range(3):
+        rv = client.get('/api/professional/review_files')
+        assert "X-Profile-File" not in rv.headers
+    assert len(_profiles(profiles)) == 2
@@ -0,0 +1,277 @@
+"""
+Regresión de N+1: cada endpoint del blueprint `api` debe ejecutar el mismo
+número de sentencias SQL con un dataset de tamaño 1 que con uno de tamaño 50.
+
+Cada dataset tiene su propio admin/profesional/estudiante; las listas que
+crecen con N (solicitudes, pacientes asignados, expedientes en revisión,
+snapshots) dependen de ellos. Los endpoints de escritura usan objetos
+dedicados para que el orden de los casos no altere los conteos.
+"""
+
+import string
+import uuid
+from datetime import date, datetime, timezone
+
+import pytest
+from flask_jwt_extended import create_access_token
+from werkzeug.security import generate_password_hash
+
+from app import app
+from api.search import search_clinical, search_users
+from api.models import (
+    db, User, ProfessionalStudentData, MedicalFile, MedicalFileSnapshot,
+    NonPathologicalBackground, PathologicalBackground, FamilyBackground,
+    GynecologicalBackground, UserRole, UserStatus, FileStatus, BACKGROUND_SECTIONS,
+)
+
+SIZES = (1, 50)
+PASSWORD = "secret123"
+
+
+def _build_dataset(n, password_hash):
+    tag = uuid.uuid4().hex[:6]
+    now = datetime.now(timezone.utc)
+    seq = iter(range(10**6))
+
+    def user(role, status=UserStatus.approved):
+        u = User(first_name="Q", first_surname=role.value, birth_day=date(1990, 1, 1),
+                 email=f"q{tag}{next(seq)}@t.t", password=password_hash, role=role, status=status)
+        db.session.add(u)
+        return u
+
+    def academic(u, **kwargs):
+        db.session.add(ProfessionalStudentData(
+            user=u, institution="Uni", career="Medicina", register_number=f"Q{tag}{next(seq)}", **kwargs))
+
+    def patient(**file_kwargs):
+        u = user(UserRole.patient)
+        f = MedicalFile(user=u, **file_kwargs)
+        db.session.add(f)
+        return u, f
+
+    admin = user(UserRole.admin)
+    prof = user(UserRole.professional)
+    academic(prof, validated_by=admin, validated_at=now)
+    student = user(UserRole.student)
+    academic(student, requested_professional=prof, validated_by=prof, validated_at=now)
+
+    # Listas que crecen con N
+    for _ in range(n):
+        academic(user(UserRole.student, UserStatus.pre_approved), requested_professional=prof, requested_at=now)
+        patient(patient_requested_student=student, patient_requested_student_at=now)
+
+    files = []
+    for i in range(n):
+        u, f = patient(file_status=FileStatus.review, selected_student=student)
+        f.non_pathological_background = NonPathologicalBackground(blood_type="O+")
+        f.pathological_background = PathologicalBackground(allergies="polen")
+        f.family_background = FamilyBackground(diabetes=True)
+        f.gynecological_background = GynecologicalBackground(pregnancies=0)
+        for _ in range(n if i == 0 else 1):
+            f.snapshots.append(MedicalFileSnapshot(url=f"/api/uploads/q{tag}.png", uploaded_by=student))
+        files.append((u, f))
+
+    # Objetos dedicados a los endpoints de escritura
+    pending_prof = user(UserRole.professional, UserStatus.pre_approved)
+    academic(pending_prof)
+    lone_student = user(UserRole.student, UserStatus.pre_approved)
+    academic(lone_student)
+    approve_student = user(UserRole.student, UserStatus.pre_approved)
+    academic(approve_student, requested_professional=prof, requested_at=now)
+    cancel_student = user(UserRole.student, UserStatus.pre_approved)
+    academic(cancel_student, requested_professional=prof, requested_at=now)
+    new_patient, new_file = patient()
+    approve_patient, _ = patient(patient_requested_student=student, patient_requested_student_at=now)
+    cancel_patient, _ = patient(patient_requested_student=student, patient_requested_student_at=now)
+    _, approved_request = patient(patient_requested_student=student, patient_requested_student_at=now,
+                                  student_validated_patient=student, student_validated_patient_at=now)
+    _, work_file = patient(file_status=FileStatus.progress, selected_student=student)
+    # Sigue en edición aunque mark_review mueva work_file a revisión
+    _, draft_file = patient(file_status=FileStatus.progress, selected_student=student)
+
+    db.session.commit()
+    people = {
+        "admin": admin, "prof": prof, "student": student, "patient": files[0][0],
+        "lone_student": lone_student, "approve_student": approve_student,
+        "cancel_student": cancel_student, "new_patient": new_patient,
+        "cancel_patient": cancel_patient,
+    }
+    return {
+        "tag": tag,
+        "admin_email": admin.email,
+        "tokens": {name: create_access_token(identity=str(u.id)) for name, u in people.items()},
+        "ids": {
+            "prof": prof.id, "student": student.id, "pending_prof": pending_prof.id,
+            "approve_student": approve_student.id, "approve_patient": approve_patient.id,
+            "file": files[0][1].id, "new_file": new_file.id, "work_file": work_file.id,
+            "approved_request": approved_request.id, "draft_file": draft_file.id,
+        },
+    }
+
+
+@pytest.fixture(scope="module")
+def datasets():
+    with app.app_context():
+        password_hash = generate_password_hash(PASSWORD)
+        # la detección de FTS5 se hace una vez por proceso
+        search_users("warm")
+        search_clinical("warm")
+        return {n: _build_dataset(n, password_hash) for n in SIZES}
+
+
+# (nombre, método, ruta, token, json, status esperado); las rutas se formatean con ids
+CASES = [
+    ("serve_upload", "GET", "/api/uploads/missing.png", None, None, 404),
+    ("private_student", "GET", "/api/private", "student", None, 200),
+    ("private_patient", "GET", "/api/private", "patient", None, 200),
+    ("users", "GET", "/api/users", "admin", None, 200),
+    ("db_pool", "GET", "/api/health/db_pool", "admin", None, 200),
+    ("cache_health", "GET", "/api/health/cache", "admin", None, 200),
+    ("stats", "GET", "/api/stats", "admin", None, 200),
+    ("search", "GET", "/api/search?q=stud&role=student", "prof", None, 200),
+    ("search_clinical", "GET", "/api/search/clinical?q=polen", "prof", None, 200),
+    ("patient_requests", "GET", "/api/student/patient_requests", "student", None, 200),
+    ("student_requests", "GET", "/api/professional/student_requests", "prof", None, 200),
+    ("professional_request_status", "GET", "/api/student/professional_request_status", "approve_student", None, 200),
+    ("medical_file", "GET", "/api/medical_file/{file}", "student", None, 200),
+    ("assigned_patients", "GET", "/api/student/assigned_patients", "student", None, 200),
+    ("review_files", "GET", "/api/professional/review_files", "prof", None, 200),
+    ("professional_snapshots", "GET", "/api/professional/snapshots/{file}", "prof", None, 200),
+    ("patient_snapshots", "GET", "/api/patient/snapshots/{file}", "patient", None, 200),
+    ("student_request_status", "GET", "/api/patient/student_request_status", "cancel_patient", None, 200),
+    ("dashboard_student", "GET", "/api/dashboard", "student", None, 200),
+    ("dashboard_prof", "GET", "/api/dashboard", "prof", None, 200),
+    ("dashboard_patient", "GET", "/api/dashboard", "patient", None, 200),
+    ("dashboard_admin", "GET", "/api/dashboard", "admin", None, 200),
+    ("register", "POST", "/api/register", None, "register", 201),
+    ("login", "POST", "/api/login", None, "login", 200),
+    ("validate_professional", "POST", "/api/validate_professional/{pending_prof}", "admin", None, 200),
+    ("request_student_validation", "POST", "/api/request_student_validation/{prof}", "lone_student", None, 200),
+    ("validate_student", "PUT", "/api/professional/validate_student/{approve_student}", "prof", {"action": "approve"}, 200),
+    ("cancel_professional_request", "DELETE", "/api/student/cancel_professional_request", "cancel_student", None, 200),
+    ("patient_request_student", "POST", "/api/patient/request_student_validation/{student}", "new_patient", None, 200),
+    ("validate_patient", "PUT", "/api/student/validate_patient/{approve_patient}", "student", {"action": "approve"}, 200),
+    ("cancel_student_request", "DELETE", "/api/patient/cancel_student_request", "cancel_patient", None, 200),
+    ("save_backgrounds", "POST", "/api/backgrounds/save", "student", "save_backgrounds", 200),
+    ("mark_review", "PUT", "/api/student/mark_review/{work_file}", "student", None, 200),
+    ("upload_snapshot", "POST", "/api/upload_snapshot/{work_file}", "student", {"snapshot_url": "https://img.test/s.png"}, 200),
+    ("review_file", "PUT", "/api/professional/review_file/{work_file}", "prof", {"action": "approve"}, 200),
+    ("create_backgrounds", "POST", "/api/backgrounds", "student", "create_backgrounds", 201),
+    ("confirm_file", "PUT", "/api/patient/confirm_file/{file}", "patient", {"action": "confirm"}, 200),
+    ("patch_backgrounds", "PATCH", "/api/medical_file/{file}/backgrounds", "student", "patch_backgrounds", 200),
+    ("backgrounds_draft", "PUT", "/api/medical_file/{draft_file}/backgrounds/draft", "student", "patch_backgrounds", 202),
+]
+
+
+def _payload(kind, ctx):
+    ids = ctx["ids"]
+    if kind == "register":
+        return {"first_name": "Q", "first_surname": "Reg", "birth_day": "1990-01-01", "role": "patient",
+                "email": f"q{ctx['tag']}reg@t.t", "password": PASSWORD}
+    if kind == "login":
+        return {"email": ctx["admin_email"], "password": PASSWORD}
+    if kind == "save_backgrounds":
+        return {"medical_file_id": ids["file"], "non_pathological_background": {"hobbies": "leer"}}
+    if kind == "patch_backgrounds":
+        return {"family_background": {"cancer": True}, "gynecological_background": {"births": 1}}
+    if kind == "create_backgrounds":
+        return {"medical_file_id": ids["new_file"], "family_background": {"diabetes": True}}
+    return kind
+
+
+def test_every_route_is_covered():
+    adapter = app.url_map.bind("localhost")
+    covered = set()
+    for _, method, path, *_ in CASES:
+        fields = {field: 1 for _, field, _, _ in string.Formatter().parse(path) if field}
+        covered.add(adapter.match(path.format(**fields).split("?")[0], method)[0])
+    endpoints = {r.endpoint for r in app.url_map.iter_rules() if r.endpoint.startswith("api.")}
+    assert not endpoints - covered, f"Endpoints sin caso en CASES: {sorted(endpoints - covered)}"
+
+
+@pytest.mark.parametrize("name,method,path,token,body,expected", CASES, ids=[c[0] for c in CASES])
+def test_query_count_does_not_grow_with_data(datasets, count_queries, name, method, path, token, body, expected):
+    client = app.test_client()
+    counts = {}
+    for n, ctx in datasets.items():
+        headers = {"X-MOCK-CLOUDINARY-URL": "https://img.test/s.png"} if name == "upload_snapshot" else {}
+        if token:
+            headers["Authorization"] = f"Bearer {ctx['tokens'][token]}"
+        with count_queries() as q:
+            rv = client.open(path.format(**ctx["ids"]), method=method, headers=headers,
+                             json=_payload(body, ctx))
+        assert rv.status_code == expected, (n, rv.get_data(as_text=True))
+        counts[n] = q
+
+    small, large = (counts[n] for n in SIZES)
+    assert small.count == large.count, (
+        f"{name}: {small.count} sentencias con N={SIZES[0]} vs {large.count} con N={SIZES[1]}\n"
+        + "\n".join(large.statements))
+
+
+def test_users_listing_does_not_grow(datasets, count_queries):
+    """/users lista toda la tabla: se mide antes y después de agregar N usuarios."""
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {datasets[SIZES[0]]['tokens']['admin']}"}
+
+    def measure():
+        with count_queries() as q:
+            assert client.get("/api/users", headers=headers).status_code == 200
+        return q
+
+    before = measure()
+    with app.app_context():
+        _build_dataset(SIZES[-1], "x")
+    after = measure()
+    assert before.count == after.count, "\n".join(after.statements)
+
+
+@pytest.mark.parametrize("token,sections", [
+    ("student", {"patient_requests": "/api/student/patient_requests",
+                 "assigned_patients": "/api/student/assigned_patients"}),
+    ("prof", {"student_requests": "/api/professional/student_requests",
+              "review_files": "/api/professional/review_files"}),
+    ("patient", {"snapshots": "/api/patient/snapshots/{file}"}),
+])
+def test_dashboard_matches_individual_endpoints(datasets, token, sections):
+    ctx = datasets[SIZES[1]]
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {ctx['tokens'][token]}"}
+    dashboard = client.get("/api/dashboard", headers=headers).get_json()
+    assert dashboard["user"] == client.get("/api/private", headers=headers).get_json()["user"]
+    for key, path in sections.items():
+        assert dashboard[key] == client.get(path.format(**ctx["ids"]), headers=headers).get_json(), key
+
+
+def test_patient_requests_report_approved_requests(datasets):
+    ctx = datasets[SIZES[0]]
+    rv = app.test_client().get("/api/student/patient_requests",
+                               headers={"Authorization": f"Bearer {ctx['tokens']['student']}"})
+    approved = {r["medicalFileId"]: r["approved"] for r in rv.get_json()}
+    assert approved[ctx["ids"]["approved_request"]] is True
+
+
+def test_medical_file_loads_in_one_select(datasets, count_queries):
+    """Expediente + paciente + antecedentes en un SELECT (más el del ETag), con la misma forma que serialize()."""
+    ctx = datasets[SIZES[1]]
+    file_id = ctx["ids"]["file"]
+    app.extensions["cache"].clear()
+    with count_queries() as q:
+        rv = app.test_client().get(f"/api/medical_file/{file_id}",
+                                   headers={"Authorization": f"Bearer {ctx['tokens']['student']}"})
+    assert rv.status_code == 200
+    selects = [s for s in q.statements if s.lstrip().upper().startswith("SELECT")]
+    assert len(selects) == 2, "\n".join(selects)
+
+    body = rv.get_json()
+    with app.app_context():
+        medical_file = db.session.get(MedicalFile, file_id)
+        assert body["medical_file"] == medical_file.serialize()
+        assert body["user"] == {
+            "id": medical_file.user.id, "first_name": medical_file.user.first_name,
+            "second_name": medical_file.user.second_name, "first_surname": medical_file.user.first_surname,
+            "second_surname": medical_file.user.second_surname,
+            "birth_day": medical_file.user.birth_day.isoformat(), "email": medical_file.user.email,
+            "phone": medical_file.user.phone,
+        }
+    assert all(body["medical_file"][name]["medical_file_id"] == file_id for name in BACKGROUND_SECTIONS)
@@ -0,0 +1,81 @@
+from datetime import date
+
+import pytest
+from flask import Flask, jsonify
+from flask_jwt_extended import JWTManager, create_access_token, jwt_required
+from sqlalchemy import create_engine, insert
+
+from api.database import configure_replica, sticky_writes
+from api.models import db, User, UserRole
+
+
+@pytest.fixture
+def routed_app(tmp_path):
+    """App mínima con primario y réplica SQLite distinguibles por first_name."""
+    primary = f"sqlite:///{tmp_path / 'primary.db'}"
+    replica = f"sqlite:///{tmp_path / 'replica.db'}"
+    for url, name in ((primary, "primary"), (replica, "replica")):
+        engine = create_engine(url)
+        db.metadata.create_all(engine)
+        with engine.begin() as conn:
+            conn.execute(insert(User.__table__).values(
+                id=1, first_name=name, first_surname="Routing", birth_day=date(1990, 1, 1),
+                email="routing@example.test", password="x", role=UserRole.patient.name,
+                status="approved"))
+        engine.dispose()
+
+    app = Flask(__name__)
+    app.config.update(
+        SQLALCHEMY_DATABASE_URI=primary,
+        SQLALCHEMY_BINDS={"replica": replica},
+        JWT_SECRET_KEY="test-replica-routing-secret-key-0123456789",
+        REPLICA_STICKY_SECONDS=60,
+    )
+    JWTManager(app)
+    configure_replica(app)
+    db.init_app(app)
+
+    @app.route('/read')
+    @jwt_required()
+    def read():
+        return jsonify(db.session.get(User, 1).first_name)
+
+    @app.route('/write', methods=['POST'])
+    @jwt_required()
+    def write():
+        user = db.session.get(User, 1)
+        user.phone = "555"
+        db.session.commit()
+        return jsonify(db.session.get(User, 1).first_name)
+
+    sticky_writes.clear()
+    yield app
+    sticky_writes.clear()
+
+
+def _auth(app, identity):
+    with app.app_context():
+        return {"Authorization": f"Bearer {create_access_token(identity=identity)}"}
+
+
+def test_reads_go_to_replica_and_writes_to_primary(routed_app):
+    client = routed_app.test_client()
+    headers = _auth(routed_app, "7")
+
+    assert client.get('/read', headers=headers).get_json() == "replica"
+    assert client.post('/write', headers=headers).get_json() == "primary"
+
+
+def test_writer_reads_primary_during_sticky_window(routed_app):
+    client = routed_app.test_client()
+    writer = _auth(routed_app, "7")
+    other = _auth(routed_app, "8")
+
+    client.post('/write', headers=writer)
+    assert client.get('/read', headers=writer).get_json() == "primary"
+    assert client.get('/read', headers=other).get_json() == "replica"
+
+    routed_app.config["REPLICA_STICKY_SECONDS"] = 0
+    sticky_writes.clear()
+    client.post('/write', headers=writer)
+    assert client.get('/read', headers=writer).get_json() == "replica"
@@ -0,0 +1,148 @@
+import uuid
+from datetime import date
+
+import pytest
+from flask_jwt_extended import create_access_token
+
+from app import app
+from api.models import (
+    db, User, ProfessionalStudentData, MedicalFile, PathologicalBackground, ClinicalSearchEntry,
+    UserRole, UserStatus,
+)
+
+
+@pytest.fixture
+def people():
+    tag = uuid.uuid4().hex[:6]
+    with app.app_context():
+        def user(first, surname, role, email=None):
+            u = User(first_name=first, first_surname=surname, birth_day=date(1990, 1, 1),
+                     email=email or f"{first.lower()}{tag}@t.t", password="x", role=role, status=UserStatus.approved)
+            db.session.add(u)
+            return u
+
+        prof = user("Zoe", f"Búsqueda{tag}", UserRole.professional)
+        db.session.add(ProfessionalStudentData(user=prof, institution="Uni", career="Medicina",
+                                               register_number=f"RN-{tag}"))
+        patient = user("Ramón", f"Búsqueda{tag}", UserRole.patient)
+        other = user("Búsqueda", f"Otro{tag}", UserRole.patient, email=f"busqueda{tag}@t.t")
+        db.session.commit()
+        ids = {"prof": prof.id, "patient": patient.id, "other": other.id}
+        tokens = {name: create_access_token(identity=str(i)) for name, i in ids.items()}
+        return tag, ids, tokens
+
+
+def _search(token, **params):
+    return app.test_client().get("/api/search", query_string=params,
+                                 headers={"Authorization": f"Bearer {token}"})
+
+
+def test_prefix_diacritics_and_ranking(people):
+    tag, ids, tokens = people
+    rv = _search(tokens["prof"], q=f"busqueda{tag}")
+    assert rv.status_code == 200, rv.get_data(as_text=True)
+    body = rv.get_json()
+    assert body["engine"] == "fts5"
+    assert {r["id"] for r in body["results"]} == {ids["prof"], ids["patient"], ids["other"]}
+
+    # Todas las palabras deben coincidir; "ramo" es prefijo de "Ramón"
+    rv = _search(tokens["prof"], q=f"ramo búsqueda{tag[:3]}")
+    assert [r["id"] for r in rv.get_json()["results"]] == [ids["patient"]]
+
+    # El nombre y el email coinciden: más relevante que sólo el email
+    rv = _search(tokens["prof"], q=f"busqueda otro{tag}")
+    assert [r["id"] for r in rv.get_json()["results"]] == [ids["other"]]
+
+
+def test_register_number_role_filter_and_limit(people):
+    tag, ids, tokens = people
+    results = _search(tokens["prof"], q=f"rn-{tag}").get_json()["results"]
+    assert [(r["id"], r["register_number"]) for r in results] == [(ids["prof"], f"RN-{tag}")]
+
+    results = _search(tokens["prof"], q=f"búsqueda{tag}", role="patient").get_json()["results"]
+    assert {r["id"] for r in results} == {ids["patient"], ids["other"]}
+
+    assert _search(tokens["prof"], q=f"búsqueda{tag}", limit=1).get_json()["count"] == 1
+
+
+def test_invalid_queries_and_roles(people):
+    tag, ids, tokens = people
+    assert _search(tokens["prof"], q="a").status_code == 400
+    assert _search(tokens["prof"], q="ana", role="nadie").status_code == 400
+    assert _search(tokens["prof"], q='"*) OR').get_json()["results"] == []
+    assert _search(tokens["patient"], q=f"búsqueda{tag}").status_code == 403
+
+
+@pytest.fixture
+def clinical(make_file):
+    files = [make_file(users={"admin": UserRole.admin, "prof": UserRole.professional, "other": UserRole.student}),
+             make_file(), make_file()]
+    first = files[0]
+    tag, student, other = first.tag, first.ids["student"], first.ids["other"]
+    with app.app_context():
+        db.session.add(ProfessionalStudentData(user_id=student, institution="Uni", career="Medicina",
+                                               register_number=f"C{tag}", validated_by_id=first.ids["prof"]))
+        for f, owner, allergies in zip(files, (student, student, other),
+                                       (f"Penicilina{tag}", f"penicilina{tag} y polen", f"Penicilina{tag}")):
+            medical_file = db.session.get(MedicalFile, f.id)
+            medical_file.selected_student_id = owner
+            medical_file.pathological_background = PathologicalBackground(
+                allergies=allergies, current_medications="Ninguno")
+        db.session.commit()
+    return tag, [f.id for f in files], first.tokens
+
+
+def _clinical(token, **params):
+    return app.test_client().get("/api/search/clinical", query_string=params,
+                                 headers={"Authorization": f"Bearer {token}"})
+
+
+def test_clinical_search_is_scoped_by_role(clinical):
+    tag, files, tokens = clinical
+
+    def found(who):
+        return [r["medical_file_id"] for r in _clinical(tokens[who], q=f"penicilina{tag}").get_json()["results"]]
+
+    assert sorted(found("student")) == files[:2]
+    assert found("other") == [files[2]]
+    assert sorted(found("prof")) == files[:2]
+    assert sorted(found("admin")) == files
+    assert _clinical(tokens["patient"], q=f"penicilina{tag}").status_code == 403
+
+    body = _clinical(tokens["student"], q="penici polen").get_json()
+    assert body["engine"] == "fts5" and [r["medical_file_id"] for r in body["results"]] == [files[1]]
+    assert "[polen]" in body["results"][0]["snippet"]
+
+
+def test_clinical_search_pagination(clinical):
+    tag, files, tokens = clinical
+    first = _clinical(tokens["admin"], q=f"penicilina{tag}", per_page=2).get_json()
+    second = _clinical(tokens["admin"], q=f"penicilina{tag}", per_page=2, page=2).get_json()
+    assert (first["count"], first["has_more"], second["count"], second["has_more"]) == (2, True, 1, False)
+    ids = [r["medical_file_id"] for r in first["results"] + second["results"]]
+    assert sorted(ids) == files
+    assert _clinical(tokens["admin"], q="x").status_code == 400
+    assert _clinical(tokens["admin"], q="penicilina", page="uno").status_code == 400
+
+
+def test_clinical_index_follows_writes_in_both_storages(clinical, monkeypatch):
+    tag, files, tokens = clinical
+    headers = {"Authorization": f"Bearer {tokens['student']}"}
+    for storage in ("tables", "document"):
+        monkeypatch.setitem(app.config, "BACKGROUNDS_STORAGE", storage)
+        rv = app.test_client().patch(f"/api/medical_file/{files[0]}/backgrounds", headers=headers, json={
+            "pathological_background": {"allergies": f"Sulfas{storage}{tag}"}})
+        assert rv.status_code == 200, rv.get_data(as_text=True)
+        results = _clinical(tokens["student"], q=f"sulfas{storage}{tag}").get_json()["results"]
+        assert [r["medical_file_id"] for r in results] == [files[0]]
+    assert [r["medical_file_id"] for r in _clinical(tokens["student"], q=f"penicilina{tag}").get_json()["results"]] \
+        == [files[1]]
+
+    # search-index reconstruye el índice desde los antecedentes
+    with app.app_context():
+        db.session.query(ClinicalSearchEntry).filter(ClinicalSearchEntry.medical_file_id.in_(files)).delete()
+        db.session.commit()
+    assert _clinical(tokens["admin"], q=f"penicilina{tag}").get_json()["count"] == 0
+    result = app.test_cli_runner().invoke(args=["search-index"])
+    assert result.exit_code == 0, result.output
+    assert _clinical(tokens["admin"], q=f"penicilina{tag}").get_json()["count"] == 2
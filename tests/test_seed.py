@@ -0,0 +1,27 @@
+import uuid
+
+from app import app
+from api.models import db, MedicalFile, User
+from api.seed import seed_dataset
+
+
+def _timestamps(result):
+    file_ids = [fid for _, fid in result["patients"]]
+    rows = db.session.execute(
+        db.select(MedicalFile.progressed_at, MedicalFile.reviewed_at, MedicalFile.approved_at,
+                  MedicalFile.confirmed_at, MedicalFile.updated_at)
+        .where(MedicalFile.id.in_(file_ids)).order_by(MedicalFile.id)).all()
+    names = db.session.scalars(
+        db.select(User.first_name).where(User.id.in_([uid for uid, _ in result["patients"]]))
+        .order_by(User.id)).all()
+    return [tuple(r) for r in rows], names
+
+
+def test_same_seed_same_dataset():
+    tag = uuid.uuid4().hex[:8]
+    with app.app_context():
+        first = _timestamps(seed_dataset(admins=1, professionals=1, students=2, patients=8,
+                                         seed=7, prefix=f"a{tag}"))
+        second = _timestamps(seed_dataset(admins=1, professionals=1, students=2, patients=8,
+                                          seed=7, prefix=f"b{tag}"))
+    assert first == second
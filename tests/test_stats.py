@@ -0,0 +1,90 @@
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app import app
+from api import database
+from api.models import db, ProfessionalStudentData, MedicalFile, StatsCounter, UserRole, UserStatus, FileStatus
+from api.stats import apply_deltas, live_counters, stored_counters
+
+
+@pytest.fixture
+def people(make_file):
+    f = make_file(users={"admin": UserRole.admin, "prof": UserRole.professional,
+                         "student": (UserRole.student, UserStatus.pre_approved)},
+                  file_status=FileStatus.progress)
+    with app.app_context():
+        db.session.add(ProfessionalStudentData(user_id=f.ids["student"], institution="Uni", career="Medicina",
+                                               register_number=f"S{f.tag}", requested_professional_id=f.ids["prof"]))
+        db.session.commit()
+    return f.tag, {**f.ids, "file": f.id}, f.tokens
+
+
+def _stats(token):
+    return app.test_client().get("/api/stats", headers={"Authorization": f"Bearer {token}"})
+
+
+def test_live_stats(people):
+    tag, ids, tokens = people
+    assert _stats(tokens["prof"]).status_code == 403
+    with app.app_context():
+        old = db.session.get(MedicalFile, ids["file"])
+        old.file_status = FileStatus.review
+        old.reviewed_at = datetime.now(timezone.utc) - timedelta(days=400)
+        db.session.commit()
+
+    body = _stats(tokens["admin"]).get_json()
+    assert body["source"] == "live"
+    assert set(body["files_by_status"]) == {s.value for s in FileStatus}
+    assert body["files_by_status"]["review"] == body["review_backlog"]["count"] >= 1
+    assert body["review_backlog"]["by_age"]["over_7d"] >= 1
+    assert body["review_backlog"]["oldest_age_hours"] >= 400 * 24
+    assert body["users"]["student"]["pre_approved"] >= 1
+
+
+def test_materialized_counters_follow_writes(people, monkeypatch):
+    tag, ids, tokens = people
+    monkeypatch.setitem(app.config, "STATS_MATERIALIZED", True)
+    result = app.test_cli_runner().invoke(args=["stats-rebuild"])
+    assert result.exit_code == 0, result.output
+
+    client = app.test_client()
+    # ORM: alta de paciente con expediente, estudiante aprobado (rol/estado y validated_by)
+    assert client.post("/api/register", json={
+        "first_name": "N", "first_surname": "Stats", "birth_day": "1990-01-01", "role": "patient",
+        "email": f"new{tag}@t.t", "password": "secret123"}).status_code == 201
+    assert client.put(f"/api/professional/validate_student/{ids['student']}", json={"action": "approve"},
+                      headers={"Authorization": f"Bearer {tokens['prof']}"}).status_code == 200
+    # Core: create_backgrounds pasa el expediente a review con un UPDATE directo
+    assert client.post("/api/backgrounds", json={"medical_file_id": ids["file"], "family_background": {}},
+                       headers={"Authorization": f"Bearer {tokens['student']}"}).status_code == 201
+    # Una transacción sin commit no cuenta
+    with app.app_context():
+        db.session.get(MedicalFile, ids["file"]).file_status = FileStatus.approved
+        db.session.flush()
+        db.session.rollback()
+
+    with app.app_context():
+        stored = stored_counters()
+        assert stored == {k: v for k, v in live_counters().items() if v}
+        assert stored[f"professional_students:{ids['prof']}"] == 1
+
+    body = _stats(tokens["admin"]).get_json()
+    assert body["source"] == "materialized"
+    assert body["students_per_professional"][0]["students"] >= 1
+    assert {"professional_id": ids["prof"], "full_name": "prof Test", "students": 1} \
+        in body["students_per_professional"]
+
+
+def test_counter_upsert_without_on_conflict(monkeypatch):
+    # Dialectos sin ON CONFLICT: UPDATE y, si no existía la fila, INSERT
+    monkeypatch.setattr(database, "UPSERT_INSERTS", {})
+    name = f"fallback:{uuid.uuid4().hex[:6]}"
+    with app.app_context():
+        apply_deltas({name: 2})
+        apply_deltas({name: 3})
+        db.session.commit()
+        assert db.session.get(StatsCounter, name).value == 5
+        db.session.delete(db.session.get(StatsCounter, name))
+        db.session.commit()
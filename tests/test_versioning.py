@@ -0,0 +1,114 @@
+import pytest
+from sqlalchemy import event, update
+
+from app import app
+from api.database import RoutingSession
+from api.models import db, MedicalFile, UserRole, FileStatus
+
+
+@pytest.fixture
+def progress_file(make_file):
+    f = make_file(users={"professional": UserRole.professional}, file_status=FileStatus.progress)
+    return f.id, f.tokens
+
+
+def _state(file_id):
+    with app.app_context():
+        medical_file = db.session.get(MedicalFile, file_id)
+        backgrounds = {"family": medical_file.family_background,
+                       "non_pathological": medical_file.non_pathological_background}
+        return medical_file.version, medical_file.updated_at, {
+            k: (b.version, b.updated_at) if b else None for k, b in backgrounds.items()}
+
+
+def test_every_write_path_bumps_version_and_updated_at(progress_file):
+    file_id, tokens = progress_file
+    client = app.test_client()
+
+    def call(method, path, token, body):
+        rv = client.open(path, method=method, json=body, headers={
+            "Authorization": f"Bearer {tokens[token]}",
+            "X-MOCK-CLOUDINARY-URL": "https://img.test/v.png"})
+        assert rv.status_code in (200, 201), rv.get_data(as_text=True)
+
+    steps = [
+        ("POST", "/api/backgrounds", "student",
+         {"medical_file_id": file_id, "non_pathological_background": {"blood_type": "O+"}}),
+        ("POST", "/api/backgrounds/save", "student",
+         {"medical_file_id": file_id, "family_background": {"diabetes": True}}),
+        ("POST", "/api/backgrounds/save", "student",
+         {"medical_file_id": file_id, "family_background": {"diabetes": False}}),
+        ("POST", f"/api/upload_snapshot/{file_id}", "student", {"snapshot_url": "https://img.test/v.png"}),
+        ("PUT", f"/api/professional/review_file/{file_id}", "professional", {"action": "approve"}),
+        ("PUT", f"/api/patient/confirm_file/{file_id}", "patient", {"action": "confirm"}),
+    ]
+    version, updated_at, backgrounds = _state(file_id)
+    assert version == 1
+    for method, path, token, body in steps:
+        call(method, path, token, body)
+        new_version, new_updated_at, new_backgrounds = _state(file_id)
+        assert new_version > version, path
+        assert new_updated_at >= updated_at, path
+        version, updated_at = new_version, new_updated_at
+        if path == "/api/backgrounds/save" and backgrounds["family"]:
+            # Editar un antecedente versiona también la fila del antecedente
+            assert new_backgrounds["family"][0] == backgrounds["family"][0] + 1
+        backgrounds = new_backgrounds
+
+    assert backgrounds["non_pathological"] is not None and backgrounds["non_pathological"][0] >= 1
+
+
+def test_stale_if_match_is_rejected_with_409(progress_file):
+    file_id, tokens = progress_file
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {tokens['student']}"}
+    body = {"medical_file_id": file_id, "family_background": {"diabetes": True}}
+
+    saved = client.post("/api/backgrounds/save", json=body, headers={**headers, "If-Match": '"1"'})
+    assert saved.status_code == 200 and saved.get_json()["version"] == 2
+
+    # Segunda pestaña que todavía tiene la versión 1
+    stale = client.post("/api/backgrounds/save", json={**body, "version": 1}, headers=headers)
+    assert stale.status_code == 409
+    assert stale.get_json()["current_version"] == 2
+    assert client.put(f"/api/student/mark_review/{file_id}", headers={**headers, "If-Match": '"1"'}).status_code == 409
+    assert client.put(f"/api/student/mark_review/{file_id}", headers={**headers, "If-Match": '"x"'}).status_code == 400
+    assert _state(file_id)[0] == 2
+
+
+def test_medical_file_etag_is_the_strong_version_used_by_if_match(progress_file):
+    file_id, tokens = progress_file
+    client = app.test_client()
+    headers = {"Authorization": f"Bearer {tokens['student']}"}
+    body = {"medical_file_id": file_id, "family_background": {"diabetes": True}}
+
+    read = client.get(f"/api/medical_file/{file_id}", headers=headers)
+    assert read.headers["ETag"] == '"1"'
+    assert client.get(f"/api/medical_file/{file_id}",
+                      headers={**headers, "If-None-Match": read.headers["ETag"]}).status_code == 304
+
+    # Un ETag débil nunca coincide en comparación fuerte
+    weak = client.post("/api/backgrounds/save", json=body, headers={**headers, "If-Match": 'W/"1"'})
+    assert weak.status_code == 400
+    saved = client.post("/api/backgrounds/save", json=body, headers={**headers, "If-Match": read.headers["ETag"]})
+    assert saved.status_code == 200
+    assert client.get(f"/api/medical_file/{file_id}", headers=headers).headers["ETag"] == '"2"'
+
+
+def test_write_racing_between_check_and_commit_returns_409(progress_file):
+    file_id, tokens = progress_file
+
+    def concurrent_writer(session, flush_context, instances):
+        # Otra sesión confirma un cambio justo antes de nuestro UPDATE
+        session.connection().execute(
+            update(MedicalFile.__table__).where(MedicalFile.__table__.c.id == file_id)
+            .values(version=MedicalFile.__table__.c.version + 1))
+
+    event.listen(RoutingSession, "before_flush", concurrent_writer)
+    try:
+        rv = app.test_client().put(f"/api/student/mark_review/{file_id}",
+                                   headers={"Authorization": f"Bearer {tokens['student']}", "If-Match": '"1"'})
+    finally:
+        event.remove(RoutingSession, "before_flush", concurrent_writer)
+    assert rv.status_code == 409, rv.get_data(as_text=True)
+    assert _state(file_id)[0] == 1